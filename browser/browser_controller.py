@@ -10,6 +10,36 @@ import random
 import string
 import json
 import platform
+import logging
+from urllib.parse import urlparse
+from browser.stream_detector import wait_for_media_url
+
+logger = logging.getLogger(__name__)
+
+# 找到页面中面积最大的可见video元素，返回其视口坐标以及窗口在屏幕上的位置信息
+VIDEO_RECT_SCRIPT = """
+let best = null, bestArea = 0;
+for (const video of document.querySelectorAll('video')) {
+    const r = video.getBoundingClientRect();
+    const left = Math.max(r.left, 0), top = Math.max(r.top, 0);
+    const right = Math.min(r.right, window.innerWidth), bottom = Math.min(r.bottom, window.innerHeight);
+    const area = Math.max(right - left, 0) * Math.max(bottom - top, 0);
+    if (area > bestArea) {
+        best = {left: left, top: top, width: right - left, height: bottom - top};
+        bestArea = area;
+    }
+}
+if (!best) return null;
+const borderX = Math.max((window.outerWidth - window.innerWidth) / 2, 0);
+return {
+    rect: best,
+    screenX: window.screenX,
+    screenY: window.screenY,
+    borderX: borderX,
+    chromeTop: Math.max(window.outerHeight - window.innerHeight - borderX, 0),
+    dpr: window.devicePixelRatio || 1
+};
+"""
 
 def get_monitor_geometry(monitor_index=0):
     try:
@@ -34,6 +64,92 @@ def random_user_agent():
     platform_info = "Windows NT 10.0; Win64; x64" if platform.system() == "Windows" else "X11; Linux x86_64"
     return f"Mozilla/5.0 ({platform_info}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{chrome_version} Safari/537.36"
 
+# 页面就绪条件的轮询间隔和各阶段超时（秒）
+READY_POLL_INTERVAL = 0.1
+DOCUMENT_READY_TIMEOUT = 15
+VIDEO_READY_TIMEOUT = 20
+PLAYING_TIMEOUT = 10
+KEY_EFFECT_TIMEOUT = 3
+# 整个页面就绪过程（等待播放加上各按键生效）的总时长上限，各阶段的超时不会累加超过它
+PAGE_READY_TIMEOUT = 20
+
+# 页面中面积最大的video元素的播放状态，以及全屏和视口尺寸
+VIDEO_STATE_SCRIPT = """
+let best = null, bestArea = 0;
+for (const video of document.querySelectorAll('video')) {
+    const area = video.clientWidth * video.clientHeight;
+    if (!best || area > bestArea) {
+        best = video;
+        bestArea = area;
+    }
+}
+const state = {
+    fullscreen: !!document.fullscreenElement,
+    innerWidth: window.innerWidth,
+    innerHeight: window.innerHeight,
+};
+if (best) {
+    Object.assign(state, {
+        readyState: best.readyState,
+        currentTime: best.currentTime,
+        paused: best.paused,
+        muted: best.muted,
+        area: bestArea,
+    });
+}
+return state;
+"""
+
+# 等待两次渲染帧，用于没有可观察状态变化的按键
+# arguments[0] 为超时毫秒数：后台标签页中 requestAnimationFrame 可能一直不触发，
+# 脚本自行超时返回，不依赖驱动的脚本超时（默认30秒）
+NEXT_FRAME_SCRIPT = """
+const done = arguments[arguments.length - 1];
+const timer = setTimeout(() => done(false), arguments[0]);
+requestAnimationFrame(() => requestAnimationFrame(() => { clearTimeout(timer); done(true); }));
+"""
+
+
+def fullscreen_changed(before, after):
+    """播放器进入全屏：Fullscreen API状态变化，或网页全屏使播放器面积变大"""
+    return after.get('fullscreen') != before.get('fullscreen') or after.get('area', 0) > before.get('area', 0)
+
+
+def viewport_changed(before, after):
+    return (after.get('innerWidth'), after.get('innerHeight')) != (before.get('innerWidth'), before.get('innerHeight'))
+
+
+# 预连接直播页所在的源：dns-prefetch/preconnect提示加上一次no-cors请求，
+# 请求过的连接会留在连接池中，比单纯的preconnect保持得更久
+PRECONNECT_SCRIPT = """
+const origin = arguments[0];
+for (const rel of ['dns-prefetch', 'preconnect']) {
+    const link = document.createElement('link');
+    link.rel = rel;
+    link.href = origin;
+    (document.head || document.documentElement).appendChild(link);
+}
+fetch(origin, {mode: 'no-cors', credentials: 'include', cache: 'no-store'}).catch(() => {});
+return true;
+"""
+
+# 直播间下播后常见的提示文字
+STREAM_ENDED_KEYWORDS = ['直播已结束', '直播结束了', '主播已下播', '暂未开播', '主播正在休息', '主播暂时离开']
+
+STREAM_ENDED_SCRIPT = """
+const keywords = arguments[0];
+const videos = Array.from(document.querySelectorAll('video'));
+if (!videos.length) return 'no_video';
+const video = videos.reduce((a, b) => (a.clientWidth * a.clientHeight >= b.clientWidth * b.clientHeight ? a : b));
+if (video.error) return 'video_error';
+if (video.ended) return 'video_ended';
+const text = document.body ? document.body.innerText : '';
+for (const keyword of keywords) {
+    if (text.includes(keyword)) return keyword;
+}
+return null;
+"""
+
 class BrowserController:
     def __init__(self, silent_mode=False):
         self.driver = None
@@ -49,11 +165,11 @@ class BrowserController:
         # 在用户目录下创建专门的文件夹保存浏览器数据
         self.user_data_dir = os.path.join(appdata_dir, 'WebVideoRecorder', 'chrome_profile')
         os.makedirs(self.user_data_dir, exist_ok=True)
+        self.stage_timings = {}
+        # 页面就绪过程的总截止时间，open_live_page 期间有效
+        self.ready_deadline = None
 
-    def open_live_page(self, url, monitor_index=None, fullscreen=True, unmute=True, browser_fullscreen=False, bilibili_fullscreen=False, custom_key1_enabled=False, custom_key1="", custom_key2_enabled=False, custom_key2=""):
-        if monitor_index is not None:
-            self.monitor_index = monitor_index
-            
+    def build_options(self):
         options = Options()
         if self.silent_mode:
             options.add_argument('--headless=new')  # 使用新的headless模式
@@ -93,27 +209,158 @@ class BrowserController:
         }
         options.add_experimental_option("prefs", prefs)
         
-        # 创建WebDriver
+        # 开启性能日志，用于从网络请求中发现直播流地址
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        # DOM就绪即返回，直播页的长连接资源不会拖住页面加载；之后由就绪条件判断播放器状态
+        options.page_load_strategy = 'eager'
+        return options
+
+    def get_window_geometry(self, display=None):
+        """浏览器窗口应占据的区域：指定显示器或分配的虚拟显示器"""
+        if display:
+            return 0, 0, display['width'], display['height']
+        return get_monitor_geometry(self.monitor_index)
+
+    def launch(self, monitor_index=None, display=None):
+        """
+        启动浏览器并移动到目标显示器，不加载页面
+
+        预热时提前调用，开播时 open_live_page 直接使用已启动的浏览器。
+        """
+        if monitor_index is not None:
+            self.monitor_index = monitor_index
+        options = self.build_options()
         try:
-            self.driver = webdriver.Chrome(options=options)
+            if display:
+                # 在分配的虚拟显示器上启动浏览器，声音输出到该显示器对应的音频设备
+                self.driver = webdriver.Chrome(options=options, service=Service(env=display['env']))
+            else:
+                self.driver = webdriver.Chrome(options=options)
             
             # 使用JavaScript修改webdriver属性，进一步规避检测
             self.driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
             self.driver.execute_script("window.navigator.chrome = {runtime: {}}")
             self.driver.execute_script("Object.defineProperty(navigator, 'languages', {get: () => ['zh-CN', 'zh', 'en-US', 'en']})")
             
-            # 如果不是静默模式，将浏览器窗口移动到指定显示器
+            # 如果不是静默模式，先让浏览器窗口加载到指定显示器（或分配的虚拟显示器）
             if not self.silent_mode:
-                # 获取指定显示器的位置和尺寸
-                x, y, width, height = get_monitor_geometry(self.monitor_index)
-                
-                # 先让浏览器窗口加载到指定位置
+                x, y, width, height = self.get_window_geometry(display)
                 self.driver.set_window_position(x, y)
                 self.driver.set_window_size(width, height)
+        except Exception:
+            self.quit_driver()
+            raise
+
+    def preconnect(self, url):
+        """提前完成直播页所在域名的DNS解析和TLS握手，开播时加载页面可复用连接"""
+        if not self.driver:
+            return False
+        parsed = urlparse(url)
+        if not parsed.scheme or not parsed.netloc:
+            return False
+        try:
+            self.driver.execute_script(PRECONNECT_SCRIPT, f"{parsed.scheme}://{parsed.netloc}")
+            return True
+        except Exception:
+            return False
+
+    def quit_driver(self):
+        """直接结束浏览器，不做页面上的恢复操作"""
+        try:
+            if self.driver:
+                self.driver.quit()
+        except Exception:
+            pass
+        self.driver = None
+
+    def wait_until(self, stage, condition, timeout):
+        """
+        轮询等待页面条件成立，记录该阶段的耗时；超时记录为None并继续后续步骤
+
+        条件执行脚本出错（页面跳转中等）视为尚未满足。超过总截止时间后只检查一次。
+        """
+        started = time.time()
+        timeout = self.cap_timeout(timeout)
+        while True:
+            try:
+                if condition():
+                    self.stage_timings[stage] = round(time.time() - started, 3)
+                    return True
+            except Exception:
+                pass
+            if time.time() - started >= timeout:
+                self.stage_timings[stage] = None
+                logger.warning(f"等待页面阶段 {stage} 超时（{timeout}秒）")
+                return False
+            time.sleep(READY_POLL_INTERVAL)
+
+    def cap_timeout(self, timeout):
+        """把单个阶段的超时限制在页面就绪的总截止时间内"""
+        if self.ready_deadline is None:
+            return timeout
+        return min(timeout, max(self.ready_deadline - time.time(), 0))
+
+    def get_video_state(self):
+        return self.driver.execute_script(VIDEO_STATE_SCRIPT)
+
+    def wait_for_playback(self):
+        """等待页面可用：DOM就绪、video元素可播放、播放时间在前进"""
+        self.wait_until('document_ready',
+                        lambda: self.driver.execute_script("return document.readyState") != 'loading',
+                        DOCUMENT_READY_TIMEOUT)
+        if not self.wait_until('video_ready',
+                               lambda: (self.get_video_state() or {}).get('readyState', 0) >= 3,
+                               VIDEO_READY_TIMEOUT):
+            return False
+        first = self.get_video_state() or {}
+        return self.wait_until('playing',
+                               lambda: (self.get_video_state() or {}).get('currentTime', 0) > first.get('currentTime', 0),
+                               PLAYING_TIMEOUT)
+
+    def press_key_and_wait(self, stage, key, changed, done=None):
+        """
+        按键后等待页面状态变化
+
+        changed(before, after) 比较按键前后的播放器状态；没有可观察的变化时等待两帧渲染。
+        done(state) 判断页面是否已处于目标状态，已处于时不按键（切换类按键再按一次会恢复原状）。
+        """
+        try:
+            before = self.get_video_state() or {}
+        except Exception:
+            before = {}
+        if done and done(before):
+            self.stage_timings[stage] = 0
+            return True
+        self.press_key(key)
+        if changed is None:
+            timeout = self.cap_timeout(KEY_EFFECT_TIMEOUT)
+            return self.wait_until(
+                stage, lambda: self.driver.execute_async_script(NEXT_FRAME_SCRIPT, int(timeout * 1000)), timeout)
+        return self.wait_until(stage, lambda: changed(before, self.get_video_state() or {}), KEY_EFFECT_TIMEOUT)
+
+    def open_live_page(self, url, monitor_index=None, display=None, fullscreen=True, unmute=True, browser_fullscreen=False, bilibili_fullscreen=False, custom_key1_enabled=False, custom_key1="", custom_key2_enabled=False, custom_key2=""):
+        if monitor_index is not None:
+            self.monitor_index = monitor_index
+        # 各阶段的实际耗时（秒），超时的阶段为None
+        self.stage_timings = {}
+        self.ready_deadline = None
+            
+        try:
+            # 已预热的浏览器直接使用，否则现在启动
+            if not self.driver:
+                launch_started = time.time()
+                self.launch(display=display)
+                self.stage_timings['launch'] = round(time.time() - launch_started, 3)
+            # 从加载页面起计算就绪过程的总时长
+            self.ready_deadline = time.time() + PAGE_READY_TIMEOUT
+            
+            # 如果不是静默模式，将浏览器窗口移动到指定显示器
+            if not self.silent_mode:
+                # 获取指定显示器（或分配的虚拟显示器）的位置和尺寸
+                x, y, width, height = self.get_window_geometry(display)
                 
                 # 然后再加载URL，确保在正确的显示器上打开
                 self.driver.get(url)
-                time.sleep(5)  # 延长等待时间，确保网页完全加载
                 
                 # 再次确认窗口位置和大小，因为页面加载可能会改变窗口
                 self.driver.set_window_position(x, y)
@@ -121,55 +368,124 @@ class BrowserController:
                 # 最大化窗口（在指定显示器内）
                 self.driver.maximize_window()
                 
-                # 根据用户设置执行按键操作
-                time.sleep(2)  # 额外等待，确保页面元素完全加载
+                # 播放器开始播放后再执行按键操作
+                self.wait_for_playback()
                 
-                # 按H键实现全屏显示（如果启用）
+                # 按H键实现全屏显示（如果启用），等待播放器放大
                 if fullscreen:
-                    self.press_key('h')
+                    self.press_key_and_wait('fullscreen', 'h', fullscreen_changed)
                     
-                # 按P键取消静音（如果启用）
+                # 按P键取消静音（如果启用），等待video取消静音；已经有声音时不按键
                 if unmute:
-                    time.sleep(1)  # 先等待一秒，确保全屏切换完成
-                    self.press_key('p')
+                    self.press_key_and_wait('unmute', 'p', lambda before, after: after.get('muted') is False,
+                                            done=lambda state: state.get('muted') is False)
                     
-                # 按F11键实现浏览器全屏（如果启用）
+                # 按F11键实现浏览器全屏（如果启用），等待视口尺寸变化
                 if browser_fullscreen:
-                    time.sleep(1)  # 等待前面的操作完成
-                    self.press_key(Keys.F11)
+                    self.press_key_and_wait('browser_fullscreen', Keys.F11, viewport_changed)
                     
                 # 按F键实现B站全屏（如果启用）
                 if bilibili_fullscreen:
-                    time.sleep(1)  # 等待前面的操作完成
-                    self.press_key('f')
+                    self.press_key_and_wait('bilibili_fullscreen', 'f', fullscreen_changed)
                     
                 # 按自定义按键1（如果启用且有设置）
                 if custom_key1_enabled and custom_key1:
-                    time.sleep(1)  # 等待前面的操作完成
-                    self.press_key(custom_key1)
+                    self.press_key_and_wait('custom_key1', custom_key1, None)
                     
                 # 按自定义按键2（如果启用且有设置）
                 if custom_key2_enabled and custom_key2:
-                    time.sleep(1)  # 等待前面的操作完成
-                    self.press_key(custom_key2)
+                    self.press_key_and_wait('custom_key2', custom_key2, None)
             else:
                 # 静默模式
                 self.driver.get(url)
-                
-            time.sleep(3)  # 等待操作完成
+                self.wait_for_playback()
+            logger.info(f"页面就绪各阶段耗时: {self.stage_timings}")
             
         except Exception as e:
             print(f"启动浏览器时出错: {e}")
             import traceback
             traceback.print_exc()
             # 如果启动失败，尝试关闭可能已经启动的浏览器
-            try:
-                if self.driver:
-                    self.driver.quit()
-            except:
-                pass
-            self.driver = None
+            self.quit_driver()
             raise
+        finally:
+            self.ready_deadline = None
+
+    def find_live_stream(self, timeout=20):
+        """从页面加载的网络请求中找到直播流地址，并附带拉流所需的请求头"""
+        if not self.driver:
+            return None
+        media = wait_for_media_url(self.driver, timeout=timeout)
+        if not media:
+            return None
+        headers = {'Referer': self.driver.current_url}
+        try:
+            cookies = '; '.join(f"{c['name']}={c['value']}" for c in self.driver.get_cookies())
+            if cookies:
+                headers['Cookie'] = cookies
+            user_agent = self.driver.execute_script('return navigator.userAgent')
+        except Exception:
+            user_agent = ''
+        return {
+            'url': media['url'],
+            'kind': media['kind'],
+            'user_agent': user_agent,
+            'headers': headers,
+        }
+
+    def get_video_rect(self):
+        """
+        获取播放器画面在屏幕上的区域 (x, y, 宽, 高)，单位为物理像素
+
+        视口坐标加上窗口位置和浏览器边框/工具栏高度换算为屏幕坐标，
+        宽高取偶数以满足yuv420p编码要求。找不到video元素时返回None。
+        """
+        if not self.driver:
+            return None
+        try:
+            info = self.driver.execute_script(VIDEO_RECT_SCRIPT)
+        except Exception:
+            return None
+        if not info:
+            return None
+        rect, dpr = info['rect'], info['dpr']
+        x = int((info['screenX'] + info['borderX'] + rect['left']) * dpr)
+        y = int((info['screenY'] + info['chromeTop'] + rect['top']) * dpr)
+        width = int(rect['width'] * dpr) // 2 * 2
+        height = int(rect['height'] * dpr) // 2 * 2
+        if width < 2 or height < 2:
+            return None
+        return x, y, width, height
+
+    def check_stream_ended(self):
+        """
+        页面侧的直播结束检查，返回结束原因，未结束或无法判断时返回None
+
+        依据：页面没有video元素、播放器报错或已播放结束、页面出现下播提示文字。
+        """
+        if not self.driver:
+            return None
+        try:
+            return self.driver.execute_script(STREAM_ENDED_SCRIPT, STREAM_ENDED_KEYWORDS)
+        except Exception:
+            return None
+
+    def get_process_ids(self):
+        """浏览器驱动进程ID，Chrome主进程和渲染进程都是它的子进程"""
+        try:
+            return [self.driver.service.process.pid]
+        except Exception:
+            return []
+
+    def minimize(self):
+        """最小化浏览器窗口：仅录音频时不需要画面，最小化后Chrome暂停渲染以节省CPU/GPU"""
+        if not self.driver:
+            return False
+        try:
+            self.driver.minimize_window()
+            return True
+        except Exception:
+            return False
 
     def press_key(self, key):
         """发送单个按键"""
@@ -178,7 +494,6 @@ class BrowserController:
         try:
             actions = ActionChains(self.driver)
             actions.send_keys(key).perform()
-            time.sleep(0.5)  # 短暂等待按键生效
             return True
         except Exception:
             return False
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import logging
+from threading import Thread, Lock, Event
+from browser.browser_controller import browser_controller_instance
+
+WARMUP_SECONDS = 60         # 默认提前启动浏览器的秒数
+PRECONNECT_INTERVAL = 30    # 预热期间重复预连接的间隔（秒），保持连接不被回收
+MAX_IDLE_SECONDS = 15 * 60  # 预热后长时间未被使用则关闭
+TAKE_TIMEOUT = 30           # 开播时等待仍在启动中的预热浏览器的最长时间（秒）
+
+logger = logging.getLogger(__name__)
+
+
+def get_latency_log_path():
+    appdata_dir = os.environ.get('APPDATA', '') or os.path.expanduser('~')
+    return os.path.join(appdata_dir, 'WebVideoRecorder', 'start_latency.jsonl')
+
+
+class StartLatency:
+    """
+    一次录制从计划时间到捕获第一帧的各阶段耗时
+
+    各阶段记录为相对触发时刻的秒数，计划时间到触发时刻的偏差单独记录。
+    """
+
+    def __init__(self, scheduled_at=None, warm=False):
+        self.triggered_at = time.time()
+        self.scheduled_at = scheduled_at
+        self.warm = warm
+        self.stages = {}
+        # 页面就绪各阶段（文档就绪、视频可播放、开始播放、全屏等）各自的耗时
+        self.page_stages = {}
+        self.written = False
+
+    def mark(self, stage, at=None):
+        self.stages[stage] = round((at or time.time()) - self.triggered_at, 3)
+
+    def info(self):
+        return {
+            'triggered_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.triggered_at)),
+            'trigger_delay': round(self.triggered_at - self.scheduled_at, 3) if self.scheduled_at else None,
+            'warm': self.warm,
+            'stages': dict(self.stages),
+            'page_stages': dict(self.page_stages),
+        }
+
+    def save(self, session_id=None):
+        """追加写入启动耗时日志，每次录制只写一次"""
+        if self.written:
+            return
+        self.written = True
+        record = dict(self.info(), session_id=session_id)
+        logger.info(f"录制启动耗时: {record}")
+        try:
+            path = get_latency_log_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.warning(f"保存录制启动耗时失败: {e}")
+
+
+class BrowserPool:
+    """
+    浏览器预热池
+
+    在计划开播前提前启动Chrome、移动到目标显示器并预连接直播页所在域名，
+    开播时把已就绪的浏览器交给录制流程，省去启动浏览器的时间。
+    浏览器配置目录同一时间只能被一个Chrome使用，因此只保留一个预热实例。
+    """
+
+    def __init__(self, controller=browser_controller_instance):
+        self.controller = controller
+        self.lock = Lock()
+        self.key = None
+        self.url = None
+        self.thread = None
+        self.ready = Event()
+        self.cancel_event = Event()
+        # 预热实例不再使用（取消、超时或与本次录制不一致）时置位，由预热线程退出前关闭浏览器
+        self.discard = False
+        self.warmed_at = None
+        self.metrics = {}
+
+    def warm_up(self, url, monitor_index=0, silent_mode=False):
+        """后台启动并预热浏览器；浏览器已在使用中时跳过"""
+        with self.lock:
+            previous = self.thread if self.thread and self.thread.is_alive() and self.key is None else None
+        if previous:
+            # 上一个预热实例已取消、仍在关闭，等待其结束（由调度线程调用，不阻塞界面）
+            previous.join(TAKE_TIMEOUT)
+        with self.lock:
+            if self.controller.driver or (self.thread and self.thread.is_alive()):
+                return False
+            self.key = (monitor_index, silent_mode)
+            self.url = url
+            self.ready.clear()
+            self.cancel_event.clear()
+            self.discard = False
+            self.metrics = {}
+            self.thread = Thread(target=self._run, args=(url, monitor_index, silent_mode), daemon=True)
+            self.thread.start()
+        return True
+
+    def _run(self, url, monitor_index, silent_mode):
+        started = time.time()
+        try:
+            self.controller.silent_mode = silent_mode
+            self.controller.launch(monitor_index=monitor_index)
+            self.metrics['launch_seconds'] = round(time.time() - started, 3)
+            preconnect_started = time.time()
+            self.controller.preconnect(url)
+            self.metrics['preconnect_seconds'] = round(time.time() - preconnect_started, 3)
+        except Exception as e:
+            logger.error(f"预热浏览器失败: {e}")
+            self.ready.set()
+            self.close_if_discarded()
+            return
+        self.warmed_at = time.time()
+        self.ready.set()
+        logger.info(f"浏览器已预热: {self.metrics}")
+
+        # 等待开播期间定期预连接，超过最长空闲时间仍未使用则关闭；
+        # 预连接在锁内进行，取用时等待其结束，不会与主线程同时操作浏览器
+        while not self.cancel_event.wait(PRECONNECT_INTERVAL):
+            with self.lock:
+                if self.cancel_event.is_set():
+                    break
+                if time.time() - self.warmed_at > MAX_IDLE_SECONDS:
+                    logger.info("预热的浏览器长时间未使用，关闭")
+                    self.key = None
+                    self.discard = True
+                    break
+                self.controller.preconnect(url)
+        self.close_if_discarded()
+
+    def close_if_discarded(self):
+        with self.lock:
+            discard = self.discard
+        if discard:
+            self.controller.quit_driver()
+
+    def take(self, url, monitor_index=0, silent_mode=False, timeout=TAKE_TIMEOUT):
+        """
+        开播时取用预热的浏览器，返回是否可用
+
+        仍在启动中时最多等待 timeout 秒；显示器或模式不一致时关闭预热实例，
+        由调用方重新启动浏览器。返回前等待预热线程退出，此后浏览器只由调用方操作。
+        """
+        with self.lock:
+            thread, key = self.thread, self.key
+        if thread is None:
+            return False
+        if key is None:
+            # 已取消的预热实例可能仍在关闭，等待其结束，避免与本次录制同时使用浏览器配置目录
+            thread.join(timeout)
+            return False
+        self.ready.wait(timeout)
+        with self.lock:
+            self.cancel_event.set()
+            self.key = None
+            warm = bool(self.controller.driver) and key == (monitor_index, silent_mode)
+            self.discard = not warm
+            if self.controller.driver and not warm:
+                logger.info("预热的浏览器与本次录制的显示器或模式不一致，重新启动")
+        thread.join(timeout)
+        if warm and url != self.url:
+            self.controller.preconnect(url)
+        return warm
+
+    def cancel(self, wait=False):
+        """
+        取消预热（任务被删除或改期），立即返回，由预热线程关闭尚未使用的浏览器
+
+        wait 为True时等待浏览器关闭，用于随后要在同一配置目录启动浏览器或程序退出的场合。
+        """
+        with self.lock:
+            thread = self.thread
+            if self.key is not None:
+                self.key = None
+                self.discard = True
+                self.cancel_event.set()
+        if wait and thread:
+            thread.join(TAKE_TIMEOUT)
+
+
+browser_pool = BrowserPool()
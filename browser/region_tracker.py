@@ -0,0 +1,58 @@
+import time
+from threading import Thread
+
+# 区域变化小于该像素数时视为抖动，不触发重新捕获
+RECT_TOLERANCE = 4
+
+
+def rect_changed(old, new, tolerance=RECT_TOLERANCE):
+    if old is None or new is None:
+        return old != new
+    return any(abs(a - b) > tolerance for a, b in zip(old, new))
+
+
+class RegionTracker:
+    """
+    定时检查播放器画面区域，布局变化稳定后通过回调通知录制端
+
+    连续两次检查得到相同的新区域才认为布局已稳定，避免页面动画过程中反复重启捕获。
+    """
+
+    def __init__(self, browser, callback, initial_rect=None, interval=5):
+        self.browser = browser
+        self.callback = callback
+        self.rect = initial_rect
+        self.interval = interval  # 单位：秒
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        candidate = None
+        while self.running:
+            time.sleep(self.interval)
+            rect = self.browser.get_video_rect()
+            if not rect or not rect_changed(self.rect, rect):
+                candidate = None
+                continue
+            if candidate and not rect_changed(candidate, rect):
+                self.rect = rect
+                candidate = None
+                try:
+                    self.callback(rect)
+                except Exception:
+                    pass
+            else:
+                candidate = rect
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1)
+            self.thread = None
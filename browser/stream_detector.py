@@ -0,0 +1,72 @@
+import re
+import json
+import time
+
+# 直播流地址特征：HLS播放列表或FLV流
+MEDIA_URL_PATTERN = re.compile(r'\.(m3u8|flv)(\?|$)', re.IGNORECASE)
+MEDIA_MIME_TYPES = {
+    'application/vnd.apple.mpegurl': 'hls',
+    'application/x-mpegurl': 'hls',
+    'audio/mpegurl': 'hls',
+    'video/x-flv': 'flv',
+    'video/flv': 'flv',
+}
+
+
+def classify_media_url(url, mime_type=''):
+    """判断请求是否为直播流，返回 'hls' / 'flv' / None"""
+    if not url or url.startswith(('data:', 'blob:')):
+        return None
+    kind = MEDIA_MIME_TYPES.get((mime_type or '').split(';')[0].strip().lower())
+    if kind:
+        return kind
+    match = MEDIA_URL_PATTERN.search(url)
+    if match:
+        return 'hls' if match.group(1).lower() == 'm3u8' else 'flv'
+    return None
+
+
+def extract_media_urls(performance_logs):
+    """
+    从Chrome性能日志中提取直播流地址
+
+    日志条目为 driver.get_log('performance') 的返回值，message字段是CDP事件的JSON。
+    返回按出现顺序去重的 [{'url', 'kind', 'headers'}] 列表。
+    """
+    found = {}
+    for entry in performance_logs:
+        try:
+            message = json.loads(entry['message'])['message']
+        except (KeyError, TypeError, ValueError):
+            continue
+        method = message.get('method')
+        params = message.get('params', {})
+        if method == 'Network.requestWillBeSent':
+            request = params.get('request', {})
+            url = request.get('url', '')
+            kind = classify_media_url(url)
+            if kind and url not in found:
+                found[url] = {'url': url, 'kind': kind, 'headers': request.get('headers', {})}
+        elif method == 'Network.responseReceived':
+            response = params.get('response', {})
+            url = response.get('url', '')
+            kind = classify_media_url(url, response.get('mimeType', ''))
+            if kind and url not in found:
+                found[url] = {'url': url, 'kind': kind, 'headers': response.get('requestHeaders', {})}
+    return list(found.values())
+
+
+def wait_for_media_url(driver, timeout=20, interval=1):
+    """轮询浏览器性能日志，直到发现直播流地址或超时"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urls = extract_media_urls(driver.get_log('performance'))
+        except Exception:
+            urls = []
+        if urls:
+            # HLS与FLV同时存在时优先FLV，FLV通常是单一连续流，延迟更低
+            urls.sort(key=lambda item: 0 if item['kind'] == 'flv' else 1)
+            return urls[0]
+        time.sleep(interval)
+    return None
@@ -20,6 +20,57 @@ def get_default_config():
         "audio_device": "无音频",
         "framerate": "15",
         "record_quality": "中",
+        "capture_mode": "screen",
+        "audio_codec": "aac",
+        "audio_bitrate": "128k",
+        "separate_audio": False,
+        "relay_targets": [],
+        "hls_dir": "",
+        "cpu_policy": "off",
+        "cpu_reserved_cores": 1,
+        "cpu_cores_per_session": 2,
+        "cpu_max_sessions": 0,
+        "cpu_session_priority": "above_normal",
+        "browser_warmup_seconds": 60,
+        "preview_enabled": True,
+        "preview_interval": 5,
+        "preview_width": 320,
+        "capture_backend": "auto",
+        "capture_region": "monitor",
+        "vfr_mode": False,
+        "crash_safe_output": True,
+        "supervisor_enabled": True,
+        "supervisor_max_backoff": 30,
+        "supervisor_max_crashes": 5,
+        "supervisor_crash_window": 600,
+        "end_detection": False,
+        "end_detection_seconds": 120,
+        "auto_stop_on_end": True,
+        "auto_extend": False,
+        "auto_extend_step_minutes": 5,
+        "auto_extend_max_minutes": 60,
+        "virtual_display": False,
+        "display_pool_size": 0,
+        "segment_enabled": False,
+        "segment_minutes": 10,
+        "segment_size_mb": 0,
+        "encoder_auto_downgrade": True,
+        "encoding_profile": "",
+        "encoding_overrides": {},
+        "adaptive_speed": True,
+        "two_stage_capture": False,
+        "intermediate_profile": "intermediate",
+        "keep_intermediate": False,
+        "storage_policy": "degrade",
+        "storage_reserve_mb": 1024,
+        "staging_dir": "",
+        "staging_reserve_mb": 256,
+        "resource_sampling": True,
+        "postprocess_concat": False,
+        "postprocess_remux_mp4": False,
+        "postprocess_fix_timestamps": True,
+        "postprocess_delete_sources": False,
+        "postprocess_workers": 1,
         "silent_mode": False,
         "enable_fullscreen": True,
         "enable_unmute": True,
@@ -9,13 +9,29 @@ from PyQt5.QtCore import QDateTime, Qt, QSize, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QIcon, QPixmap
 from config.config_manager import save_config
 from datetime import datetime, timedelta
-from recorder.recorder import recorder_instance
+from recorder.recorder import session_manager
+from recorder.display_pool import display_pool
+from recorder.end_detector import decide_end_action, ACTION_STOP, ACTION_EXTEND
+from recorder.size_predictor import size_predictor
 from screeninfo import get_monitors
 from browser.browser_controller import browser_controller_instance
 from browser.clicker import Clicker
+from browser.region_tracker import RegionTracker
+from browser.browser_pool import browser_pool, StartLatency
 from utils.common import get_ffmpeg_path, validate_live_url
 import os
+import time
 import logging
+from threading import Thread
+
+# 录制中检查页面是否显示下播的间隔（秒）
+PAGE_CHECK_INTERVAL = 15
+
+# 预览缩略图的最短刷新间隔（秒），文件未变化时不重绘
+PREVIEW_REFRESH_INTERVAL = 2
+
+# 录制方式下拉框各项对应的 capture_mode
+CAPTURE_MODES = ['screen', 'stream_copy', 'audio_only']
 
 def get_icon_path():
     if hasattr(sys, '_MEIPASS'):
@@ -50,6 +66,8 @@ def get_app_version():
 class MainWindow(QWidget):
     schedule_start_signal = pyqtSignal()
     schedule_stop_signal = pyqtSignal()
+    # 后台线程查找直播流的结果：(会话ID, 直播流信息或None)
+    live_stream_signal = pyqtSignal(object, object)
     def __init__(self, config, scheduler):
         super().__init__()
         self.config = config
@@ -65,6 +83,8 @@ class MainWindow(QWidget):
         
         self.init_ui()
         self.load_config_to_ui()
+        self.connect_size_estimate_signals()
+        self.update_size_estimate()
         
         # 倒计时相关变量
         self.countdown_timer = QTimer(self)
@@ -79,9 +99,14 @@ class MainWindow(QWidget):
         # 信号连接
         self.schedule_start_signal.connect(self.on_schedule_start_record)
         self.schedule_stop_signal.connect(self.on_schedule_stop_record)
+        self.live_stream_signal.connect(self.on_live_stream_found)
 
         # 录制状态标志
         self.is_recording = False
+        self.session_id = None
+        self.region_tracker = None
+        # 等待后台直播流查找结果时暂存的启动参数
+        self.pending_stream_start = None
 
     def init_ui(self):
         # 设置窗口标题，包含版本号
@@ -314,6 +339,12 @@ class MainWindow(QWidget):
         
         basic_form.addRow("开始时间/时长:", time_layout)
         
+        # 按历史录制预测的文件大小和排期磁盘需求
+        self.size_estimate_label = QLabel("")
+        self.size_estimate_label.setStyleSheet("color: #666; font-size: 9pt;")
+        self.size_estimate_label.setWordWrap(True)
+        basic_form.addRow("预计占用:", self.size_estimate_label)
+        
         # 保存路径
         path_layout = QHBoxLayout()
         path_layout.setContentsMargins(0, 0, 0, 0)  # 移除内边距
@@ -390,6 +421,52 @@ class MainWindow(QWidget):
         self.quality_input.addItems(['高', '中', '低'])
         record_form.addRow("录制质量:", self.quality_input)
         
+        # 录制方式
+        self.capture_mode_input = QComboBox()
+        self.capture_mode_input.addItems(['屏幕录制', '直播流直录', '仅录音频'])
+        record_form.addRow("录制方式:", self.capture_mode_input)
+        
+        capture_mode_note = QLabel("注：直播流直录直接保存平台推送的视频流，不占用编码资源，找不到流时自动改为屏幕录制；"
+                                   "仅录音频不捕获屏幕，需要选择音频设备")
+        capture_mode_note.setStyleSheet("color: #666; font-size: 9pt;")
+        capture_mode_note.setWordWrap(True)
+        record_form.addRow("", capture_mode_note)
+        
+        # 音频编码
+        self.audio_codec_input = QComboBox()
+        self.audio_codec_input.addItems(['aac', 'opus'])
+        self.audio_bitrate_input = QComboBox()
+        self.audio_bitrate_input.addItems(['64k', '96k', '128k', '192k'])
+        audio_codec_layout = QHBoxLayout()
+        audio_codec_layout.addWidget(self.audio_codec_input)
+        audio_codec_layout.addWidget(self.audio_bitrate_input)
+        record_form.addRow("音频编码:", audio_codec_layout)
+        self.separate_audio_input = QCheckBox("同时单独保存一份音频文件")
+        record_form.addRow("", self.separate_audio_input)
+        
+        # 捕获区域
+        self.capture_region_input = QComboBox()
+        self.capture_region_input.addItems(['整个显示器', '仅播放器画面'])
+        record_form.addRow("捕获区域:", self.capture_region_input)
+        
+        # 可变帧率：静态画面去重
+        self.vfr_input = QCheckBox("静态画面去重（可变帧率，适合幻灯片、固定机位）")
+        record_form.addRow("", self.vfr_input)
+        
+        # 直播结束检测
+        self.auto_stop_input = QCheckBox("检测到下播（黑屏/静止/静音）时提前停止")
+        record_form.addRow("", self.auto_stop_input)
+        self.auto_extend_input = QCheckBox("到时仍在直播时自动延长（最多60分钟）")
+        record_form.addRow("", self.auto_extend_input)
+        
+        # 转发与本地预览：同一次编码同时输出到转发地址和HLS目录
+        self.relay_input = QLineEdit()
+        self.relay_input.setPlaceholderText("如 udp://127.0.0.1:1234 或 rtmp://127.0.0.1/live/room，多个用逗号分隔")
+        record_form.addRow("转发地址:", self.relay_input)
+        self.hls_dir_input = QLineEdit()
+        self.hls_dir_input.setPlaceholderText("留空则不生成HLS预览")
+        record_form.addRow("HLS预览目录:", self.hls_dir_input)
+        
         record_group.setLayout(record_form)
         basic_layout.addWidget(record_group)
         
@@ -648,6 +725,21 @@ class MainWindow(QWidget):
         
         main_layout.addLayout(btn_layout)
         
+        # 录制实时统计（编码帧率、速度、码率、文件大小）
+        self.stats_label = QLabel("")
+        self.stats_label.setStyleSheet("color: #666; font-size: 9pt;")
+        main_layout.addWidget(self.stats_label)
+        
+        # 录制画面预览（FFmpeg定期输出的缩略图）
+        self.preview_label = QLabel()
+        self.preview_label.setFixedSize(320, 180)
+        self.preview_label.setAlignment(Qt.AlignCenter)
+        self.preview_label.setStyleSheet("background-color: #222;")
+        self.preview_label.hide()
+        main_layout.addWidget(self.preview_label, alignment=Qt.AlignHCenter)
+        self.preview_mtime = None
+        self.preview_checked_at = 0
+        
         self.setLayout(main_layout)
         self.stop_btn.setDisabled(True)  # 初始为禁用
 
@@ -721,6 +813,19 @@ class MainWindow(QWidget):
         # 新增选项
         self.framerate_input.setCurrentText(self.config.get('framerate', '25'))
         self.quality_input.setCurrentText(self.config.get('record_quality', '中'))
+        capture_mode = self.config.get('capture_mode', 'screen')
+        self.capture_mode_input.setCurrentIndex(CAPTURE_MODES.index(capture_mode) if capture_mode in CAPTURE_MODES else 0)
+        self.audio_codec_input.setCurrentText(self.config.get('audio_codec', 'aac'))
+        self.audio_bitrate_input.setCurrentText(self.config.get('audio_bitrate', '128k'))
+        self.separate_audio_input.setChecked(self.config.get('separate_audio', False))
+        self.relay_input.setText(', '.join(
+            item.get('url', '') if isinstance(item, dict) else item for item in self.config.get('relay_targets') or []))
+        self.hls_dir_input.setText(self.config.get('hls_dir', ''))
+        self.capture_region_input.setCurrentIndex(1 if self.config.get('capture_region') == 'video' else 0)
+        self.vfr_input.setChecked(self.config.get('vfr_mode', False))
+        end_detection = self.config.get('end_detection', False)
+        self.auto_stop_input.setChecked(end_detection and self.config.get('auto_stop_on_end', True))
+        self.auto_extend_input.setChecked(end_detection and self.config.get('auto_extend', False))
             
         # 自动化选项
         self.silent_input.setChecked(self.config.get('silent_mode', False))
@@ -785,6 +890,21 @@ class MainWindow(QWidget):
         self.config['enable_bilibili_fullscreen'] = self.bilibili_fullscreen_input.isChecked()
         self.config['framerate'] = self.framerate_input.currentText()
         self.config['record_quality'] = self.quality_input.currentText()
+        self.config['capture_mode'] = CAPTURE_MODES[self.capture_mode_input.currentIndex()]
+        self.config['audio_codec'] = self.audio_codec_input.currentText()
+        self.config['audio_bitrate'] = self.audio_bitrate_input.currentText()
+        self.config['separate_audio'] = self.separate_audio_input.isChecked()
+        # 保留配置文件中为已有地址指定的格式、失败策略
+        existing_targets = {(item.get('url') if isinstance(item, dict) else item): item
+                            for item in self.config.get('relay_targets') or []}
+        relay_urls = [url.strip() for url in re.split(r'[,，\s]+', self.relay_input.text()) if url.strip()]
+        self.config['relay_targets'] = [existing_targets.get(url, url) for url in relay_urls]
+        self.config['hls_dir'] = self.hls_dir_input.text().strip()
+        self.config['capture_region'] = 'video' if self.capture_region_input.currentIndex() == 1 else 'monitor'
+        self.config['vfr_mode'] = self.vfr_input.isChecked()
+        self.config['auto_stop_on_end'] = self.auto_stop_input.isChecked()
+        self.config['auto_extend'] = self.auto_extend_input.isChecked()
+        self.config['end_detection'] = self.auto_stop_input.isChecked() or self.auto_extend_input.isChecked()
         
         self.config['custom_key1_enabled'] = self.custom_key1_check.isChecked()
         self.config['custom_key1'] = self.custom_key1_input.text()
@@ -860,9 +980,17 @@ class MainWindow(QWidget):
         """重置点击计数器"""
         self.click_count = 0
         
-    def start_immediate_recording(self, show_popup=True):
+    def start_immediate_recording(self, show_popup=True, scheduled=False):
         if self.is_recording:
             return
+        # 启动耗时统计：定时任务从计划时间算起
+        scheduled_at = None
+        if scheduled:
+            try:
+                scheduled_at = datetime.strptime(self.config['start_time'], '%Y-%m-%d %H:%M:%S').timestamp()
+            except (KeyError, ValueError):
+                pass
+        self.start_latency = StartLatency(scheduled_at)
             
         # 保存当前UI设置到配置
         self.save_ui_to_config()
@@ -904,13 +1032,57 @@ class MainWindow(QWidget):
         """)
         QApplication.processEvents()
         
+        # 仅用于本次录制的附加配置（直播流信息、虚拟显示器等），不写回配置文件
+        record_extras = {}
+        # 直播结束检测状态
+        self.auto_extended_seconds = 0
+        self.page_end_reason = None
+        self.last_page_check = 0
+        self.session_id = session_manager.new_session_id()
+        
+        # 使用虚拟显示器时，为本次会话分配一个Xvfb显示器，浏览器和录制都使用它
+        display = None
+        if self.config.get('virtual_display', False):
+            width, height = self.get_virtual_display_size()
+            try:
+                display = display_pool.acquire(self.session_id, width, height).info()
+            except Exception as e:
+                # Xvfb或PulseAudio不可用等，恢复界面状态
+                logging.getLogger(__name__).error(f"启动虚拟显示器失败: {e}")
+                self.on_stop_record(show_popup=False)
+                self.show_status(f'虚拟显示器启动失败，录制未启动：{e}', show_popup=show_popup)
+                return
+            record_extras.update({
+                'capture_backend': 'x11grab',
+                'x11_display': display['display'],
+                'display_size': (display['width'], display['height']),
+                'pulse_source': display['pulse_source'],
+            })
+        
+        # 仅录音频需要音频输入，未选择音频设备时改为屏幕录制
+        if self.config.get('capture_mode') == 'audio_only' and self.config.get('audio_device', '无音频') == '无音频' \
+                and not record_extras.get('pulse_source'):
+            logging.getLogger(__name__).warning("仅录音频但未选择音频设备，改为屏幕录制")
+            self.show_status('未选择音频设备，改为屏幕录制', show_popup=show_popup)
+            record_extras['capture_mode'] = 'screen'
+        audio_only = record_extras.get('capture_mode', self.config.get('capture_mode')) == 'audio_only'
+        
         # 只有在URL有效且不是静默模式的情况下才打开浏览器
         if not self.config.get('silent_mode', False) and self.config.get('url_is_valid', True):
+            # 优先使用提前启动的浏览器；使用虚拟显示器时浏览器必须在分配的显示器上重新启动
+            if display:
+                # 随后在同一配置目录启动浏览器，等待预热实例关闭
+                browser_pool.cancel(wait=True)
+            else:
+                self.start_latency.warm = browser_pool.take(
+                    self.config['douyin_url'], monitor_index=self.config.get('monitor_index', 0),
+                    silent_mode=self.config.get('silent_mode', False))
             # 打开浏览器并自动化操作
             browser_controller_instance.silent_mode = self.config.get('silent_mode', False)
             browser_controller_instance.open_live_page(
                 self.config['douyin_url'],
                 monitor_index=self.config.get('monitor_index', 0),
+                display=display,
                 fullscreen=self.config.get('enable_fullscreen', True),
                 unmute=self.config.get('enable_unmute', True),
                 browser_fullscreen=self.config.get('enable_browser_fullscreen', False),
@@ -920,10 +1092,68 @@ class MainWindow(QWidget):
                 custom_key2_enabled=self.config.get('custom_key2_enabled', False),
                 custom_key2=self.config.get('custom_key2', '')
             )
+            self.start_latency.mark('page_ready')
+            self.start_latency.page_stages = dict(browser_controller_instance.stage_timings)
+            if self.config.get('capture_mode') == 'stream_copy':
+                # 直播流直录：查找直播流最长需要20秒，在后台线程中进行，结果通过信号回到界面线程继续启动
+                self.pending_stream_start = (record_extras, audio_only, show_popup)
+                Thread(target=self.detect_live_stream, args=(self.session_id,), daemon=True).start()
+                return
+            self.prepare_page_capture(record_extras, audio_only)
+        self.finish_immediate_recording(record_extras, show_popup)
+
+    def detect_live_stream(self, session_id):
+        """后台线程：从页面网络请求中查找直播流地址"""
+        try:
+            stream_source = browser_controller_instance.find_live_stream()
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"查找直播流失败: {e}")
+            stream_source = None
+        self.live_stream_signal.emit(session_id, stream_source)
+
+    def on_live_stream_found(self, session_id, stream_source):
+        """直播流查找结束，继续启动录制；查找期间录制已被停止时丢弃结果"""
+        if not self.is_recording or session_id != self.session_id or not self.pending_stream_start:
+            return
+        record_extras, audio_only, show_popup = self.pending_stream_start
+        self.pending_stream_start = None
+        if stream_source:
+            logging.getLogger(__name__).info(f"发现直播流({stream_source['kind']}): {stream_source['url']}")
+            record_extras['stream_source'] = stream_source
+            # 找到直播流后即可关闭浏览器
+            browser_controller_instance.close()
+        else:
+            logging.getLogger(__name__).warning("未发现直播流地址，改为屏幕录制")
+            self.prepare_page_capture(record_extras, audio_only)
+        self.finish_immediate_recording(record_extras, show_popup)
+
+    def prepare_page_capture(self, record_extras, audio_only):
+        """屏幕录制或仅录音频时准备浏览器：最小化或定位播放器区域，并启动定时点击"""
+        if audio_only:
+            # 仅录音频：不需要画面，最小化浏览器减少渲染开销
+            browser_controller_instance.minimize()
+            self.clicker = Clicker(browser_controller_instance.driver, interval=60)
+            self.clicker.start()
+        elif not record_extras.get('stream_source'):
+            # 只捕获播放器画面：记录其屏幕区域，录制中跟踪布局变化
+            if self.config.get('capture_region') == 'video':
+                video_rect = browser_controller_instance.get_video_rect()
+                if video_rect:
+                    record_extras['capture_rect'] = video_rect
+                    session_id = self.session_id
+                    self.region_tracker = RegionTracker(
+                        browser_controller_instance,
+                        lambda rect: session_manager.update_capture_rect(session_id, rect),
+                        initial_rect=video_rect,
+                    )
+                else:
+                    logging.getLogger(__name__).warning("未找到播放器画面，改为捕获整个显示器")
             # 启动定时点击
             self.clicker = Clicker(browser_controller_instance.driver, interval=60)
             self.clicker.start()
-            
+
+    def finish_immediate_recording(self, record_extras, show_popup):
+        """浏览器准备完成后切换界面为录制中并启动FFmpeg"""
         # 配置完成，切换为录制中
         now = datetime.now()
         self.config['start_time'] = now.strftime('%Y-%m-%d %H:%M:%S')
@@ -954,9 +1184,18 @@ class MainWindow(QWidget):
         self.record_timer.start(1000)
         self.update_recording_countdown()  # 立即刷新一次
         QApplication.processEvents()
-        # 启动录制
-        from recorder.recorder import recorder_instance
-        recorder_instance.start_recording(self.config)
+        # 启动录制，保存会话ID以便停止时定位到本窗口的会话
+        if not session_manager.start_recording(dict(self.config, **record_extras), session_id=self.session_id):
+            # 磁盘空间不足等原因被拒绝，恢复界面状态
+            self.on_stop_record(show_popup=False)
+            self.show_status('磁盘空间不足，录制未启动', show_popup=show_popup)
+            return
+        self.start_latency.mark('ffmpeg_started')
+        if browser_controller_instance.driver:
+            # 浏览器进程树计入本次会话的资源统计
+            session_manager.attach_process_ids(self.session_id, browser_controller_instance.get_process_ids())
+        if getattr(self, 'region_tracker', None):
+            self.region_tracker.start()
         if hasattr(self.scheduler, 'scheduler'):
             try:
                 self.scheduler.scheduler.remove_job('stop_record')
@@ -972,9 +1211,13 @@ class MainWindow(QWidget):
 
     def extend_recording_time(self):
         # 录制中点击按钮，延长1分钟
+        self.extend_recording(1)
+
+    def extend_recording(self, minutes):
+        """把录制结束时间延后指定分钟数，并同步更新停止任务"""
         if not self.is_recording:
             return
-        self.record_end_time += timedelta(minutes=1)
+        self.record_end_time += timedelta(minutes=minutes)
         # 更新APScheduler的stop_record任务
         if hasattr(self.scheduler, 'scheduler'):
             try:
@@ -992,6 +1235,12 @@ class MainWindow(QWidget):
     def update_recording_countdown(self):
         if not hasattr(self, 'record_end_time') or not self.is_recording:
             return
+        session = session_manager.get_session(self.session_id) if self.session_id else None
+        if session and not session.is_recording():
+            # FFmpeg多次崩溃放弃重启、或因磁盘空间不足被停止，界面同步为未录制
+            logging.getLogger(__name__).error(f"录制会话 {self.session_id} 已意外结束: {session.state}")
+            self.on_stop_record(show_popup=False)
+            return
         now = datetime.now()
         remain = self.record_end_time - now
         if remain.total_seconds() <= 0:
@@ -1001,6 +1250,172 @@ class MainWindow(QWidget):
             return
         minutes, seconds = divmod(int(remain.total_seconds()), 60)
         self.start_btn.setText(f"录制中（{minutes}分{seconds}秒）")
+        self.update_recording_stats()
+        self.update_recording_preview()
+        self.update_start_latency(session)
+        self.check_end_of_stream(remain.total_seconds())
+
+    def check_end_of_stream(self, remaining_seconds):
+        """根据直播结束检测信号，提前停止录制或在临近结束时自动延长"""
+        if not self.session_id:
+            return
+        signals = session_manager.get_end_signals(self.session_id)
+        if signals is None:
+            return
+        # 页面检查需要调用浏览器，降低频率
+        now = time.time()
+        if now - self.last_page_check >= PAGE_CHECK_INTERVAL:
+            self.last_page_check = now
+            self.page_end_reason = browser_controller_instance.check_stream_ended()
+        action = decide_end_action(
+            self.config, signals, self.page_end_reason, remaining_seconds, self.auto_extended_seconds
+        )
+        logger = logging.getLogger(__name__)
+        if action == ACTION_STOP:
+            logger.info(f"检测到直播已结束（页面: {self.page_end_reason}，信号: {signals}），提前停止录制")
+            if hasattr(self.scheduler, 'scheduler'):
+                try:
+                    self.scheduler.scheduler.remove_job('stop_record')
+                except Exception:
+                    pass
+            self.on_stop_record(show_popup=False)
+            if self.config.get('enable_recurring', False) and hasattr(self.scheduler, 'schedule_next_recurring'):
+                self.scheduler.schedule_next_recurring()
+        elif action == ACTION_EXTEND:
+            max_seconds = self.config.get('auto_extend_max_minutes', 60) * 60
+            step_seconds = min(self.config.get('auto_extend_step_minutes', 5) * 60, max_seconds - self.auto_extended_seconds)
+            self.auto_extended_seconds += step_seconds
+            logger.info(f"直播仍在进行，自动延长录制 {step_seconds / 60:.1f} 分钟")
+            self.extend_recording(step_seconds / 60)
+
+    def update_recording_stats(self):
+        """刷新录制实时统计，速度低于1.0x时以红色提示"""
+        stats = session_manager.get_stats(self.session_id) if self.session_id else None
+        latest = stats['latest'] if stats else {}
+        if not latest:
+            self.stats_label.setText("")
+            return
+        fps = latest.get('fps') or 0
+        speed = latest.get('speed') or 0
+        bitrate = latest.get('bitrate_kbps') or 0
+        size_mb = (latest.get('total_size') or 0) / 1024 / 1024
+        dropped = latest.get('drop_frames') or 0
+        text = f"编码 {fps:.1f}fps | 速度 {speed:.2f}x | 码率 {bitrate:.0f}kbps | 大小 {size_mb:.1f}MB | 丢帧 {dropped}"
+        if latest.get('dedup_frames') is not None:
+            # 由输出时长和捕获帧率推算，不是FFmpeg的精确计数
+            text += f" | 去重约 {latest['dedup_frames']}"
+        self.stats_label.setText(text)
+        color = '#e74c3c' if stats['below_realtime'] else '#666'
+        self.stats_label.setStyleSheet(f"color: {color}; font-size: 9pt;")
+
+    def connect_size_estimate_signals(self):
+        """影响输出大小的设置变化时刷新预计占用"""
+        self.duration_input.valueChanged.connect(self.update_size_estimate)
+        self.start_time_input.dateTimeChanged.connect(self.update_size_estimate)
+        self.save_path_input.textChanged.connect(self.update_size_estimate)
+        for combo in (self.codec_input, self.resolution_input, self.framerate_input, self.quality_input,
+                      self.capture_mode_input, self.audio_codec_input, self.audio_bitrate_input):
+            combo.currentIndexChanged.connect(self.update_size_estimate)
+        for check in (self.vfr_input, self.separate_audio_input, self.enable_recurring_input, self.everyday_check,
+                      self.monday_check, self.tuesday_check, self.wednesday_check, self.thursday_check,
+                      self.friday_check, self.saturday_check, self.sunday_check):
+            check.stateChanged.connect(self.update_size_estimate)
+
+    def get_size_estimate_config(self):
+        """用界面上当前的设置（尚未保存）构造预测用的配置"""
+        return dict(
+            self.config,
+            douyin_url=self.url_input.text().strip(),
+            silent_mode=self.silent_input.isChecked(),
+            start_time=self.start_time_input.dateTime().toString('yyyy-MM-dd HH:mm:ss'),
+            duration_minutes=self.duration_input.value(),
+            save_path=self.save_path_input.text(),
+            video_codec=self.codec_input.currentText(),
+            resolution=self.resolution_input.currentText(),
+            framerate=self.framerate_input.currentText(),
+            record_quality=self.quality_input.currentText(),
+            capture_mode=CAPTURE_MODES[self.capture_mode_input.currentIndex()],
+            audio_codec=self.audio_codec_input.currentText(),
+            audio_bitrate=self.audio_bitrate_input.currentText(),
+            separate_audio=self.separate_audio_input.isChecked(),
+            vfr_mode=self.vfr_input.isChecked(),
+            enable_recurring=self.enable_recurring_input.isChecked(),
+            recurring_days={
+                'monday': self.monday_check.isChecked(),
+                'tuesday': self.tuesday_check.isChecked(),
+                'wednesday': self.wednesday_check.isChecked(),
+                'thursday': self.thursday_check.isChecked(),
+                'friday': self.friday_check.isChecked(),
+                'saturday': self.saturday_check.isChecked(),
+                'sunday': self.sunday_check.isChecked(),
+                'everyday': self.everyday_check.isChecked(),
+            },
+        )
+
+    def update_size_estimate(self, *args):
+        try:
+            schedule = size_predictor.predict_schedule(self.get_size_estimate_config())
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"预测录制大小失败: {e}")
+            self.size_estimate_label.setText("")
+            return
+        single = schedule['per_recording']
+        source = {'channel': f"按该直播间{single['samples']}次录制",
+                  'profile': f"按相同设置{single['samples']}次录制",
+                  'estimate': "按码率估算"}[single['source']]
+        text = f"单次约 {single['bytes'] / 1024 ** 3:.2f}GB（{source}）"
+        if schedule['recordings'] > 1:
+            text += f"，未来{schedule['window_days']}天共{schedule['recordings']}场约 {schedule['total_bytes'] / 1024 ** 3:.2f}GB"
+        if schedule['available_bytes'] is not None:
+            text += f"，可用 {max(schedule['available_bytes'], 0) / 1024 ** 3:.1f}GB"
+        self.size_estimate_label.setText(text)
+        color = '#666' if schedule['fits'] else '#e74c3c'
+        self.size_estimate_label.setStyleSheet(f"color: {color}; font-size: 9pt;")
+
+    def update_start_latency(self, session):
+        """FFmpeg输出第一帧后记录本次启动的各阶段耗时"""
+        latency = getattr(self, 'start_latency', None)
+        if not latency or latency.written or not session or not session.stats.started_at:
+            return
+        latency.mark('first_frame', at=session.stats.started_at)
+        latency.save(self.session_id)
+
+    def update_recording_preview(self):
+        """按文件修改时间刷新预览缩略图，限制重绘频率"""
+        now = time.time()
+        if now - self.preview_checked_at < PREVIEW_REFRESH_INTERVAL:
+            return
+        self.preview_checked_at = now
+        path = session_manager.get_preview_path(self.session_id) if self.session_id else None
+        if not path:
+            return
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime == self.preview_mtime:
+            return
+        pixmap = QPixmap(path)
+        if pixmap.isNull():
+            return
+        self.preview_mtime = mtime
+        self.preview_label.setPixmap(pixmap.scaled(self.preview_label.size(), Qt.KeepAspectRatio,
+                                                   Qt.SmoothTransformation))
+        self.preview_label.show()
+
+    def clear_recording_preview(self):
+        self.preview_label.clear()
+        self.preview_label.hide()
+        self.preview_mtime = None
+        self.preview_checked_at = 0
+
+    def get_virtual_display_size(self):
+        """虚拟显示器分辨率：使用设置的输出分辨率，'window'时默认1920x1080"""
+        resolution = self.config.get('resolution', 'window')
+        if resolution != 'window' and 'x' in resolution:
+            width, height = map(int, resolution.split('x'))
+            return width, height
+        return 1920, 1080
 
     def start_countdown(self):
         """启动倒计时"""
@@ -1034,6 +1449,16 @@ class MainWindow(QWidget):
         self.codec_input.setDisabled(disabled)
         self.framerate_input.setDisabled(disabled)
         self.quality_input.setDisabled(disabled)
+        self.capture_mode_input.setDisabled(disabled)
+        self.audio_codec_input.setDisabled(disabled)
+        self.audio_bitrate_input.setDisabled(disabled)
+        self.separate_audio_input.setDisabled(disabled)
+        self.relay_input.setDisabled(disabled)
+        self.hls_dir_input.setDisabled(disabled)
+        self.capture_region_input.setDisabled(disabled)
+        self.vfr_input.setDisabled(disabled)
+        self.auto_stop_input.setDisabled(disabled)
+        self.auto_extend_input.setDisabled(disabled)
         
         # 自动化选项
         self.silent_input.setDisabled(disabled)
@@ -1108,13 +1533,24 @@ class MainWindow(QWidget):
                         pass
             self.show_status('任务已取消', show_popup=show_popup)
             return
+        self.pending_stream_start = None
         if hasattr(self, 'clicker') and self.clicker:
             self.clicker.stop()
             self.clicker = None
+        if getattr(self, 'region_tracker', None):
+            self.region_tracker.stop()
+            self.region_tracker = None
         from browser.browser_controller import browser_controller_instance
         browser_controller_instance.close()
-        from recorder.recorder import recorder_instance
-        recorder_instance.stop_recording()
+        if getattr(self, 'session_id', None):
+            session = session_manager.get_session(self.session_id)
+            session_manager.stop_recording(self.session_id)
+            # FFmpeg在后台完成收尾后再回收虚拟显示器
+            if session:
+                session.add_finish_listener(lambda s: display_pool.release(s.session_id))
+            else:
+                display_pool.release(self.session_id)
+            self.session_id = None
         self.disable_all_settings(False)
         self.start_btn.setText(self.original_btn_text)
         self.start_btn.setStyleSheet("""
@@ -1138,6 +1574,8 @@ class MainWindow(QWidget):
         self.is_recording = False
         if hasattr(self, 'record_timer'):
             self.record_timer.stop()
+        self.stats_label.setText("")
+        self.clear_recording_preview()
         # 修复：恢复"开始任务"按钮的信号绑定
         try:
             self.start_btn.clicked.disconnect()
@@ -1188,7 +1626,7 @@ class MainWindow(QWidget):
         return QIcon(pixmap)
 
     def on_schedule_start_record(self):
-        self.start_immediate_recording(show_popup=False)
+        self.start_immediate_recording(show_popup=False, scheduled=True)
 
     def on_schedule_stop_record(self):
         # 调度器触发的停止录制，不显示弹窗提示
@@ -1269,4 +1707,10 @@ def shutdown_cleanup(window, config):
     # 确保保存最新配置
     window.save_ui_to_config()
     
+    # 关闭所有虚拟显示器
+    display_pool.shutdown()
+    
+    # 关闭尚未使用的预热浏览器（预热线程为守护线程，退出前等待其关闭浏览器）
+    browser_pool.cancel(wait=True)
+    
     # 这里可以添加其他清理工作，如关闭日志等 
\ No newline at end of file
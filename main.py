@@ -4,6 +4,10 @@ from utils.logger import init_logger
 from config.config_manager import load_config
 from scheduler.task_scheduler import setup_scheduler
 from gui.main_window import start_gui
+from recorder.encoder_probe import encoder_capabilities
+from recorder.display_pool import display_pool
+from recorder.postprocess import postprocess_pool
+from recorder.recorder import session_manager
 
 def main():
     # 初始化日志
@@ -26,6 +30,21 @@ def main():
     # 加载配置
     config = load_config()
     
+    # 编码能力缓存缺失时在后台探测，录制开始时直接读取缓存；有录制进行时推迟测试编码
+    encoder_capabilities.ensure_probed_async(is_busy=session_manager.is_recording)
+    
+    # 使用虚拟显示器时预热显示器池，调度时间到达即可直接使用
+    pool_size = config.get('display_pool_size', 0)
+    if config.get('virtual_display', False) and pool_size > 0:
+        resolution = config.get('resolution', 'window')
+        width, height = map(int, resolution.split('x')) if 'x' in resolution else (1920, 1080)
+        display_pool.max_idle = max(display_pool.max_idle, pool_size)
+        display_pool.prestart_async(pool_size, width, height)
+    
+    # 继续执行上次退出时未完成的后处理任务
+    postprocess_pool.workers = max(1, int(config.get('postprocess_workers', 1)))
+    postprocess_pool.ensure_running()
+    
     # 创建调度器
     scheduler = setup_scheduler(config)
     
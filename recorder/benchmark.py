@@ -0,0 +1,267 @@
+"""
+编码吞吐基准测试
+
+用真实的 generate_ffmpeg_cmd 生成命令，把屏幕捕获替换为不限速的lavfi合成源，
+对 编码 x 质量 x 分辨率 x 帧率 的每个组合测量实际帧率、速度倍数、CPU时间、
+峰值内存和每分钟输出字节数，结果写入JSON/CSV报告，便于跨机器、跨版本对比。
+
+--sessions N 同时运行N个相同的编码进程，配合 --cpu-policy 比较不同CPU分配策略下
+"N个会话跑在M个核心上"的实际吞吐（报告中的fps/speed为各会话的最差值）。
+
+用法：
+    python -m recorder.benchmark --codecs h264,h265 --qualities 高,中,低 \\
+        --resolutions window,1280x720 --framerates 15,30 --output benchmark_report
+    python -m recorder.benchmark --codecs h264 --qualities 中 --resolutions window \\
+        --framerates 30 --sessions 4 --cpu-policy partition,shared,off
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import subprocess
+import psutil
+from threading import Thread
+from config.config_manager import get_default_config
+from recorder.ffmpeg_helper import generate_ffmpeg_cmd, get_ffmpeg_path
+from recorder.progress import ProgressStats
+from recorder.cpu_allocator import CpuAllocator, POLICIES
+
+SAMPLE_INTERVAL = 0.2      # 资源采样间隔（秒）
+
+REPORT_FIELDS = [
+    'video_codec', 'record_quality', 'resolution', 'framerate', 'source', 'sessions', 'cpu_policy',
+    'fps', 'speed', 'cpu_seconds', 'peak_rss_mb', 'bytes_per_minute',
+    'wall_seconds', 'return_code', 'error',
+]
+
+
+def build_benchmark_config(video_codec, quality, resolution, framerate, source, seconds, capture_size):
+    """在默认配置上只替换被测参数和捕获源，其余与实际录制一致"""
+    config = get_default_config()
+    config.update({
+        'video_codec': video_codec,
+        'record_quality': quality,
+        'resolution': resolution,
+        'framerate': str(framerate),
+        'audio_device': '无音频',
+        'capture_backend': 'lavfi',
+        'lavfi_source': source,
+        'lavfi_seconds': seconds,
+        'lavfi_size': capture_size,
+    })
+    return config
+
+
+def get_ffmpeg_version(ffmpeg_path):
+    try:
+        result = subprocess.run([ffmpeg_path, '-version'], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, timeout=10)
+        return result.stdout.decode('utf-8', errors='ignore').splitlines()[0]
+    except Exception:
+        return ''
+
+
+def get_machine_info(ffmpeg_path):
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': psutil.cpu_count(logical=True),
+        'physical_cores': psutil.cpu_count(logical=False),
+        'memory_mb': psutil.virtual_memory().total // 1024 // 1024,
+        'ffmpeg': get_ffmpeg_version(ffmpeg_path),
+    }
+
+
+def run_cell(config, work_dir, name='bench', on_start=None):
+    """运行矩阵中的一个组合，返回测量结果；on_start(pid) 在进程启动后调用"""
+    seconds = config['lavfi_seconds']
+    output_file = os.path.join(work_dir, f"{name}.{config.get('video_format', 'mkv')}")
+    cmd = generate_ffmpeg_cmd(config, output_file)
+    stats = ProgressStats('benchmark')
+    creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+    started = time.perf_counter()
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               stdin=subprocess.DEVNULL, creationflags=creationflags)
+    reader = Thread(target=lambda: [stats.feed_line(line) for line in process.stdout], daemon=True)
+    reader.start()
+    if on_start:
+        on_start(process.pid)
+
+    cpu_seconds, peak_rss = 0.0, 0
+    try:
+        ps_process = psutil.Process(process.pid)
+    except psutil.Error:
+        ps_process = None
+    deadline = time.time() + seconds * 30 + 60
+    error = ''
+    while process.poll() is None:
+        if time.time() > deadline:
+            process.kill()
+            error = 'timeout'
+            break
+        if ps_process:
+            try:
+                times = ps_process.cpu_times()
+                cpu_seconds = times.user + times.system
+                peak_rss = max(peak_rss, ps_process.memory_info().rss)
+            except psutil.Error:
+                pass
+        time.sleep(SAMPLE_INTERVAL)
+    process.wait()
+    reader.join(timeout=5)
+    wall_seconds = time.perf_counter() - started
+
+    latest = stats.latest
+    size = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+    frames = latest.get('frame') or 0
+    if process.returncode != 0 and not error:
+        error = f'ffmpeg exit {process.returncode}'
+    return {
+        'video_codec': config['video_codec'],
+        'record_quality': config['record_quality'],
+        'resolution': config['resolution'],
+        'framerate': config['framerate'],
+        'source': config['lavfi_source'],
+        'sessions': 1,
+        'cpu_policy': config.get('cpu_policy', 'off'),
+        # 整体平均值比最后一个进度采样更稳定
+        'fps': round(frames / wall_seconds, 2) if wall_seconds > 0 else None,
+        'speed': round(seconds / wall_seconds, 3) if wall_seconds > 0 and not error else latest.get('speed'),
+        'cpu_seconds': round(cpu_seconds, 2),
+        'peak_rss_mb': round(peak_rss / 1024 / 1024, 1),
+        'bytes_per_minute': int(size / seconds * 60) if seconds else 0,
+        'wall_seconds': round(wall_seconds, 2),
+        'return_code': process.returncode,
+        'error': error,
+    }
+
+
+def run_concurrent(config, work_dir, sessions):
+    """
+    同时运行 sessions 个相同的编码进程，按 config 中的CPU分配策略绑定核心
+
+    fps/speed取各进程的最差值（决定能否全部实时录制），CPU时间和内存取总和。
+    """
+    if sessions <= 1 and config.get('cpu_policy', 'off') == 'off':
+        return run_cell(config, work_dir)
+    allocator = CpuAllocator()
+    config = dict(config, cpu_max_sessions=config.get('cpu_max_sessions') or sessions)
+    results = [None] * sessions
+    threads = []
+    for index in range(sessions):
+        name = f"bench{index}"
+        allocation = allocator.allocate(name, config)
+        cell_config = dict(config, encoder_threads=allocation.threads) if allocation else config
+
+        def run(index=index, name=name, cell_config=cell_config):
+            results[index] = run_cell(cell_config, work_dir, name=name,
+                                      on_start=lambda pid: allocator.apply(name, [pid]))
+        threads.append(Thread(target=run, daemon=True))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    merged = dict(results[0])
+    valid = [r for r in results if r and not r['error']]
+    merged.update({
+        'sessions': sessions,
+        'fps': min((r['fps'] for r in valid if r['fps'] is not None), default=None),
+        'speed': min((r['speed'] for r in valid if r['speed'] is not None), default=None),
+        'cpu_seconds': round(sum(r['cpu_seconds'] for r in results if r), 2),
+        'peak_rss_mb': round(sum(r['peak_rss_mb'] for r in results if r), 1),
+        'wall_seconds': max(r['wall_seconds'] for r in results if r),
+        'error': '; '.join(sorted({r['error'] for r in results if r and r['error']})),
+    })
+    return merged
+
+
+def run_matrix(codecs, qualities, resolutions, framerates, source='testsrc2', seconds=10,
+               capture_size=(1920, 1080), progress=print, sessions=1, cpu_policies=('off',)):
+    ffmpeg_path = get_ffmpeg_path()
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='webvideo_bench_')
+    try:
+        for video_codec, quality, resolution, framerate, cpu_policy in itertools.product(
+                codecs, qualities, resolutions, framerates, cpu_policies):
+            config = build_benchmark_config(video_codec, quality, resolution, framerate, source, seconds, capture_size)
+            config['cpu_policy'] = cpu_policy
+            try:
+                result = run_concurrent(config, work_dir, sessions)
+            except Exception as e:
+                result = dict.fromkeys(REPORT_FIELDS)
+                result.update({'video_codec': video_codec, 'record_quality': quality, 'resolution': resolution,
+                               'framerate': str(framerate), 'source': source, 'sessions': sessions,
+                               'cpu_policy': cpu_policy, 'error': str(e)})
+            results.append(result)
+            if progress:
+                progress(f"{video_codec}/{quality} {resolution}@{framerate} x{sessions} [{cpu_policy}]: "
+                         f"{result['fps']}fps {result['speed']}x cpu={result['cpu_seconds']}s "
+                         f"rss={result['peak_rss_mb']}MB {result['error'] or ''}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'machine': get_machine_info(ffmpeg_path),
+        'source': source,
+        'seconds': seconds,
+        'capture_size': f"{capture_size[0]}x{capture_size[1]}",
+        'sessions': sessions,
+        'results': results,
+    }
+
+
+def write_report(report, output):
+    """写入 output.json 和 output.csv"""
+    base = os.path.splitext(output)[0]
+    os.makedirs(os.path.dirname(os.path.abspath(base)), exist_ok=True)
+    with open(base + '.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(base + '.csv', 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for row in report['results']:
+            writer.writerow({k: row.get(k) for k in REPORT_FIELDS})
+    return base + '.json', base + '.csv'
+
+
+def split_arg(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='编码吞吐基准测试')
+    parser.add_argument('--codecs', default='h264,h265,vp9,av1')
+    parser.add_argument('--qualities', default='高,中,低')
+    parser.add_argument('--resolutions', default='window,1280x720')
+    parser.add_argument('--framerates', default='15,30')
+    parser.add_argument('--source', default='testsrc2', choices=['testsrc2', 'mandelbrot'])
+    parser.add_argument('--seconds', type=int, default=10, help='每个组合编码的媒体时长（秒）')
+    parser.add_argument('--capture-size', default='1920x1080', help='合成源分辨率，模拟被捕获的屏幕')
+    parser.add_argument('--sessions', type=int, default=1, help='同时运行的编码进程数')
+    parser.add_argument('--cpu-policy', default='off', help=f"CPU分配策略，可多选：{','.join(POLICIES)}")
+    parser.add_argument('--output', default='benchmark_report', help='报告文件名（不含扩展名）')
+    args = parser.parse_args(argv)
+
+    cpu_policies = split_arg(args.cpu_policy)
+    unknown = [policy for policy in cpu_policies if policy not in POLICIES]
+    if unknown:
+        parser.error(f"未知的CPU分配策略: {','.join(unknown)}")
+    capture_size = tuple(map(int, args.capture_size.split('x')))
+    report = run_matrix(
+        split_arg(args.codecs), split_arg(args.qualities), split_arg(args.resolutions),
+        split_arg(args.framerates), source=args.source, seconds=args.seconds, capture_size=capture_size,
+        sessions=max(args.sessions, 1), cpu_policies=cpu_policies,
+    )
+    json_path, csv_path = write_report(report, args.output)
+    print(f"报告已保存: {json_path}, {csv_path}")
+
+
+if __name__ == '__main__':
+    main()
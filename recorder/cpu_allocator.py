@@ -0,0 +1,173 @@
+import sys
+import logging
+import psutil
+from threading import Lock
+
+# 分配策略
+POLICY_OFF = 'off'              # 不干预，由系统调度
+POLICY_SHARED = 'shared'        # 所有会话共用保留核以外的全部核心，线程数按会话数均分
+POLICY_PARTITION = 'partition'  # 把核心均分为 N 份（N 为 cpu_max_sessions），每个会话独占一份
+POLICY_PACK = 'pack'            # 每个会话固定分配 cpu_cores_per_session 个核心，其余留给后处理
+POLICIES = [POLICY_OFF, POLICY_SHARED, POLICY_PARTITION, POLICY_PACK]
+
+# 录制进程优先级；Linux下提高优先级需要权限，失败时保持默认
+PRIORITY_CLASSES = {
+    'normal': ('NORMAL_PRIORITY_CLASS', 0),
+    'above_normal': ('ABOVE_NORMAL_PRIORITY_CLASS', -5),
+    'high': ('HIGH_PRIORITY_CLASS', -10),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def get_cpu_list():
+    """本进程可用的逻辑CPU编号"""
+    try:
+        return sorted(psutil.Process().cpu_affinity())
+    except (psutil.Error, AttributeError):
+        # macOS不支持亲和性
+        return list(range(psutil.cpu_count(logical=True) or 1))
+
+
+def split_slots(cpus, count):
+    """把CPU列表按顺序切成 count 份，余数分给前面的份"""
+    count = max(min(count, len(cpus)), 1)
+    size, extra = divmod(len(cpus), count)
+    slots, start = [], 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        slots.append(cpus[start:end])
+        start = end
+    return slots
+
+
+def set_process_priority(pid, priority):
+    name, nice = PRIORITY_CLASSES.get(priority, PRIORITY_CLASSES['normal'])
+    try:
+        process = psutil.Process(pid)
+        process.nice(getattr(psutil, name) if sys.platform == "win32" else nice)
+        return True
+    except (psutil.Error, OSError):
+        return False
+
+
+def set_tree_affinity(pids, cpus):
+    """设置进程及其已有子进程的CPU亲和性；之后创建的子进程会继承父进程的设置"""
+    for pid in pids:
+        try:
+            root = psutil.Process(pid)
+            for process in [root] + root.children(recursive=True):
+                try:
+                    process.cpu_affinity(cpus)
+                except (psutil.Error, OSError):
+                    continue
+        except (psutil.Error, AttributeError):
+            continue
+
+
+class Allocation:
+    """一个会话分到的CPU集合、编码线程数和进程优先级"""
+
+    def __init__(self, cpus, threads, priority):
+        self.cpus = cpus
+        self.threads = threads
+        self.priority = priority
+
+    def info(self):
+        return {'cpus': list(self.cpus), 'threads': self.threads, 'priority': self.priority}
+
+
+class CpuAllocator:
+    """
+    并发会话的CPU分配器
+
+    前 cpu_reserved_cores 个核心留给界面和系统，其余按策略分给各录制会话；
+    会话的FFmpeg和浏览器进程树绑定到分配的核心，编码线程数与核心数一致，
+    避免多个编码器各自按全部核心开线程互相抢占。后处理进程绑定到没有被会话占用的核心。
+    """
+
+    def __init__(self, cpus=None):
+        self.cpus = cpus or get_cpu_list()
+        self.allocations = {}
+        self.lock = Lock()
+
+    def get_pool(self, config):
+        """可分配给录制会话的核心（去掉保留核）；核心太少时不保留"""
+        reserved = int(config.get('cpu_reserved_cores', 1))
+        if len(self.cpus) - reserved < 1:
+            return list(self.cpus)
+        return self.cpus[reserved:]
+
+    def plan_slots(self, config, expected_sessions):
+        """
+        按策略把核心划分为若干份
+
+        均分需要预先知道并发会话数，份数随会话增加而变化的话，新会话的份会与已有会话重叠；
+        未设置 cpu_max_sessions 时改为按 cpu_cores_per_session 固定大小划分。
+        """
+        policy = config.get('cpu_policy', POLICY_OFF)
+        pool = self.get_pool(config)
+        if policy == POLICY_PARTITION and int(config.get('cpu_max_sessions', 0)) > 0:
+            return split_slots(pool, expected_sessions)
+        if policy in (POLICY_PARTITION, POLICY_PACK):
+            per_session = max(int(config.get('cpu_cores_per_session', 2)), 1)
+            return [pool[i:i + per_session] for i in range(0, len(pool), per_session)]
+        return [pool]
+
+    def allocate(self, session_id, config):
+        """为新会话分配核心，策略为 off 时返回None"""
+        policy = config.get('cpu_policy', POLICY_OFF)
+        if policy not in POLICIES or policy == POLICY_OFF:
+            return None
+        with self.lock:
+            expected = int(config.get('cpu_max_sessions', 0)) or len(self.allocations) + 1
+            if policy == POLICY_PARTITION and not int(config.get('cpu_max_sessions', 0)):
+                logger.warning("partition 策略未设置 cpu_max_sessions，按 cpu_cores_per_session 固定划分核心")
+            slots = self.plan_slots(config, expected)
+            if policy == POLICY_SHARED:
+                cpus = slots[0]
+                threads = max(len(cpus) // max(expected, 1), 1)
+            else:
+                # 选择与已有会话重叠最少的一份；会话数超过份数时与其他会话共用，线程数按共用会话数均分
+                usage = [sum(1 for a in self.allocations.values() if set(a.cpus) & set(slot)) for slot in slots]
+                index = usage.index(min(usage))
+                cpus = slots[index]
+                threads = max(len(cpus) // (usage[index] + 1), 1)
+            allocation = Allocation(cpus, threads, config.get('cpu_session_priority', 'above_normal'))
+            self.allocations[session_id] = allocation
+        logger.info(f"会话 {session_id} 分配CPU {cpus}，编码线程 {threads}")
+        return allocation
+
+    def release(self, session_id):
+        with self.lock:
+            self.allocations.pop(session_id, None)
+
+    def apply(self, session_id, pids, priority=True):
+        """把会话的进程树绑定到分配的核心，并设置优先级"""
+        allocation = self.allocations.get(session_id)
+        if not allocation:
+            return
+        set_tree_affinity(pids, allocation.cpus)
+        if priority:
+            for pid in pids:
+                set_process_priority(pid, allocation.priority)
+
+    def leftover_cpus(self):
+        """没有被任何会话占用的核心；全部被占用时使用保留核，仍没有则不限制"""
+        with self.lock:
+            used = {cpu for allocation in self.allocations.values() for cpu in allocation.cpus}
+        free = [cpu for cpu in self.cpus if cpu not in used]
+        return free or list(self.cpus)
+
+    def pin_background(self, pid):
+        """后处理进程钩子：绑定到剩余核心"""
+        if not self.allocations:
+            return
+        set_tree_affinity([pid], self.leftover_cpus())
+
+    def snapshot(self):
+        with self.lock:
+            return {session_id: a.info() for session_id, a in self.allocations.items()}
+
+
+cpu_allocator = CpuAllocator()
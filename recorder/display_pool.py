@@ -0,0 +1,227 @@
+import os
+import time
+import shutil
+import logging
+import subprocess
+from threading import Thread, Lock
+
+# 虚拟显示器编号从该值开始分配，避开物理显示器常用的 :0 / :1
+FIRST_DISPLAY_NUMBER = 99
+MAX_DISPLAY_NUMBER = 199
+
+# 等待Xvfb就绪的超时时间（秒）
+XVFB_START_TIMEOUT = 10
+
+
+def display_in_use(number):
+    """X服务器启动后会创建锁文件和socket，任一存在即视为占用"""
+    return (os.path.exists(f'/tmp/.X{number}-lock')
+            or os.path.exists(f'/tmp/.X11-unix/X{number}'))
+
+
+class VirtualDisplay:
+    """一个Xvfb虚拟显示器，可选配一个PulseAudio空输出设备用于隔离会话声音"""
+
+    def __init__(self, number, width, height, with_audio=True):
+        self.number = number
+        self.width = width
+        self.height = height
+        self.with_audio = with_audio
+        self.process = None
+        self.sink_module = None
+        self.session_id = None
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def name(self):
+        return f':{self.number}'
+
+    @property
+    def sink_name(self):
+        return f'webvideo_display_{self.number}'
+
+    @property
+    def pulse_source(self):
+        """录音使用空输出设备的monitor源"""
+        return f'{self.sink_name}.monitor' if self.sink_module else None
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ['Xvfb', self.name, '-screen', '0', f'{self.width}x{self.height}x24', '-nolisten', 'tcp'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.time() + XVFB_START_TIMEOUT
+        while not os.path.exists(f'/tmp/.X11-unix/X{self.number}'):
+            if self.process.poll() is not None or time.time() > deadline:
+                self.stop()
+                raise RuntimeError(f"Xvfb {self.name} 启动失败")
+            time.sleep(0.1)
+        if self.with_audio and shutil.which('pactl'):
+            try:
+                result = subprocess.run(
+                    ['pactl', 'load-module', 'module-null-sink', f'sink_name={self.sink_name}'],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=5,
+                )
+                if result.returncode == 0:
+                    self.sink_module = result.stdout.decode().strip()
+            except Exception as e:
+                self.logger.warning(f"创建PulseAudio输出设备失败: {e}")
+        self.logger.info(f"虚拟显示器已启动: {self.name} {self.width}x{self.height}")
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def has_exited(self):
+        """Xvfb启动后又退出；正在启动（尚未创建进程）的显示器不算"""
+        return self.process is not None and self.process.poll() is not None
+
+    def stop(self):
+        if self.sink_module:
+            try:
+                subprocess.run(['pactl', 'unload-module', self.sink_module],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=5)
+            except Exception:
+                pass
+            self.sink_module = None
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except Exception:
+                self.process.kill()
+        self.process = None
+
+    def env(self):
+        """浏览器进程使用的环境变量：显示到该显示器，声音输出到对应的空设备"""
+        env = {'DISPLAY': self.name}
+        if self.sink_module:
+            env['PULSE_SINK'] = self.sink_name
+        return env
+
+    def info(self):
+        return {
+            'display': self.name,
+            'width': self.width,
+            'height': self.height,
+            'pulse_source': self.pulse_source,
+            'env': self.env(),
+        }
+
+
+class DisplayPool:
+    """
+    Xvfb虚拟显示器池
+
+    预先启动若干显示器，调度时直接分配给会话；会话结束后回收，
+    分辨率一致的显示器放回池中复用，多余的关闭。
+    """
+
+    def __init__(self, max_idle=2):
+        self.max_idle = max_idle
+        self.idle = []
+        self.busy = {}
+        self.lock = Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def next_display_number(self):
+        used = {d.number for d in self.idle} | {d.number for d in self.busy.values()}
+        for number in range(FIRST_DISPLAY_NUMBER, MAX_DISPLAY_NUMBER + 1):
+            if number not in used and not display_in_use(number):
+                return number
+        raise RuntimeError("没有可用的虚拟显示器编号")
+
+    def pop_dead_locked(self):
+        """把已退出的空闲显示器移出池（调用方持有锁），释放其编号和空闲名额；返回它们以便在锁外清理"""
+        dead = [d for d in self.idle if d.has_exited()]
+        for display in dead:
+            self.idle.remove(display)
+        return dead
+
+    def stop_dead(self, displays):
+        for display in displays:
+            self.logger.warning(f"空闲的虚拟显示器 {display.name} 已退出，移出池")
+            display.stop()
+
+    def prestart(self, count, width, height):
+        """预热指定数量、指定分辨率的空闲显示器"""
+        started = 0
+        while True:
+            with self.lock:
+                dead = self.pop_dead_locked()
+                ready = len([d for d in self.idle if (d.width, d.height) == (width, height)])
+                display = None
+                if ready < count:
+                    display = VirtualDisplay(self.next_display_number(), width, height)
+                    # 先占住编号，避免并发预热时重复分配
+                    self.idle.append(display)
+            self.stop_dead(dead)
+            if not display:
+                break
+            try:
+                display.start()
+                started += 1
+            except Exception:
+                with self.lock:
+                    self.idle.remove(display)
+                raise
+        return started
+
+    def prestart_async(self, count, width, height):
+        """在后台线程中预热显示器，失败只记录日志"""
+        def worker():
+            try:
+                self.prestart(count, width, height)
+            except Exception as e:
+                self.logger.error(f"预热虚拟显示器失败: {e}")
+        Thread(target=worker, daemon=True).start()
+
+    def acquire(self, session_id, width, height):
+        """为会话分配一个显示器，优先使用已预热的同分辨率显示器"""
+        with self.lock:
+            dead = self.pop_dead_locked()
+            display = None
+            for candidate in self.idle:
+                if (candidate.width, candidate.height) == (width, height) and candidate.is_alive():
+                    display = candidate
+                    break
+            if display:
+                self.idle.remove(display)
+            else:
+                display = VirtualDisplay(self.next_display_number(), width, height)
+            display.session_id = session_id
+            self.busy[session_id] = display
+        self.stop_dead(dead)
+        if display.is_alive():
+            self.logger.info(f"会话 {session_id} 使用预热的虚拟显示器 {display.name}")
+            return display
+        try:
+            display.start()
+        except Exception:
+            with self.lock:
+                self.busy.pop(session_id, None)
+            raise
+        return display
+
+    def release(self, session_id):
+        """回收会话的显示器"""
+        with self.lock:
+            display = self.busy.pop(session_id, None)
+            if not display:
+                return
+            display.session_id = None
+            if display.is_alive() and len(self.idle) < self.max_idle:
+                self.idle.append(display)
+                self.logger.info(f"虚拟显示器 {display.name} 已回收到池中")
+                return
+        display.stop()
+
+    def shutdown(self):
+        with self.lock:
+            displays = self.idle + list(self.busy.values())
+            self.idle = []
+            self.busy = {}
+        for display in displays:
+            display.stop()
+
+
+display_pool = DisplayPool()
@@ -0,0 +1,333 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import subprocess
+from threading import Thread, Lock
+from recorder.ffmpeg_helper import get_ffmpeg_path, get_video_codec_args
+from recorder.profiles import profile_registry, get_profile_name, PRESET_LADDER
+from utils.common import set_low_priority
+
+# 界面编码选项与FFmpeg编码器名称的对应关系
+CODEC_ENCODERS = {
+    'h264': 'libx264',
+    'h265': 'libx265',
+    'vp9': 'libvpx-vp9',
+    'av1': 'libaom-av1',
+}
+
+# 质量从高到低排列，降级时依次尝试更快的档位
+QUALITY_LEVELS = ['高', '中', '低']
+
+# 测试编码使用的合成源参数
+PROBE_WIDTH = 1280
+PROBE_HEIGHT = 720
+PROBE_FRAMERATE = 30
+PROBE_SECONDS = 3
+
+# 判定能否实时编码时预留的余量，速度需达到该倍数才视为可用
+REALTIME_MARGIN = 1.1
+
+# 有录制进行时推迟测试编码，避免与录制争抢CPU，也避免测得的速度偏低；每隔该秒数重新检查
+BUSY_RETRY_INTERVAL = 30
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_path():
+    """能力缓存文件路径，与浏览器配置一样保存在用户本地目录"""
+    appdata_dir = os.environ.get('APPDATA', '') or os.path.expanduser('~')
+    return os.path.join(appdata_dir, 'WebVideoRecorder', 'encoder_capabilities.json')
+
+
+def get_binary_key(ffmpeg_path):
+    """以FFmpeg路径、大小和修改时间作为缓存键，更换FFmpeg后缓存自动失效"""
+    try:
+        st = os.stat(ffmpeg_path)
+    except OSError:
+        return None
+    return f"{os.path.abspath(ffmpeg_path)}|{st.st_size}|{int(st.st_mtime)}"
+
+
+def _run(cmd, timeout=60):
+    """以最低优先级运行探测命令，不与录制争抢CPU"""
+    creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+    process = subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.DEVNULL,
+        creationflags=creationflags
+    )
+    set_low_priority(process.pid)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.communicate()
+        raise
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def list_ffmpeg_items(ffmpeg_path, kind):
+    """解析 `ffmpeg -encoders` / `ffmpeg -filters` 的输出，返回名称集合"""
+    result = _run([ffmpeg_path, '-hide_banner', f'-{kind}'])
+    names = set()
+    for line in result.stdout.decode('utf-8', errors='ignore').splitlines():
+        # 每行格式为：标志位 名称 描述
+        match = re.match(r'^\s*[A-Z.|]{2,8}\s+(\S+)\s', line)
+        if match and match.group(1) != '=':
+            names.add(match.group(1))
+    return names
+
+
+def get_ffmpeg_version(ffmpeg_path):
+    """`ffmpeg -version` 第一行中的版本号，如 '6.1.1'、'n5.0'；解析失败时返回空字符串"""
+    result = _run([ffmpeg_path, '-version'])
+    match = re.match(r'\S+ version (\S+)', result.stdout.decode('utf-8', errors='ignore'))
+    return match.group(1) if match else ''
+
+
+def probe_fps_mode(ffmpeg_path):
+    """是否支持 -fps_mode（FFmpeg 5.1 起提供，旧版本只有 -vsync）"""
+    result = _run([ffmpeg_path, '-hide_banner', '-h', 'full'])
+    return b'-fps_mode' in result.stdout
+
+
+def get_downgrade_steps(video_codec):
+    """
+    编码器从高到低的降级阶梯，每项为 (质量档位, 编码覆盖字段)
+
+    相邻档位的预设相同时（如h264中/低都是veryfast，只差CRF，编码开销几乎不变），
+    较低的档位同时换用更快一级的预设，保证每降一级都能减少编码开销。
+    """
+    steps = []
+    previous = None
+    for quality in QUALITY_LEVELS:
+        preset = profile_registry.get(get_profile_name(video_codec, quality)).get('preset')
+        overrides = {}
+        if preset in PRESET_LADDER and previous in PRESET_LADDER \
+                and PRESET_LADDER.index(preset) <= PRESET_LADDER.index(previous):
+            preset = PRESET_LADDER[min(PRESET_LADDER.index(previous) + 1, len(PRESET_LADDER) - 1)]
+            overrides = {'preset': preset}
+        steps.append((quality, overrides))
+        previous = preset
+    return steps
+
+
+def get_speed_key(video_codec, quality, overrides=None):
+    """测试编码速度在缓存中的键，如 'h264|低' 或 'h264|低|preset=superfast'"""
+    parts = [video_codec, quality] + [f"{k}={v}" for k, v in sorted((overrides or {}).items())]
+    return '|'.join(parts)
+
+
+def describe_encoding(video_codec, quality, overrides=None):
+    if overrides and overrides.get('preset'):
+        return f"{video_codec}/{quality}（预设 {overrides['preset']}）"
+    return f"{video_codec}/{quality}"
+
+
+def measure_encode_speed(ffmpeg_path, video_codec, quality, overrides=None):
+    """用lavfi合成源做一次短时测试编码，返回编码速度倍数（媒体时长/耗时）"""
+    cmd = [
+        ffmpeg_path, '-hide_banner', '-nostats', '-y',
+        '-f', 'lavfi',
+        '-i', f'testsrc2=size={PROBE_WIDTH}x{PROBE_HEIGHT}:rate={PROBE_FRAMERATE}',
+        '-t', str(PROBE_SECONDS),
+    ] + get_video_codec_args(video_codec, quality, overrides) + ['-f', 'null', '-']
+    started = time.perf_counter()
+    result = _run(cmd, timeout=PROBE_SECONDS * 40)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0 or elapsed <= 0:
+        return None
+    return PROBE_SECONDS / elapsed
+
+
+def run_probe(ffmpeg_path=None, is_busy=None):
+    """
+    完整探测：可用编码器/滤镜以及各编码器、质量档位（含降级阶梯中换用更快预设的档位）的测试编码速度
+
+    is_busy 返回True（有录制进行）时推迟每次测试编码，直到空闲。
+    """
+    ffmpeg_path = ffmpeg_path or get_ffmpeg_path()
+    encoders = list_ffmpeg_items(ffmpeg_path, 'encoders')
+    filters = list_ffmpeg_items(ffmpeg_path, 'filters')
+    version = get_ffmpeg_version(ffmpeg_path)
+    fps_mode = probe_fps_mode(ffmpeg_path)
+    logger.info(f"FFmpeg版本 {version or '未知'}，支持 -fps_mode: {fps_mode}")
+    speeds = {}
+    for video_codec, encoder in CODEC_ENCODERS.items():
+        if encoder not in encoders:
+            continue
+        variants = [(quality, {}) for quality in QUALITY_LEVELS]
+        variants += [step for step in get_downgrade_steps(video_codec) if step[1]]
+        for quality, overrides in variants:
+            label = describe_encoding(video_codec, quality, overrides)
+            while is_busy and is_busy():
+                time.sleep(BUSY_RETRY_INTERVAL)
+            try:
+                speed = measure_encode_speed(ffmpeg_path, video_codec, quality, overrides)
+            except Exception as e:
+                logger.warning(f"测试编码失败 {label}: {e}")
+                speed = None
+            speeds[get_speed_key(video_codec, quality, overrides)] = speed
+            logger.info(f"编码能力探测 {label}: {speed}")
+    return {
+        'probed_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'version': version,
+        'fps_mode': fps_mode,
+        'encoders': sorted(encoders),
+        'filters': sorted(filters),
+        'probe_pixel_rate': PROBE_WIDTH * PROBE_HEIGHT * PROBE_FRAMERATE,
+        'speeds': speeds,
+    }
+
+
+class EncoderCapabilities:
+    """
+    编码器能力缓存
+
+    探测结果按FFmpeg二进制缓存到磁盘；录制会话启动时只读内存中的缓存，
+    热路径上不会启动任何进程。缓存缺失时在后台线程中探测。
+    """
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path or get_cache_path()
+        self.lock = Lock()
+        self.cache = None
+        # 后台探测是否在进行，检查与置位都在锁内，避免重复探测
+        self.probing = False
+
+    def load(self):
+        if self.cache is not None:
+            return self.cache
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                self.cache = json.load(f)
+        except Exception:
+            self.cache = {}
+        return self.cache
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(self.cache_path, 'w', encoding='utf-8') as f:
+                json.dump(self.cache, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.warning(f"保存编码能力缓存失败: {e}")
+
+    def get(self, ffmpeg_path=None):
+        """返回当前FFmpeg的探测结果，没有缓存时返回None"""
+        key = get_binary_key(ffmpeg_path or get_ffmpeg_path())
+        if not key:
+            return None
+        with self.lock:
+            return self.load().get(key)
+
+    def probe(self, ffmpeg_path=None, force=False, is_busy=None):
+        ffmpeg_path = ffmpeg_path or get_ffmpeg_path()
+        key = get_binary_key(ffmpeg_path)
+        if not key:
+            return None
+        cached = self.get(ffmpeg_path)
+        if cached and not force:
+            return cached
+        result = run_probe(ffmpeg_path, is_busy)
+        with self.lock:
+            self.load()[key] = result
+            self.save()
+        return result
+
+    def ensure_probed_async(self, ffmpeg_path=None, is_busy=None):
+        """缓存缺失时在后台线程中以最低优先级探测，不阻塞调用方；is_busy 返回True时推迟测试编码"""
+        if self.get(ffmpeg_path):
+            return
+        with self.lock:
+            if self.probing:
+                return
+            self.probing = True
+
+        def worker():
+            try:
+                self.probe(ffmpeg_path, is_busy=is_busy)
+            except Exception as e:
+                logger.warning(f"编码能力探测失败: {e}")
+            finally:
+                with self.lock:
+                    self.probing = False
+
+        Thread(target=worker, daemon=True).start()
+
+    def supports_fps_mode(self):
+        """当前FFmpeg是否支持 -fps_mode；尚未探测（或旧版本缓存没有该项）时按不支持处理"""
+        caps = self.get()
+        return bool(caps and caps.get('fps_mode'))
+
+    def estimate_speed(self, caps, video_codec, quality, pixel_rate, overrides=None):
+        """按像素吞吐量把探测速度折算到目标分辨率和帧率"""
+        speed = caps.get('speeds', {}).get(get_speed_key(video_codec, quality, overrides))
+        if speed is None or not pixel_rate:
+            return speed
+        return speed * caps.get('probe_pixel_rate', pixel_rate) / pixel_rate
+
+    def select_encoding(self, config, pixel_rate):
+        """
+        根据缓存选择能实时运行的编码器和质量档位
+
+        返回 (video_codec, record_quality, encoding_overrides, reason)；没有缓存时原样返回配置。
+        先沿同一编码器的降级阶梯（见 get_downgrade_steps）降低档位，仍不能实时则回退到h264；
+        所有候选都达不到实时时使用测得最快的可用候选，没有任何测速结果时保持配置不变。
+        任务显式指定了编码配置（encoding_profile）或覆盖字段（encoding_overrides）时不做改动，只记录警告。
+        """
+        video_codec = config.get('video_codec', 'h264')
+        quality = config.get('record_quality', '中')
+        caps = self.get()
+        if not caps:
+            return video_codec, quality, {}, None
+
+        encoders = set(caps.get('encoders', []))
+        profile_name = config.get('encoding_profile')
+        if profile_name or config.get('encoding_overrides'):
+            if profile_name:
+                encoder = profile_registry.get(profile_name).get('encoder')
+                if encoder not in encoders:
+                    logger.warning(f"编码配置 {profile_name} 使用的编码器 {encoder} 不可用")
+            else:
+                speed = self.estimate_speed(caps, video_codec, quality, pixel_rate)
+                if speed is not None and speed < REALTIME_MARGIN:
+                    logger.warning(f"{video_codec}/{quality} 可能无法实时编码，任务指定了编码覆盖字段，保持不变")
+            return video_codec, quality, {}, None
+
+        start = QUALITY_LEVELS.index(quality) if quality in QUALITY_LEVELS else 1
+        # 第一个候选是原配置本身，之后沿降级阶梯依次尝试
+        candidates = [(video_codec, QUALITY_LEVELS[start], {})]
+        candidates += [(video_codec, q, o) for q, o in get_downgrade_steps(video_codec)[start + 1:]]
+        if video_codec != 'h264':
+            candidates += [('h264', QUALITY_LEVELS[start], {})]
+            candidates += [('h264', q, o) for q, o in get_downgrade_steps('h264')[start + 1:]]
+
+        fastest = None
+        for codec, q, overrides in candidates:
+            if CODEC_ENCODERS.get(codec) not in encoders:
+                continue
+            speed = self.estimate_speed(caps, codec, q, pixel_rate, overrides)
+            if speed is None:
+                continue
+            if speed >= REALTIME_MARGIN:
+                if (codec, q, overrides) == (video_codec, quality, {}):
+                    return codec, q, {}, None
+                return codec, q, overrides, \
+                    f"{video_codec}/{quality} 无法实时编码，降级为 {describe_encoding(codec, q, overrides)}"
+            if fastest is None or speed > fastest[0]:
+                fastest = (speed, codec, q, overrides)
+
+        # 没有候选能达到实时：使用测得最快的可用候选；没有任何测速结果时保持配置
+        if fastest is None:
+            return video_codec, quality, {}, None
+        speed, codec, q, overrides = fastest
+        if (codec, q, overrides) == (video_codec, quality, {}):
+            return codec, q, {}, None
+        return codec, q, overrides, \
+            f"{video_codec}/{quality} 无法实时编码，改用测得最快的 {describe_encoding(codec, q, overrides)}（{speed:.2f}x）"
+
+
+encoder_capabilities = EncoderCapabilities()
@@ -0,0 +1,124 @@
+import re
+import time
+import logging
+
+# 检测滤镜自身的判定窗口（秒），持续时长再由结束策略累计
+FREEZE_WINDOW = 10
+SILENCE_WINDOW = 10
+# 连续黑帧之间超过该间隔（秒）视为黑屏结束
+BLACK_GAP = 2
+
+FREEZE_START_PATTERN = re.compile(r'freeze_start:\s*[\d.]+')
+FREEZE_END_PATTERN = re.compile(r'freeze_end:\s*[\d.]+')
+SILENCE_START_PATTERN = re.compile(r'silence_start:\s*-?[\d.]+')
+SILENCE_END_PATTERN = re.compile(r'silence_end:\s*[\d.]+')
+BLACK_FRAME_PATTERN = re.compile(r'blackframe.*pblack:\s*\d+')
+
+# 结束策略的动作
+ACTION_STOP = 'stop'
+ACTION_EXTEND = 'extend'
+
+
+def build_video_detect_filters():
+    """
+    画面检测滤镜：freezedetect 检测静止画面，blackframe 逐帧报告黑屏
+
+    blackdetect 只在黑屏区间结束时才输出日志，无法发现仍在持续的黑屏，
+    因此黑屏使用 blackframe 按帧判断。
+    """
+    return [
+        f'freezedetect=n=-60dB:d={FREEZE_WINDOW}',
+        'blackframe=amount=98:threshold=32',
+    ]
+
+
+def build_audio_detect_filter():
+    return f'silencedetect=n=-50dB:d={SILENCE_WINDOW}'
+
+
+class EndDetector:
+    """
+    直播结束信号检测
+
+    解析FFmpeg检测滤镜在stderr上的日志，记录静止画面、黑屏、静音各自开始的时间。
+    """
+
+    def __init__(self, session_id=None, has_audio=False, has_video=True):
+        self.session_id = session_id
+        self.has_audio = has_audio
+        self.has_video = has_video
+        self.frozen_since = None
+        self.black_since = None
+        self.last_black = None
+        self.silent_since = None
+        self.logger = logging.getLogger(__name__)
+
+    def reset(self):
+        """FFmpeg重启后检测滤镜状态清零"""
+        self.frozen_since = None
+        self.black_since = None
+        self.last_black = None
+        self.silent_since = None
+
+    def feed_line(self, line):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='ignore')
+        now = time.time()
+        if BLACK_FRAME_PATTERN.search(line):
+            if self.black_since is None or now - self.last_black > BLACK_GAP:
+                self.black_since = now
+            self.last_black = now
+        elif FREEZE_START_PATTERN.search(line):
+            self.frozen_since = now - FREEZE_WINDOW
+            self.logger.info(f"会话 {self.session_id} 检测到画面静止")
+        elif FREEZE_END_PATTERN.search(line):
+            self.frozen_since = None
+        elif SILENCE_START_PATTERN.search(line):
+            self.silent_since = now - SILENCE_WINDOW
+        elif SILENCE_END_PATTERN.search(line):
+            self.silent_since = None
+
+    def signals(self):
+        """返回各信号已持续的秒数，未出现的信号为0"""
+        now = time.time()
+        black = 0
+        if self.black_since is not None and now - self.last_black <= BLACK_GAP:
+            black = now - self.black_since
+        return {
+            'frozen': now - self.frozen_since if self.frozen_since is not None else 0,
+            'black': black,
+            'silent': now - self.silent_since if self.silent_since is not None else 0,
+            'has_audio': self.has_audio,
+            'has_video': self.has_video,
+        }
+
+
+def get_stalled_seconds(signals):
+    """画面静止或黑屏、且没有声音（或不录音）的持续秒数；仅录音频时只看静音"""
+    if not signals.get('has_video', True):
+        return signals['silent']
+    video = max(signals['frozen'], signals['black'])
+    if signals['has_audio']:
+        return min(video, signals['silent'])
+    return video
+
+
+def decide_end_action(config, signals, page_ended, remaining_seconds, extended_seconds):
+    """
+    结束策略：根据检测信号和剩余时间决定提前停止、自动延长或不处理
+
+    页面显示直播结束时只需画面短暂确认即停止，否则需持续达到 end_detection_seconds；
+    临近结束且直播仍在进行时，按 auto_extend_step_minutes 延长，累计不超过上限。
+    """
+    stalled = get_stalled_seconds(signals)
+    threshold = config.get('end_detection_seconds', 120)
+    if config.get('auto_stop_on_end', True):
+        if page_ended and stalled >= min(threshold, 30):
+            return ACTION_STOP
+        if stalled >= threshold:
+            return ACTION_STOP
+    if config.get('auto_extend', False) and remaining_seconds <= 60 and not page_ended and stalled == 0:
+        max_extend = config.get('auto_extend_max_minutes', 60) * 60
+        if extended_seconds < max_extend:
+            return ACTION_EXTEND
+    return None
@@ -3,6 +3,26 @@ from screeninfo import get_monitors
 import subprocess
 import re
 import sys
+import shutil
+from recorder.segments import get_segment_seconds
+from recorder.profiles import get_codec_args
+from recorder.end_detector import build_video_detect_filters, build_audio_detect_filter
+
+# MKV文件头预留的索引空间，约可容纳十余小时、每2秒一个关键帧的索引
+MKV_RESERVED_INDEX_BYTES = 1024 * 1024
+# MKV簇的最长时长（毫秒），进程异常退出时最多丢失一个簇
+MKV_CLUSTER_MS = 2000
+
+# 转发地址协议对应的封装格式
+RELAY_FORMATS = {'udp': 'mpegts', 'srt': 'mpegts', 'tcp': 'mpegts', 'rtmp': 'flv', 'rtmps': 'flv'}
+# 本地HLS预览的分片时长（秒）和播放列表保留的分片数
+HLS_SEGMENT_SECONDS = 4
+HLS_LIST_SIZE = 6
+# 预览缩略图的默认间隔（秒）和宽度（像素）
+PREVIEW_INTERVAL = 5
+PREVIEW_WIDTH = 320
+# 文件扩展名与复用器名称不同的格式（tee的输出需显式指定复用器）
+MUXER_NAMES = {'mkv': 'matroska', 'm4a': 'mp4', 'opus': 'ogg', 'ts': 'mpegts'}
 
 def get_system_resolution():
     """获取系统所有显示器的分辨率信息"""
@@ -90,13 +110,248 @@ def get_ffmpeg_path():
         ffmpeg_dir = os.path.join(sys._MEIPASS, 'ffmpeg', 'bin')
     else:
         ffmpeg_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'ffmpeg', 'bin'))
-    ffmpeg_exe = os.path.join(ffmpeg_dir, 'ffmpeg.exe')
+    exe_name = 'ffmpeg.exe' if sys.platform == 'win32' else 'ffmpeg'
+    ffmpeg_exe = os.path.join(ffmpeg_dir, exe_name)
+    if sys.platform != 'win32' and not os.path.exists(ffmpeg_exe):
+        # Linux下未附带FFmpeg时使用系统安装的版本
+        ffmpeg_exe = shutil.which('ffmpeg') or ffmpeg_exe
     return ffmpeg_exe
 
-def generate_ffmpeg_cmd(config: dict, output_file: str) -> list:
-    # 根据选择的显示器设置偏移量和分辨率
-    monitor_index = config.get('monitor_index', 0)
-    offset_x, offset_y, capture_width, capture_height = get_monitor_geometry(monitor_index)
+def get_capture_backend(config: dict) -> str:
+    """屏幕捕获方式：Windows使用gdigrab，Linux使用x11grab；lavfi为基准测试用的合成源"""
+    backend = config.get('capture_backend', 'auto')
+    if backend in ('gdigrab', 'x11grab', 'lavfi'):
+        return backend
+    return 'gdigrab' if sys.platform == 'win32' else 'x11grab'
+
+def get_screen_geometry(config: dict) -> tuple:
+    """屏幕区域 (x, y, 宽, 高)：分配了虚拟显示器时为整个虚拟显示器，否则按显示器序号"""
+    if get_capture_backend(config) == 'lavfi':
+        width, height = config.get('lavfi_size', (1920, 1080))
+        return 0, 0, int(width), int(height)
+    if config.get('x11_display'):
+        width, height = config.get('display_size', (1920, 1080))
+        return 0, 0, int(width), int(height)
+    return get_monitor_geometry(config.get('monitor_index', 0))
+
+def get_capture_geometry(config: dict) -> tuple:
+    """
+    捕获区域 (x, y, 宽, 高)
+
+    指定了播放器区域 capture_rect 时只捕获该区域（裁剪到所在屏幕内），
+    捕获像素越少，色彩转换和编码的开销越低；否则捕获整个屏幕。
+    """
+    screen_x, screen_y, screen_width, screen_height = get_screen_geometry(config)
+    rect = config.get('capture_rect')
+    if not rect:
+        return screen_x, screen_y, screen_width, screen_height
+    x, y, width, height = rect
+    left, top = max(x, screen_x), max(y, screen_y)
+    right = min(x + width, screen_x + screen_width)
+    bottom = min(y + height, screen_y + screen_height)
+    if right - left < 2 or bottom - top < 2:
+        return screen_x, screen_y, screen_width, screen_height
+    return left, top, (right - left) // 2 * 2, (bottom - top) // 2 * 2
+
+def build_capture_input_args(config: dict, framerate: str, geometry: tuple) -> list:
+    """生成屏幕捕获输入参数"""
+    offset_x, offset_y, capture_width, capture_height = geometry
+    if get_capture_backend(config) == 'lavfi':
+        # 合成源不限速，测出的是编码管线的最大吞吐
+        source = config.get('lavfi_source', 'testsrc2')
+        return [
+            '-f', 'lavfi',
+            '-t', str(config.get('lavfi_seconds', 10)),
+            '-i', f"{source}=size={capture_width}x{capture_height}:rate={framerate}",
+        ]
+    if get_capture_backend(config) == 'x11grab':
+        display = config.get('x11_display') or os.environ.get('DISPLAY', ':0')
+        return [
+            '-f', 'x11grab',
+            '-framerate', framerate,
+            '-video_size', f"{capture_width}x{capture_height}",
+            '-i', f"{display}+{offset_x},{offset_y}",
+        ]
+    return [
+        '-f', 'gdigrab',
+        '-framerate', framerate,
+        '-offset_x', str(offset_x),
+        '-offset_y', str(offset_y),
+        '-video_size', f"{capture_width}x{capture_height}",
+        '-i', 'desktop',
+    ]
+
+def build_audio_input_args(config: dict) -> list:
+    """生成音频输入参数：Windows使用dshow设备，Linux使用PulseAudio源"""
+    audio_device = config.get('audio_device', '无音频')
+    if get_capture_backend(config) == 'x11grab':
+        # 虚拟显示器自带独立的PulseAudio空输出设备，录制其monitor源
+        source = config.get('pulse_source')
+        if not source and audio_device and audio_device != '无音频':
+            source = audio_device
+        return ['-f', 'pulse', '-i', source] if source else []
+    if audio_device and audio_device != '无音频':
+        return ['-f', 'dshow', '-i', f'audio={audio_device}']
+    return []
+
+def get_output_pixel_rate(config: dict) -> int:
+    """估算输出视频每秒需要编码的像素数（宽x高x帧率）"""
+    width, height = get_capture_geometry(config)[2:]
+    resolution = config.get('resolution', '')
+    if resolution != 'window' and 'x' in resolution:
+        width, height = map(int, resolution.split('x'))
+    try:
+        framerate = float(config.get('framerate', '25'))
+    except (TypeError, ValueError):
+        framerate = 25
+    return int(width * height * framerate)
+
+def build_decimate_filter(framerate: str) -> str:
+    """
+    生成mpdecimate去重滤镜
+
+    限制最多连续丢弃约2秒的帧，保证静止画面下仍定期输出帧，
+    播放器拖动和按时长切分分段不会因长时间无帧而失准。
+    """
+    try:
+        max_dropped = max(int(float(framerate) * 2), 1)
+    except (TypeError, ValueError):
+        max_dropped = 50
+    return f'mpdecimate=max={max_dropped}'
+
+def get_video_codec_args(video_codec: str, quality: str, overrides: dict = None, profile_name: str = None) -> list:
+    """根据编码器和录制质量查表生成视频编码参数，编码配置见 recorder/profiles.py"""
+    return get_codec_args(video_codec, quality, overrides, profile_name)
+
+def build_vfr_sync_args(config: dict) -> list:
+    """
+    保留去重后各帧的原始时间戳，输出可变帧率
+
+    -fps_mode 需要FFmpeg 5.1及以上，录制会话根据编码能力探测结果设置 ffmpeg_fps_mode；
+    未探测或旧版本使用 -vsync（新版本中已弃用但仍可用）。
+    """
+    if config.get('ffmpeg_fps_mode', False):
+        return ['-fps_mode', 'vfr']
+    return ['-vsync', 'vfr']
+
+def is_stream_copy(config: dict) -> bool:
+    """是否为直播流直录模式（已获取到直播流地址）"""
+    return config.get('capture_mode') == 'stream_copy' and bool(config.get('stream_source'))
+
+def is_audio_only(config: dict) -> bool:
+    """是否为仅录音频模式（不捕获屏幕）"""
+    return config.get('capture_mode') == 'audio_only'
+
+def encodes_video(config: dict) -> bool:
+    """是否需要编码视频（直录和仅音频模式不编码视频）"""
+    return not is_stream_copy(config) and not is_audio_only(config)
+
+def get_audio_extension(config: dict) -> str:
+    """音频文件扩展名：Opus使用Ogg封装，AAC使用M4A封装"""
+    return 'opus' if config.get('audio_codec', 'aac') == 'opus' else 'm4a'
+
+def get_output_extension(config: dict) -> str:
+    """录制输出文件的扩展名，分段时同时作为分段封装格式"""
+    if is_audio_only(config):
+        return get_audio_extension(config)
+    return config.get('video_format', 'mkv')
+
+def build_audio_codec_args(config: dict) -> list:
+    """音频编码参数，码率由 audio_bitrate 设置"""
+    bitrate = config.get('audio_bitrate', '128k')
+    if config.get('audio_codec', 'aac') == 'opus':
+        return ['-c:a', 'libopus', '-b:a', bitrate]
+    return ['-c:a', 'aac', '-b:a', bitrate]
+
+def generate_audio_only_cmd(config: dict, output_file: str, segment_list: str = None, segment_start_number: int = 0) -> list:
+    """仅录制音频：不捕获屏幕，也不编码视频"""
+    cmd = [
+        get_ffmpeg_path(),
+        '-y',
+        '-progress', 'pipe:1',
+        '-nostats',
+    ]
+    cmd += build_audio_input_args(config)
+    cmd += ['-vn'] + build_audio_codec_args(config)
+    if config.get('end_detection', False):
+        cmd += ['-af', build_audio_detect_filter()]
+    if config.get('segment_enabled', False) and segment_list:
+        cmd += build_segment_args(config, segment_list, segment_start_number, force_keyframes=False)
+    else:
+        cmd += build_container_args(config)
+    cmd.append(output_file)
+    return cmd
+
+def generate_stream_copy_cmd(config: dict, output_file: str, segment_list: str = None, segment_start_number: int = 0) -> list:
+    """直接拉取平台的HLS/FLV直播流并原样封装，不经过解码和编码"""
+    stream = config['stream_source']
+    cmd = [
+        get_ffmpeg_path(),
+        '-y',
+        '-progress', 'pipe:1',
+        '-nostats',
+    ]
+    if stream.get('user_agent'):
+        cmd += ['-user_agent', stream['user_agent']]
+    headers = ''.join(f"{k}: {v}\r\n" for k, v in stream.get('headers', {}).items())
+    if headers:
+        cmd += ['-headers', headers]
+    if stream.get('kind') == 'flv':
+        # FLV为单一HTTP长连接，断开时自动重连
+        cmd += ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5']
+    cmd += [
+        '-i', stream['url'],
+        '-map', '0:v?',
+        '-map', '0:a?',
+        '-c', 'copy',
+    ]
+    if config.get('video_format', 'mkv') == 'mp4':
+        # HLS/FLV中的AAC为ADTS格式，封装MP4需要转换
+        cmd += ['-bsf:a', 'aac_adtstoasc']
+
+    # 直录时无法强制关键帧，分段只能在源流的关键帧处切分
+    if config.get('segment_enabled', False) and segment_list:
+        cmd += build_segment_args(config, segment_list, segment_start_number, force_keyframes=False)
+    else:
+        cmd += build_container_args(config)
+
+    cmd.append(output_file)
+    return cmd
+
+def build_preview_output_args(config: dict, preview_file: str) -> list:
+    """
+    预览缩略图输出：从同一次捕获中每隔N秒取一帧，缩小后覆盖写入同一个JPEG
+
+    fps滤镜在缩放之前丢弃其余帧，单线程编码，开销相对主编码可以忽略；
+    atomic_writing 先写临时文件再改名，界面读取时不会读到写了一半的图片。
+    """
+    interval = max(int(config.get('preview_interval', PREVIEW_INTERVAL)), 1)
+    width = int(config.get('preview_width', PREVIEW_WIDTH)) // 2 * 2
+    return [
+        '-map', '0:v',
+        '-vf', f'fps=1/{interval},scale={width}:-2',
+        '-c:v', 'mjpeg', '-q:v', '5', '-threads', '1',
+        '-f', 'image2', '-update', '1', '-atomic_writing', '1',
+        preview_file,
+    ]
+
+def generate_ffmpeg_cmd(config: dict, output_file: str, segment_list: str = None, segment_start_number: int = 0,
+                        audio_file: str = None, hls_playlist: str = None, preview_file: str = None) -> list:
+    """
+    生成录制命令
+
+    audio_file 指定时，在视频文件之外再输出一个单独的音频文件（同一进程、同一次音频捕获）。
+    配置了转发目标或 hls_playlist 时，通过tee复用器把同一次编码同时写入归档文件和各转发目标。
+    preview_file 指定时，额外输出定期刷新的预览缩略图。
+    """
+    if is_stream_copy(config):
+        return generate_stream_copy_cmd(config, output_file, segment_list, segment_start_number)
+    if is_audio_only(config):
+        return generate_audio_only_cmd(config, output_file, segment_list, segment_start_number)
+
+    # 根据选择的显示器（或分配的虚拟显示器）设置偏移量和分辨率
+    geometry = get_capture_geometry(config)
+    capture_width, capture_height = geometry[2], geometry[3]
     
     # 获取用户设置的帧率
     framerate = config.get('framerate', '25')
@@ -105,163 +360,202 @@ def generate_ffmpeg_cmd(config: dict, output_file: str) -> list:
     cmd = [
         get_ffmpeg_path(),
         '-y',
-        '-f', 'gdigrab',
-        '-framerate', framerate,
-        '-offset_x', str(offset_x),
-        '-offset_y', str(offset_y),
-        '-video_size', f"{capture_width}x{capture_height}",
-        '-i', 'desktop',
+        # 通过stdout输出机器可读的进度信息，关闭stderr上的统计行
+        '-progress', 'pipe:1',
+        '-nostats',
     ]
+    cmd += build_capture_input_args(config, framerate, geometry)
 
     # 添加音频设备（如果指定）
-    audio_device = config.get('audio_device', '无音频')
-    if audio_device and audio_device != '无音频':
-        cmd += [
-            '-f', 'dshow',
-            '-i', f'audio={audio_device}',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-        ]
+    audio_args = build_audio_input_args(config)
+    if audio_args:
+        cmd += audio_args + build_audio_codec_args(config)
+        if config.get('end_detection', False):
+            cmd += ['-af', build_audio_detect_filter()]
     
+    video_filters = []
+    if config.get('end_detection', False):
+        # 结束检测需要看到每一帧，放在去重和缩放之前
+        video_filters += build_video_detect_filters()
+    if config.get('vfr_mode', False):
+        # 可变帧率：丢弃与前一帧几乎相同的帧，静态画面不再重复编码
+        video_filters.append(build_decimate_filter(framerate))
+
     # 如果用户指定了分辨率且不是'window'，添加缩放滤镜
     output_width, output_height = capture_width, capture_height  # 默认使用捕获分辨率
     if config.get('resolution') != 'window' and 'x' in config.get('resolution', ''):
         output_width, output_height = map(int, config.get('resolution').split('x'))
         # 添加缩放滤镜
-        cmd += [
-            '-vf', f'scale={output_width}:{output_height}',
-        ]
+        video_filters.append(f'scale={output_width}:{output_height}')
+    if video_filters:
+        cmd += ['-vf', ','.join(video_filters)]
+    if config.get('vfr_mode', False):
+        cmd += build_vfr_sync_args(config)
         
     # 根据质量设置视频编码参数
     quality = config.get('record_quality', '中')
     video_codec = config.get('video_codec', 'h264')
+    cmd += get_video_codec_args(
+        video_codec, quality,
+        overrides=config.get('encoding_overrides'),
+        profile_name=config.get('encoding_profile') or None,
+    )
+    if config.get('encoder_threads'):
+        # 编码线程数与分配给会话的核心数一致
+        cmd += ['-threads', str(config['encoder_threads'])]
     
-    # 设置各编码器在不同质量下的参数
-    # 使用CRF模式(恒定质量)而非固定码率，画质更均衡
-    if video_codec == 'h264':
-        if quality == '高':
-            # 高质量：画质优先，适合后期剪辑
-            preset = 'medium'
-            cmd += [
-                '-c:v', 'libx264',
-                '-crf', '18',  # 较低的CRF值 = 更高画质
-                '-preset', preset,
-                '-pix_fmt', 'yuv420p',
-            ]
-        elif quality == '低':
-            # 低质量：极致压缩，适合长时间录制
-            preset = 'veryfast'
-            cmd += [
-                '-c:v', 'libx264',
-                '-crf', '32',  # 较高的CRF值 = 更小文件
-                '-preset', preset,
-                '-pix_fmt', 'yuv420p',
-            ]
-        else:  # 中等质量(默认)
-            # 平衡画质和体积
-            preset = 'veryfast'
-            cmd += [
-                '-c:v', 'libx264',
-                '-crf', '25',
-                '-preset', preset,
-                '-pix_fmt', 'yuv420p',
-            ]
-    elif video_codec == 'h265':  # HEVC能以更低码率实现相似画质
-        if quality == '高':
-            preset = 'medium'
-            cmd += [
-                '-c:v', 'libx265',
-                '-crf', '20',  # H265的CRF值比H264低6左右相当于同等画质
-                '-preset', preset,
-                '-pix_fmt', 'yuv420p',
-                '-tag:v', 'hvc1',  # 增加兼容性
-            ]
-        elif quality == '低':
-            preset = 'veryfast'
-            cmd += [
-                '-c:v', 'libx265',
-                '-crf', '36',
-                '-preset', preset,
-                '-pix_fmt', 'yuv420p',
-                '-tag:v', 'hvc1',
-            ]
-        else:  # 中等质量
-            preset = 'veryfast'
-            cmd += [
-                '-c:v', 'libx265',
-                '-crf', '28',
-                '-preset', preset,
-                '-pix_fmt', 'yuv420p',
-                '-tag:v', 'hvc1',
-            ]
-    elif video_codec == 'vp9':  # VP9使用CQ模式，类似CRF
-        if quality == '高':
-            speed = '1'
-            cmd += [
-                '-c:v', 'libvpx-vp9',
-                '-crf', '19',  # VP9的CRF范围不同，但大致相当
-                '-b:v', '0',   # CRF模式需要设置码率为0
-                '-speed', speed,
-                '-row-mt', '1',  # 多线程编码
-                '-pix_fmt', 'yuv420p',
-            ]
-        elif quality == '低':
-            speed = '4'
-            cmd += [
-                '-c:v', 'libvpx-vp9',
-                '-crf', '37',
-                '-b:v', '0',
-                '-speed', speed,
-                '-row-mt', '1',
-                '-pix_fmt', 'yuv420p',
-            ]
-        else:  # 中等质量
-            speed = '2'
-            cmd += [
-                '-c:v', 'libvpx-vp9',
-                '-crf', '28',
-                '-b:v', '0',
-                '-speed', speed,
-                '-row-mt', '1',
-                '-pix_fmt', 'yuv420p',
-            ]
-    elif video_codec == 'av1':  # AV1也支持CRF
-        if quality == '高':
-            cpu_used = '3'
-            cmd += [
-                '-c:v', 'libaom-av1',
-                '-crf', '20',
-                '-b:v', '0',
-                '-cpu-used', cpu_used,
-                '-pix_fmt', 'yuv420p',
-            ]
-        elif quality == '低':
-            cpu_used = '8'
-            cmd += [
-                '-c:v', 'libaom-av1',
-                '-crf', '38',
-                '-b:v', '0',
-                '-cpu-used', cpu_used,
-                '-pix_fmt', 'yuv420p',
-            ]
-        else:  # 中等质量
-            cpu_used = '5'
-            cmd += [
-                '-c:v', 'libaom-av1',
-                '-crf', '29',
-                '-b:v', '0',
-                '-cpu-used', cpu_used,
-                '-pix_fmt', 'yuv420p',
-            ]
-    else:  # 默认回退到h264
-        preset = 'veryfast'
-        cmd += [
-            '-c:v', 'libx264',
-            '-crf', '25',  # 默认中等质量
-            '-preset', preset,
-            '-pix_fmt', 'yuv420p',
-        ]
-    
-    # 添加输出文件
-    cmd.append(output_file)
-    return cmd 
\ No newline at end of file
+    if get_relay_targets(config) or hls_playlist:
+        if config.get('segment_enabled', False) and segment_list:
+            cmd += build_keyframe_args(config)
+        cmd += build_tee_output_args(config, output_file, bool(audio_args), segment_list,
+                                     segment_start_number, hls_playlist)
+    else:
+        # 分段模式下output_file为带%03d序号的文件名模板
+        if config.get('segment_enabled', False) and segment_list:
+            cmd += build_segment_args(config, segment_list, segment_start_number)
+        else:
+            cmd += build_container_args(config)
+
+        # 添加输出文件
+        cmd.append(output_file)
+
+    if audio_file and audio_args:
+        # 第二个输出只包含音频，重新按音频格式封装
+        cmd += ['-vn'] + build_audio_codec_args(config)
+        cmd += build_container_args(dict(config, capture_mode='audio_only'))
+        cmd.append(audio_file)
+
+    if preview_file:
+        cmd += build_preview_output_args(config, preview_file)
+    return cmd
+
+def build_keyframe_args(config: dict) -> list:
+    """在每个分段边界强制插入关键帧，保证每个分段都能独立播放"""
+    segment_seconds = get_segment_seconds(config)
+    if segment_seconds > 0:
+        return ['-force_key_frames', f'expr:gte(t,n_forced*{segment_seconds})']
+    return []
+
+def get_segment_options(config: dict, segment_list: str, segment_start_number: int = 0) -> dict:
+    """segment复用器的参数：按时长滚动分段，分段清单写为csv"""
+    segment_seconds = get_segment_seconds(config)
+    if segment_seconds <= 0:
+        # 仅按大小切分时，由录制会话在文件超限时滚动，这里把时长设得足够大
+        segment_seconds = 24 * 3600
+    options = {
+        'segment_time': segment_seconds,
+        'segment_format': get_output_extension(config),
+        'segment_start_number': segment_start_number,
+        'segment_list': segment_list,
+        'segment_list_type': 'csv',
+        'reset_timestamps': 1,
+    }
+    container_options = get_container_options(config)
+    if container_options:
+        # 分段内部的封装参数需通过segment_format_options传给实际的复用器
+        options['segment_format_options'] = ':'.join(f'{k}={v}' for k, v in container_options.items())
+    return options
+
+def build_segment_args(config: dict, segment_list: str, segment_start_number: int = 0, force_keyframes: bool = True) -> list:
+    """生成segment复用器参数：按时长滚动分段，并在分段边界强制关键帧"""
+    args = build_keyframe_args(config) if force_keyframes else []
+    args += ['-f', 'segment']
+    for key, value in get_segment_options(config, segment_list, segment_start_number).items():
+        args += [f'-{key}', str(value)]
+    return args
+
+def get_relay_targets(config: dict) -> list:
+    """
+    转发目标列表，每项为 {'url', 'format', 'onfail'}
+
+    relay_targets 中的项可以直接是地址字符串；未指定格式时按协议推断，
+    转发失败默认忽略（onfail=ignore），不影响归档文件的写入。
+    """
+    targets = []
+    for item in config.get('relay_targets') or []:
+        if isinstance(item, str):
+            item = {'url': item}
+        url = item.get('url', '').strip()
+        if not url:
+            continue
+        scheme = url.split('://', 1)[0].lower() if '://' in url else ''
+        fmt = item.get('format') or RELAY_FORMATS.get(scheme)
+        if not fmt:
+            continue
+        targets.append({'url': url, 'format': fmt, 'onfail': item.get('onfail', 'ignore')})
+    return targets
+
+def escape_tee(value, specials: str) -> str:
+    """按FFmpeg的av_get_token规则转义：反斜杠、单引号以及给定的分隔符"""
+    return re.sub('([' + re.escape('\\\'' + specials) + '])', r'\\\1', str(value))
+
+def build_tee_slave(fmt: str, target: str, options: dict = None, onfail: str = 'abort') -> str:
+    """
+    tee复用器的一个输出：[f=格式:选项=值:onfail=策略]地址
+
+    选项值在解析选项时转义一次（选项以 : 分隔、以 ] 结束），整个输出在按 | 拆分时再转义一次，
+    Windows路径中的冒号和反斜杠因此需要两层转义。] 之后的地址原样使用，只需外层转义。
+    """
+    slave_options = {'f': fmt}
+    slave_options.update(options or {})
+    slave_options['onfail'] = onfail
+    spec = ':'.join(f'{key}={escape_tee(value, ":]")}' for key, value in slave_options.items())
+    return escape_tee(f'[{spec}]{target}', '|')
+
+def build_tee_output_args(config: dict, output_file: str, has_audio: bool, segment_list: str = None,
+                          segment_start_number: int = 0, hls_playlist: str = None) -> list:
+    """
+    一次编码输出到多个目标：归档文件、本地转发（UDP/RTMP等）、可选的HLS目录
+
+    归档文件失败时整个进程退出，由会话的守护逻辑重启；转发和HLS失败只停止该目标。
+    use_fifo 为每个目标单独缓冲，转发阻塞时不会拖慢归档写入。
+    """
+    if config.get('segment_enabled', False) and segment_list:
+        slaves = [build_tee_slave('segment', output_file,
+                                  get_segment_options(config, segment_list, segment_start_number))]
+    else:
+        extension = get_output_extension(config)
+        slaves = [build_tee_slave(MUXER_NAMES.get(extension, extension), output_file, get_container_options(config))]
+    targets = get_relay_targets(config)
+    for target in targets:
+        slaves.append(build_tee_slave(target['format'], target['url'], onfail=target['onfail']))
+    if hls_playlist:
+        slaves.append(build_tee_slave('hls', hls_playlist, {
+            'hls_time': HLS_SEGMENT_SECONDS,
+            'hls_list_size': HLS_LIST_SIZE,
+            'hls_flags': 'delete_segments+append_list',
+            # 以时间戳作为起始序号，FFmpeg重启后分片文件名不会与之前的重复
+            'hls_start_number_source': 'epoch',
+        }, onfail='ignore'))
+
+    # tee复用器不会自动选择流，需要显式映射
+    args = ['-map', '0:v'] + (['-map', '1:a'] if has_audio else [])
+    if any(target['format'] == 'flv' for target in targets):
+        # FLV要求编码参数放在全局头中
+        args += ['-flags', '+global_header']
+    args += ['-f', 'tee', '-use_fifo', '1', '|'.join(slaves)]
+    return args
+
+def get_container_options(config: dict) -> dict:
+    """
+    防崩溃封装参数
+
+    MP4使用分片模式：moov写在文件头，之后每个关键帧开始一个独立分片，
+    停止时无需回写索引，进程被强制结束也能正常播放和拖动。
+    MKV预留文件头的索引空间并缩短簇时长，结束时索引原地写入，
+    被强制结束时最多丢失最后一个簇。
+    """
+    if not config.get('crash_safe_output', True):
+        return {}
+    video_format = get_output_extension(config)
+    if video_format in ('mp4', 'm4a'):
+        return {'movflags': '+frag_keyframe+empty_moov+default_base_moof'}
+    if video_format == 'mkv':
+        return {'reserve_index_space': MKV_RESERVED_INDEX_BYTES, 'cluster_time_limit': MKV_CLUSTER_MS}
+    return {}
+
+def build_container_args(config: dict) -> list:
+    args = []
+    for key, value in get_container_options(config).items():
+        args += [f'-{key}', str(value)]
+    return args 
\ No newline at end of file
@@ -0,0 +1,434 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import subprocess
+import psutil
+from threading import Thread, Lock, Condition
+from recorder.ffmpeg_helper import get_ffmpeg_path, get_output_extension, is_audio_only
+from utils.common import set_low_priority
+
+# 任务状态
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+# 默认的任务资源限制
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_TIMEOUT = 6 * 3600         # 单个任务最长运行时间（秒）
+DEFAULT_MAX_MEMORY_MB = 2048       # 单个任务最大内存占用
+RETRY_DELAY = 30                   # 失败后重试前的等待时间（秒）
+MONITOR_INTERVAL = 1               # 资源检查间隔（秒）
+FINISHED_RETENTION = 24 * 3600     # 已结束的任务保留时长（秒），之后从任务队列文件中清理
+
+logger = logging.getLogger(__name__)
+
+
+def get_jobs_path():
+    """持久化任务队列文件，与浏览器配置一样保存在用户本地目录"""
+    appdata_dir = os.environ.get('APPDATA', '') or os.path.expanduser('~')
+    return os.path.join(appdata_dir, 'WebVideoRecorder', 'postprocess_jobs.json')
+
+
+def get_temp_output(output):
+    """任务先写入临时文件，成功后再替换为最终文件，避免留下半成品"""
+    base, ext = os.path.splitext(output)
+    return f"{base}.part{ext}"
+
+
+def build_remux_cmd(job, tmp_output):
+    """MKV重新封装为MP4，并把moov移到文件头以便边下边播"""
+    return [
+        get_ffmpeg_path(), '-y', '-nostats',
+        '-i', job['inputs'][0],
+        '-map', '0', '-c', 'copy',
+        '-movflags', '+faststart',
+        tmp_output,
+    ]
+
+
+def build_concat_cmd(job, tmp_output):
+    """使用concat分离器无损拼接多个分段"""
+    list_path = tmp_output + '.txt'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in job['inputs']:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return [
+        get_ffmpeg_path(), '-y', '-nostats',
+        '-f', 'concat', '-safe', '0',
+        '-i', list_path,
+        '-map', '0', '-c', 'copy',
+        tmp_output,
+    ]
+
+
+def build_fix_timestamps_cmd(job, tmp_output):
+    """重新生成时间戳，修复崩溃或断流后时间戳不连续的文件"""
+    return [
+        get_ffmpeg_path(), '-y', '-nostats',
+        '-fflags', '+genpts',
+        '-i', job['inputs'][0],
+        '-map', '0', '-c', 'copy',
+        '-avoid_negative_ts', 'make_zero',
+        tmp_output,
+    ]
+
+
+# 任务类型注册表：类型名 -> 生成FFmpeg命令的函数(job, 临时输出路径)
+JOB_TYPES = {
+    'remux_mp4': build_remux_cmd,
+    'concat': build_concat_cmd,
+    'fix_timestamps': build_fix_timestamps_cmd,
+}
+
+
+def register_job_type(name, build_cmd):
+    """注册自定义后处理任务类型"""
+    JOB_TYPES[name] = build_cmd
+
+
+class PostProcessPool:
+    """
+    录制后处理工作池
+
+    任务持久化到磁盘，程序重启后继续执行；同时运行的FFmpeg进程数受限，
+    每个进程以最低CPU/IO优先级运行并受超时和内存上限约束，失败自动重试。
+    录制会话结束时通过钩子自动生成任务。
+    """
+
+    def __init__(self, workers=1, jobs_path=None):
+        self.workers = workers
+        self.jobs_path = jobs_path or get_jobs_path()
+        self.jobs = []
+        self.hooks = []
+        self.lock = Lock()
+        self.condition = Condition(self.lock)
+        self.threads = []
+        self.loaded = False
+        self.process_hooks = []
+        self.job_listeners = []
+
+    # ---- 持久化 ----
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            try:
+                with open(self.jobs_path, 'r', encoding='utf-8') as f:
+                    self.jobs = json.load(f)
+            except Exception:
+                self.jobs = []
+            # 上次退出时正在运行的任务重新排队
+            for job in self.jobs:
+                if job['status'] == JOB_RUNNING:
+                    job['status'] = JOB_PENDING
+            self.prune_locked()
+            self.save_locked()
+
+    def save_locked(self):
+        try:
+            os.makedirs(os.path.dirname(self.jobs_path), exist_ok=True)
+            tmp_path = self.jobs_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.jobs, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.jobs_path)
+        except Exception as e:
+            logger.warning(f"保存后处理任务队列失败: {e}")
+
+    # ---- 提交与钩子 ----
+
+    def submit(self, job_type, inputs, output, depends_on=None, delete_inputs=False,
+               max_attempts=DEFAULT_MAX_ATTEMPTS, timeout=DEFAULT_TIMEOUT,
+               max_memory_mb=DEFAULT_MAX_MEMORY_MB, params=None):
+        """
+        提交后处理任务，返回任务ID
+
+        depends_on 中的任务全部完成后才会执行；delete_inputs 为True时成功后删除输入文件。
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"未知的后处理任务类型: {job_type}")
+        self.load()
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'type': job_type,
+            'inputs': list(inputs),
+            'output': output,
+            'params': params or {},
+            'depends_on': list(depends_on or []),
+            'delete_inputs': delete_inputs,
+            'status': JOB_PENDING,
+            'attempts': 0,
+            'max_attempts': max_attempts,
+            'timeout': timeout,
+            'max_memory_mb': max_memory_mb,
+            'not_before': 0,
+            'error': '',
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self.condition:
+            self.jobs.append(job)
+            self.save_locked()
+            self.condition.notify_all()
+        logger.info(f"已提交后处理任务 {job['id']} [{job_type}] -> {output}")
+        self.ensure_running()
+        return job['id']
+
+    def add_hook(self, hook):
+        """注册会话结束钩子：hook(session, pool)，可在其中提交任务"""
+        self.hooks.append(hook)
+
+    def add_process_hook(self, hook):
+        """注册进程启动钩子：hook(pid)，用于设置CPU亲和性等"""
+        self.process_hooks.append(hook)
+
+    def add_job_listener(self, listener):
+        """注册任务结束监听器：listener(job)，任务完成或最终失败（不再重试）时调用"""
+        self.job_listeners.append(listener)
+
+    def notify_job_finished(self, jobs):
+        for job in jobs:
+            for listener in self.job_listeners:
+                try:
+                    listener(dict(job))
+                except Exception as e:
+                    logger.error(f"后处理任务监听器执行失败: {e}")
+
+    def on_session_finished(self, session):
+        for hook in self.hooks:
+            try:
+                hook(session, self)
+            except Exception as e:
+                logger.error(f"后处理钩子执行失败: {e}")
+
+    def get_job(self, job_id):
+        with self.lock:
+            for job in self.jobs:
+                if job['id'] == job_id:
+                    return dict(job)
+        return None
+
+    def list_jobs(self, status=None):
+        self.load()
+        with self.lock:
+            return [dict(j) for j in self.jobs if status is None or j['status'] == status]
+
+    def prune_locked(self, max_age=FINISHED_RETENTION):
+        """清理结束超过 max_age 秒的任务；仍被未结束任务依赖的保留，以便判断依赖是否成功"""
+        now = time.time()
+        needed = {dep for j in self.jobs if j['status'] in (JOB_PENDING, JOB_RUNNING) for dep in j['depends_on']}
+        self.jobs = [
+            j for j in self.jobs
+            if j['status'] not in (JOB_DONE, JOB_FAILED) or j['id'] in needed
+            or now - j.get('finished_at', 0) < max_age
+        ]
+
+    def clear_finished(self):
+        """立即清理所有已结束的任务"""
+        with self.lock:
+            self.prune_locked(max_age=0)
+            self.save_locked()
+
+    # ---- 执行 ----
+
+    def ensure_running(self):
+        self.load()
+        self.threads = [t for t in self.threads if t.is_alive()]
+        while len(self.threads) < self.workers:
+            thread = Thread(target=self._worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _next_job_locked(self, finished):
+        """返回下一个可执行的任务；因依赖失败而直接失败的任务追加到 finished"""
+        done = {j['id'] for j in self.jobs if j['status'] == JOB_DONE}
+        failed = {j['id'] for j in self.jobs if j['status'] == JOB_FAILED}
+        now = time.time()
+        for job in self.jobs:
+            if job['status'] != JOB_PENDING or job['not_before'] > now:
+                continue
+            if any(dep in failed for dep in job['depends_on']):
+                job['status'] = JOB_FAILED
+                job['error'] = '依赖的任务失败'
+                job['finished_at'] = now
+                finished.append(job)
+                self.save_locked()
+                continue
+            if all(dep in done for dep in job['depends_on']):
+                return job
+        return None
+
+    def _worker(self):
+        while True:
+            finished = []
+            with self.condition:
+                job = self._next_job_locked(finished)
+                if job is None and not finished:
+                    self.condition.wait(timeout=RETRY_DELAY)
+                    job = self._next_job_locked(finished)
+                if job:
+                    job['status'] = JOB_RUNNING
+                    job['attempts'] += 1
+                    self.save_locked()
+            if job is None:
+                # 没有可执行的任务时先通知因依赖失败而结束的任务
+                self.notify_job_finished(finished)
+                continue
+            try:
+                self.run_job(job)
+                status, error = JOB_DONE, ''
+            except Exception as e:
+                status, error = None, str(e)
+            with self.condition:
+                if status == JOB_DONE:
+                    job['status'] = JOB_DONE
+                    logger.info(f"后处理任务完成 {job['id']} [{job['type']}] -> {job['output']}")
+                elif job['attempts'] >= job['max_attempts']:
+                    job['status'] = JOB_FAILED
+                    logger.error(f"后处理任务失败 {job['id']}，已放弃: {error}")
+                else:
+                    job['status'] = JOB_PENDING
+                    job['not_before'] = time.time() + RETRY_DELAY
+                    logger.warning(f"后处理任务失败 {job['id']}，稍后重试（第{job['attempts']}次）: {error}")
+                job['error'] = error
+                if job['status'] != JOB_PENDING:
+                    job['finished_at'] = time.time()
+                    finished.append(job)
+                    self.prune_locked()
+                self.save_locked()
+                self.condition.notify_all()
+            self.notify_job_finished(finished)
+
+    def run_job(self, job):
+        missing = [p for p in job['inputs'] if not os.path.exists(p)]
+        if missing:
+            raise RuntimeError(f"输入文件不存在: {missing}")
+        tmp_output = get_temp_output(job['output'])
+        cmd = JOB_TYPES[job['type']](job, tmp_output)
+        creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == "win32" else 0
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL,
+            creationflags=creationflags
+        )
+        set_low_priority(process.pid)
+        for hook in self.process_hooks:
+            try:
+                hook(process.pid)
+            except Exception as e:
+                logger.warning(f"后处理进程钩子执行失败: {e}")
+        try:
+            self.wait_with_limits(process, job)
+        finally:
+            list_path = tmp_output + '.txt'
+            if os.path.exists(list_path):
+                os.remove(list_path)
+        if process.returncode != 0:
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+            raise RuntimeError(f"FFmpeg返回码 {process.returncode}")
+        os.replace(tmp_output, job['output'])
+        # 记录输出大小：后续任务可能移动或删除该文件
+        job['output_size'] = os.path.getsize(job['output'])
+        if job['delete_inputs']:
+            for path in job['inputs']:
+                if os.path.abspath(path) != os.path.abspath(job['output']) and os.path.exists(path):
+                    os.remove(path)
+
+    def wait_with_limits(self, process, job):
+        """等待进程结束，超时或内存超限时结束进程"""
+        deadline = time.time() + job['timeout']
+        max_rss = job['max_memory_mb'] * 1024 * 1024
+        try:
+            ps_process = psutil.Process(process.pid)
+        except Exception:
+            ps_process = None
+        while process.poll() is None:
+            if time.time() > deadline:
+                process.kill()
+                process.wait()
+                raise RuntimeError("任务运行超时")
+            if ps_process and max_rss:
+                try:
+                    if ps_process.memory_info().rss > max_rss:
+                        process.kill()
+                        process.wait()
+                        raise RuntimeError("任务内存占用超过上限")
+                except psutil.Error:
+                    pass
+            time.sleep(MONITOR_INTERVAL)
+
+
+def get_crashed_files(session):
+    """FFmpeg异常退出时正在写入的分段或分卷，它们的时间戳可能不完整或不连续"""
+    if session.manifest:
+        return [s['path'] for s in session.manifest.segments if s.get('incomplete')]
+    # 单文件录制每个空档对应一次崩溃，空档记录的分卷序号是崩溃后新分卷的序号
+    return [session.parts[gap['part'] - 1] for gap in session.gaps
+            if gap.get('part') and gap['part'] <= len(session.parts)]
+
+
+def submit_fix_timestamps(session, pool):
+    """
+    为崩溃时的分段/分卷提交原地修复时间戳的任务，返回 {路径: 任务ID}
+
+    两段式录制的中间文件会被重新编码，不需要修复。
+    """
+    if session.two_stage or not session.config.get('postprocess_fix_timestamps', True):
+        return {}
+    jobs = {}
+    for path in get_crashed_files(session):
+        if os.path.exists(path) and path not in jobs:
+            jobs[path] = pool.submit('fix_timestamps', [path], path)
+    return jobs
+
+
+def default_session_hook(session, pool):
+    """
+    默认的会话结束钩子
+
+    崩溃时的分段/分卷先修复时间戳；分段录制可拼接为单个文件，MKV可重新封装为带faststart的MP4
+    （仅录音频时不重新封装）；两段式录制的拼接会等待各分段转码完成。
+    """
+    config = session.config
+    fix_jobs = submit_fix_timestamps(session, pool)
+    if session.manifest and config.get('postprocess_concat', False) and session.manifest.segments:
+        inputs = [s['path'] for s in session.manifest.segments]
+        depends_on = [fix_jobs[p] for p in inputs if p in fix_jobs]
+        if session.two_stage:
+            from recorder.transcode_queue import get_archive_path
+            depends_on = [session.transcode_jobs[p] for p in inputs if p in session.transcode_jobs]
+            inputs = [get_archive_path(p) for p in inputs]
+        base = os.path.join(session.final_dir, os.path.basename(session.manifest.manifest_path).replace('.segments.json', ''))
+        output = f"{base}.{get_output_extension(config)}"
+        job_id = pool.submit('concat', inputs, output, depends_on=depends_on,
+                             delete_inputs=config.get('postprocess_delete_sources', False))
+        if config.get('postprocess_remux_mp4', False) and not is_audio_only(config) and not output.endswith('.mp4'):
+            pool.submit('remux_mp4', [output], os.path.splitext(output)[0] + '.mp4', depends_on=[job_id],
+                        delete_inputs=config.get('postprocess_delete_sources', False))
+    elif not session.manifest:
+        # 单文件录制：FFmpeg崩溃重启后会有多个分卷，可按需拼接
+        sources = [p for p in session.parts if os.path.exists(p) or p in session.transcode_jobs]
+        depends_on = [fix_jobs[p] for p in sources if p in fix_jobs]
+        if session.two_stage:
+            from recorder.transcode_queue import get_archive_path
+            depends_on = [session.transcode_jobs[p] for p in sources if p in session.transcode_jobs]
+            sources = [get_archive_path(p) for p in sources]
+        delete_sources = config.get('postprocess_delete_sources', False)
+        if len(sources) > 1 and config.get('postprocess_concat', False):
+            output = os.path.splitext(sources[0])[0] + '_full' + os.path.splitext(sources[0])[1]
+            job_id = pool.submit('concat', sources, output, depends_on=depends_on, delete_inputs=delete_sources)
+            sources, depends_on = [output], [job_id]
+        if config.get('postprocess_remux_mp4', False) and not is_audio_only(config):
+            for source in sources:
+                if not source.endswith('.mp4'):
+                    pool.submit('remux_mp4', [source], os.path.splitext(source)[0] + '.mp4',
+                                depends_on=depends_on, delete_inputs=delete_sources)
+
+
+postprocess_pool = PostProcessPool()
+postprocess_pool.add_hook(default_session_hook)
@@ -0,0 +1,179 @@
+import os
+import json
+import logging
+from functools import lru_cache
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+# 内置编码配置表：键为 "编码/质量"，值为声明式的编码参数
+# 使用CRF模式(恒定质量)而非固定码率，画质更均衡
+BUILTIN_PROFILES = {
+    # 高质量：画质优先，适合后期剪辑
+    'h264/高': {'encoder': 'libx264', 'crf': 18, 'preset': 'medium', 'pix_fmt': 'yuv420p'},
+    # 中等质量：平衡画质和体积
+    'h264/中': {'encoder': 'libx264', 'crf': 25, 'preset': 'veryfast', 'pix_fmt': 'yuv420p'},
+    # 低质量：极致压缩，适合长时间录制
+    'h264/低': {'encoder': 'libx264', 'crf': 32, 'preset': 'veryfast', 'pix_fmt': 'yuv420p'},
+    # HEVC能以更低码率实现相似画质，H265的CRF值比H264低6左右相当于同等画质
+    'h265/高': {'encoder': 'libx265', 'crf': 20, 'preset': 'medium', 'pix_fmt': 'yuv420p', 'tag': 'hvc1'},
+    'h265/中': {'encoder': 'libx265', 'crf': 28, 'preset': 'veryfast', 'pix_fmt': 'yuv420p', 'tag': 'hvc1'},
+    'h265/低': {'encoder': 'libx265', 'crf': 36, 'preset': 'veryfast', 'pix_fmt': 'yuv420p', 'tag': 'hvc1'},
+    # VP9使用CQ模式，类似CRF，CRF模式需要设置码率为0
+    'vp9/高': {'encoder': 'libvpx-vp9', 'crf': 19, 'bitrate': '0', 'speed': 1, 'row_mt': 1, 'pix_fmt': 'yuv420p'},
+    'vp9/中': {'encoder': 'libvpx-vp9', 'crf': 28, 'bitrate': '0', 'speed': 2, 'row_mt': 1, 'pix_fmt': 'yuv420p'},
+    'vp9/低': {'encoder': 'libvpx-vp9', 'crf': 37, 'bitrate': '0', 'speed': 4, 'row_mt': 1, 'pix_fmt': 'yuv420p'},
+    # AV1也支持CRF
+    'av1/高': {'encoder': 'libaom-av1', 'crf': 20, 'bitrate': '0', 'cpu_used': 3, 'pix_fmt': 'yuv420p'},
+    'av1/中': {'encoder': 'libaom-av1', 'crf': 29, 'bitrate': '0', 'cpu_used': 5, 'pix_fmt': 'yuv420p'},
+    'av1/低': {'encoder': 'libaom-av1', 'crf': 38, 'bitrate': '0', 'cpu_used': 8, 'pix_fmt': 'yuv420p'},
+    # 两段式录制的中间编码：只求跟上实时，画质由后台转码保证
+    'intermediate': {'encoder': 'libx264', 'crf': 20, 'preset': 'ultrafast', 'tune': 'zerolatency', 'pix_fmt': 'yuv420p'},
+    # 近无损中间编码，文件较大，适合磁盘充足、对画质要求高的场景
+    'intermediate/近无损': {'encoder': 'libx264', 'crf': 8, 'preset': 'ultrafast', 'pix_fmt': 'yuv420p'},
+}
+
+# 未知的质量档位回退到同一编码的该档位，未知的编码回退到 DEFAULT_PROFILE
+DEFAULT_QUALITY = '中'
+DEFAULT_PROFILE = 'h264/中'
+
+# 各编码器支持的字段与FFmpeg参数的对应关系，按顺序输出
+ENCODER_OPTIONS = {
+    'libx264': [
+        ('crf', '-crf'), ('preset', '-preset'), ('tune', '-tune'),
+        ('threads', '-threads'), ('lookahead', '-rc-lookahead'), ('keyint', '-g'),
+        ('maxrate', '-maxrate'), ('bufsize', '-bufsize'), ('pix_fmt', '-pix_fmt'),
+    ],
+    'libx265': [
+        ('crf', '-crf'), ('preset', '-preset'), ('tune', '-tune'), ('keyint', '-g'),
+        ('maxrate', '-maxrate'), ('bufsize', '-bufsize'), ('pix_fmt', '-pix_fmt'),
+        ('tag', '-tag:v'),
+    ],
+    'libvpx-vp9': [
+        ('crf', '-crf'), ('bitrate', '-b:v'), ('speed', '-speed'), ('row_mt', '-row-mt'),
+        ('threads', '-threads'), ('lookahead', '-lag-in-frames'), ('keyint', '-g'),
+        ('maxrate', '-maxrate'), ('bufsize', '-bufsize'), ('pix_fmt', '-pix_fmt'),
+    ],
+    'libaom-av1': [
+        ('crf', '-crf'), ('bitrate', '-b:v'), ('cpu_used', '-cpu-used'), ('row_mt', '-row-mt'),
+        ('threads', '-threads'), ('lookahead', '-lag-in-frames'), ('keyint', '-g'),
+        ('maxrate', '-maxrate'), ('bufsize', '-bufsize'), ('pix_fmt', '-pix_fmt'),
+    ],
+}
+
+# x264/x265预设从慢到快排列
+PRESET_LADDER = ['veryslow', 'slower', 'slow', 'medium', 'fast', 'faster', 'veryfast', 'superfast', 'ultrafast']
+
+# x265的线程池和前瞻帧数需要通过 -x265-params 传递
+X265_PARAMS = [('threads', 'pools'), ('lookahead', 'rc-lookahead')]
+
+
+def get_user_profiles_path():
+    """用户自定义编码配置文件，与浏览器配置一样保存在用户本地目录"""
+    appdata_dir = os.environ.get('APPDATA', '') or os.path.expanduser('~')
+    return os.path.join(appdata_dir, 'WebVideoRecorder', 'encoding_profiles.json')
+
+
+class ProfileRegistry:
+    """
+    编码配置注册表
+
+    内置配置可被用户配置文件（encoding_profiles.json）扩展或覆盖，
+    任务配置中的 encoding_overrides 再逐字段覆盖。参数生成结果按输入缓存。
+    """
+
+    def __init__(self):
+        self.profiles = {name: dict(fields) for name, fields in BUILTIN_PROFILES.items()}
+        self.lock = Lock()
+        self.user_loaded = False
+
+    def load_user_profiles(self, path=None):
+        path = path or get_user_profiles_path()
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                user_profiles = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取自定义编码配置失败: {e}")
+            return
+        for name, fields in user_profiles.items():
+            self.register(name, fields)
+        logger.info(f"已加载自定义编码配置: {list(user_profiles.keys())}")
+
+    def ensure_loaded(self):
+        with self.lock:
+            if self.user_loaded:
+                return
+            self.user_loaded = True
+        self.load_user_profiles()
+
+    def register(self, name, fields):
+        """注册或覆盖一个编码配置；基于已有配置时只需给出差异字段"""
+        with self.lock:
+            base = dict(self.profiles.get(name, {}))
+            base.update(fields)
+            if 'encoder' not in base:
+                raise ValueError(f"编码配置 {name} 缺少 encoder 字段")
+            self.profiles[name] = base
+        build_profile_args.cache_clear()
+
+    def get(self, name):
+        self.ensure_loaded()
+        with self.lock:
+            profile = (self.profiles.get(name) or self.profiles.get(get_fallback_name(name))
+                       or self.profiles[DEFAULT_PROFILE])
+            return dict(profile)
+
+    def names(self):
+        self.ensure_loaded()
+        with self.lock:
+            return list(self.profiles.keys())
+
+
+profile_registry = ProfileRegistry()
+
+
+def get_profile_name(video_codec, quality):
+    return f"{video_codec}/{quality}"
+
+
+def get_fallback_name(name):
+    """未知配置的回退：保持同一编码，质量改为默认档位"""
+    return get_profile_name(name.split('/', 1)[0], DEFAULT_QUALITY)
+
+
+def freeze_overrides(overrides):
+    """把覆盖字段转换为可哈希的元组，用作缓存键"""
+    if not overrides:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in overrides.items()))
+
+
+@lru_cache(maxsize=256)
+def build_profile_args(name, frozen_overrides=()):
+    """根据配置名和覆盖字段生成视频编码参数（结果缓存）"""
+    profile = profile_registry.get(name)
+    profile.update(dict(frozen_overrides))
+    encoder = profile['encoder']
+    args = ['-c:v', encoder]
+    for field, option in ENCODER_OPTIONS.get(encoder, []):
+        value = profile.get(field)
+        if value is not None and value != '':
+            args += [option, str(value)]
+    if encoder == 'libx265':
+        params = [f"{key}={profile[field]}" for field, key in X265_PARAMS if profile.get(field) not in (None, '')]
+        if params:
+            args += ['-x265-params', ':'.join(params)]
+    return tuple(args)
+
+
+def get_codec_args(video_codec, quality, overrides=None, profile_name=None):
+    """
+    查表生成视频编码参数
+
+    profile_name 指定时直接使用该配置（可为用户自定义配置），
+    否则按 "编码/质量" 查找；overrides 为逐字段覆盖。
+    """
+    name = profile_name or get_profile_name(video_codec, quality)
+    return list(build_profile_args(name, freeze_overrides(overrides)))
@@ -0,0 +1,159 @@
+import time
+import logging
+from collections import deque
+
+# 滚动历史保留的采样数（FFmpeg默认每0.5秒输出一次进度）
+HISTORY_SIZE = 120
+
+
+def parse_speed(value):
+    """解析 '1.02x' 形式的编码速度"""
+    try:
+        return float(value.strip().rstrip('x'))
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_bitrate(value):
+    """解析 '1234.5kbits/s' 形式的码率，返回kbit/s"""
+    try:
+        return float(value.strip().replace('kbits/s', ''))
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProgressStats:
+    """
+    录制会话的实时编码统计
+
+    读取 `ffmpeg -progress pipe:1` 的 key=value 输出，每个 progress= 行结束一个采样块。
+    最新采样以不可变字典整体替换，读取方（界面等）无需加锁，也不会阻塞读取线程。
+    """
+
+    def __init__(self, session_id=None, history_size=HISTORY_SIZE, input_framerate=None):
+        self.session_id = session_id
+        # VFR模式下的捕获帧率，用于估算被去重丢弃的帧数（估算方法见 build_sample）
+        self.input_framerate = input_framerate
+        self.started_at = None
+        self.latest = {}
+        self.history = deque(maxlen=history_size)
+        self.pending = {}
+        # 本次启动以来的采样数，历史按容量丢弃旧采样后仍能判断是否处于启动阶段
+        self.sample_count = 0
+        self.below_realtime = False
+        self.logger = logging.getLogger(__name__)
+
+    def reset(self, input_framerate=None):
+        """FFmpeg重启后清空历史，避免旧参数下的采样影响判断"""
+        if input_framerate is not None:
+            self.input_framerate = input_framerate
+        self.started_at = None
+        self.pending = {}
+        self.history.clear()
+        self.sample_count = 0
+        self.below_realtime = False
+
+    def feed_line(self, line):
+        """处理一行进度输出，完成一个采样块时返回该采样"""
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='ignore')
+        line = line.strip()
+        if not line or '=' not in line:
+            return None
+        if self.started_at is None:
+            self.started_at = time.time()
+        key, value = line.split('=', 1)
+        self.pending[key.strip()] = value.strip()
+        if key.strip() != 'progress':
+            return None
+        sample = self.build_sample(self.pending)
+        self.pending = {}
+        self.latest = sample
+        self.history.append(sample)
+        self.sample_count += 1
+        self.check_speed(sample)
+        return sample
+
+    def build_sample(self, raw):
+        out_time_us = parse_int(raw.get('out_time_us')) or parse_int(raw.get('out_time_ms'))
+        out_time_seconds = out_time_us / 1000000 if out_time_us is not None else None
+        frame = parse_int(raw.get('frame'))
+        dedup_frames = None
+        if self.input_framerate and frame is not None and out_time_seconds:
+            # 可变帧率输出保留捕获时的时间戳：已输出的时长乘以捕获帧率约为这段时间捕获的帧数，
+            # 与输出帧数之差即去重丢弃的重复帧。只用FFmpeg报告的数据，不计入启动耗时和编码积压；
+            # 捕获本身掉帧时也会计入，因此只是估算值
+            dedup_frames = max(int(out_time_seconds * self.input_framerate) + 1 - frame, 0)
+        return {
+            'time': time.time(),
+            'frame': frame,
+            'fps': parse_float(raw.get('fps')),
+            'bitrate_kbps': parse_bitrate(raw.get('bitrate')),
+            'total_size': parse_int(raw.get('total_size')),
+            'out_time_seconds': out_time_seconds,
+            'dup_frames': parse_int(raw.get('dup_frames')),
+            'drop_frames': parse_int(raw.get('drop_frames')),
+            'dedup_frames': dedup_frames,
+            'speed': parse_speed(raw.get('speed')),
+            'progress': raw.get('progress'),
+        }
+
+    def check_speed(self, sample):
+        """编码速度跌破1.0x是过载的第一个信号，状态变化时记录日志"""
+        speed = sample.get('speed')
+        if speed is None:
+            return
+        if speed < 1.0 and not self.below_realtime:
+            self.below_realtime = True
+            self.logger.warning(f"会话 {self.session_id} 编码速度低于实时: {speed:.2f}x")
+        elif speed >= 1.0 and self.below_realtime:
+            self.below_realtime = False
+            self.logger.info(f"会话 {self.session_id} 编码速度恢复: {speed:.2f}x")
+
+    def snapshot(self):
+        """返回最新采样及滚动历史的副本"""
+        return {
+            'latest': self.latest,
+            'history': list(self.history),
+            'below_realtime': self.below_realtime,
+        }
+
+    def recent_samples(self, samples=10, warmup=0):
+        """最近若干个采样，跳过本次启动后的前 warmup 个（启动阶段速度偏低，不代表稳定状态）"""
+        steady = min(self.sample_count - warmup, samples, len(self.history))
+        if steady <= 0:
+            return []
+        return list(self.history)[-steady:]
+
+    def average_speed(self, samples=10, warmup=0):
+        """最近若干个采样的平均编码速度"""
+        speeds = [s['speed'] for s in self.recent_samples(samples, warmup) if s.get('speed') is not None]
+        if not speeds:
+            return None
+        return sum(speeds) / len(speeds)
+
+    def frame_loss(self, samples=10, warmup=0):
+        """
+        最近若干个采样期间新增的丢帧和重复帧数
+
+        dup_frames/drop_frames 是累计值，取窗口首尾之差；采样不足两个时返回None。
+        """
+        window = self.recent_samples(samples, warmup)
+        if len(window) < 2:
+            return None
+        first, last = window[0], window[-1]
+        return sum((last.get(key) or 0) - (first.get(key) or 0) for key in ('dup_frames', 'drop_frames'))
@@ -1,70 +1,753 @@
 import subprocess
 import os
 import sys
-from threading import Thread
-from recorder.ffmpeg_helper import generate_ffmpeg_cmd
+import copy
+import json
+import time
+import tempfile
+import uuid
+import logging
+from collections import deque
+from threading import Thread, Lock, Event
+from recorder.ffmpeg_helper import (generate_ffmpeg_cmd, get_output_pixel_rate, is_stream_copy, is_audio_only,
+                                    encodes_video, get_output_extension, get_audio_extension,
+                                    build_audio_input_args)
+from recorder.end_detector import EndDetector
+from recorder.storage import StorageWatchdog, staging_mover, get_staging_dir
+from recorder.resource_sampler import ResourceSampler
+from recorder.size_predictor import size_predictor
+from recorder.cpu_allocator import cpu_allocator
+from recorder.encoder_probe import encoder_capabilities
+from recorder.segments import SegmentManifest, get_segment_size_bytes, get_segment_seconds
+from recorder.progress import ProgressStats
+from recorder.speed_controller import SpeedController
+from recorder.transcode_queue import transcode_queue, INTERMEDIATE_TAG
+from recorder.postprocess import postprocess_pool
 from datetime import datetime
 
-class Recorder:
-    def __init__(self):
+# 会话生命周期状态
+STATE_PENDING = 'pending'
+STATE_RECORDING = 'recording'
+STATE_STOPPING = 'stopping'
+STATE_STOPPED = 'stopped'
+STATE_FAILED = 'failed'
+
+
+# 分段清单轮询间隔（秒）
+SEGMENT_POLL_INTERVAL = 2
+# 有待应用的编码参数时，在距分段边界不足该时长（秒）时结束FFmpeg，并缩短轮询间隔
+RECONFIGURE_LEAD = 1
+RECONFIGURE_POLL_INTERVAL = 0.5
+# 停止录制时等待FFmpeg优雅退出的最长时间（秒），超时后强制结束
+STOP_TIMEOUT = 30
+# FFmpeg异常退出后重启的退避时间（秒），逐次翻倍，不超过 supervisor_max_backoff
+RESTART_BACKOFF = 1
+# FFmpeg连续运行超过该时长（秒）视为已恢复稳定，退避时间重新计算
+STABLE_SECONDS = 60
+
+
+def format_timestamp(ts):
+    """精确到毫秒的时间字符串"""
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+
+
+def build_output_basename(config, session_id):
+    """生成不会冲突的输出文件基础名（同一秒启动的多个会话通过会话ID区分）"""
+    safe_time = config.get('start_time', 'record').replace(':', '-').replace(' ', '_')
+    return f"webVideos_{safe_time}_{session_id}"
+
+
+def build_output_filename(config, session_id):
+    basename = build_output_basename(config, session_id)
+    if config.get('segment_enabled', False):
+        # 分段模式使用带序号的文件名模板
+        basename = f"{basename}_%03d"
+    if config.get('two_stage_capture', False) and encodes_video(config):
+        # 两段式录制先写中间文件，后台转码后得到去掉标记的最终文件
+        basename += INTERMEDIATE_TAG
+    return f"{basename}.{get_output_extension(config)}"
+
+
+class RecordingSession:
+    """单个录制会话：拥有独立的会话ID、输出路径、配置快照、状态和FFmpeg进程"""
+
+    def __init__(self, session_id, config):
+        self.session_id = session_id
+        # 保存配置快照，避免界面后续修改配置影响正在进行的录制
+        self.config = copy.deepcopy(config)
+        # 会话运行中两段式录制、编码能力降级、自适应速度等会改写 self.config，这里保留启动时请求的配置
+        self.requested_config = copy.deepcopy(config)
+        # 最终保存目录；分段录制设置了暂存目录时分段先写入暂存目录，关闭后移动到保存目录
+        self.final_dir = self.config.get('save_path', './videos')
+        self.staging_dir = get_staging_dir(self.config)
+        self.output_dir = self.staging_dir or self.final_dir
+        # 暂存空间不足时由看门狗置位，下次启动FFmpeg时改为直接写入保存目录
+        self.unstage_requested = False
+        self.output_file = os.path.join(self.output_dir, build_output_filename(self.config, session_id))
+        # 单文件录制在FFmpeg重启后写入新的分卷文件，这里按顺序记录全部分卷
+        self.parts = [self.output_file]
+        self.audio_files = []
+        # 预览缩略图写入临时目录，不混入录制文件；直录和仅录音频没有可用的画面
+        self.preview_file = None
+        if self.config.get('preview_enabled', True) and encodes_video(self.config):
+            self.preview_file = os.path.join(tempfile.gettempdir(), 'webvideo_preview', f"{session_id}.jpg")
+        self.gaps = []
+        self.open_gap = None
+        self.restart_count = 0
+        self.state = STATE_PENDING
         self.process = None
-        self.recording = False
         self.thread = None
+        self.started_at = None
+        self.stopped_at = None
+        self.return_code = None
+        self.stop_event = Event()
+        self.rollover_event = Event()
+        self.stats = ProgressStats(session_id, input_framerate=self.get_vfr_input_framerate())
+        # 结束检测：解析静止画面/黑屏/静音检测滤镜的日志（直录模式下流结束时FFmpeg会自行退出）
+        self.end_detector = None
+        if self.config.get('end_detection', False) and not is_stream_copy(self.config):
+            self.end_detector = EndDetector(session_id, has_audio=bool(build_audio_input_args(self.config)),
+                                            has_video=not is_audio_only(self.config))
+        self.pending_reconfigure = None
+        self.finish_listeners = []
+        self.launch_listeners = []
+        self.finished = False
+        # 需要一并统计资源的其他进程（如浏览器驱动），其子进程会被自动纳入
+        self.extra_pids = []
+        self.resource_summary = None
+        self.listener_lock = Lock()
+        self.logger = logging.getLogger(__name__)
+        self.two_stage = bool(self.config.get('two_stage_capture', False)) and encodes_video(self.config)
+        self.archive_encoding = None
+        # 中间文件路径 -> 后台转码任务ID，供后处理任务声明依赖
+        self.transcode_jobs = {}
+        if self.two_stage:
+            self.apply_two_stage_capture()
+        else:
+            self.apply_encoder_capabilities()
+        if self.config.get('vfr_mode', False):
+            # 旧版FFmpeg没有 -fps_mode，回退到 -vsync
+            self.config['ffmpeg_fps_mode'] = encoder_capabilities.supports_fps_mode()
 
-    def start_recording(self, config):
-        if self.recording:
-            return False
-        output_dir = config.get('save_path', './videos')
-        os.makedirs(output_dir, exist_ok=True)
-        safe_time = config.get('start_time', 'record').replace(':', '-').replace(' ', '_')
-        filename = f"webVideos_{safe_time}.{config.get('video_format', 'mkv')}"
-        output_file = os.path.join(output_dir, filename)
-        cmd = generate_ffmpeg_cmd(config, output_file)
-        print("[DEBUG] FFmpeg命令：", " ".join(cmd))  # 打印命令
-        def run():
-            # 设置输出重定向目标
-            creationflags = 0
-            if sys.platform == "win32":
-                creationflags = subprocess.CREATE_NO_WINDOW
-                # Windows系统，将输出重定向到NUL设备
-                devnull = open('NUL', 'w')
-            else:
-                # Linux/Mac系统，将输出重定向到/dev/null
-                devnull = open('/dev/null', 'w')
-                
-            try:
-                # 直接将FFmpeg的输出重定向到空设备，不创建日志文件
-                self.process = subprocess.Popen(
-                    cmd, stdout=devnull, stderr=devnull, stdin=subprocess.PIPE,
-                    creationflags=creationflags
-                )
-                self.process.communicate()
-            finally:
-                # 确保关闭devnull文件句柄
-                devnull.close()
-                
-            self.recording = False
-        self.thread = Thread(target=run, daemon=True)
-        self.recording = True
+        # 分段模式：FFmpeg写入的分段列表与会话分段清单
+        self.segmented = bool(self.config.get('segment_enabled', False))
+        self.segment_size_limit = get_segment_size_bytes(self.config) if self.segmented else 0
+        self.manifest = None
+        if self.segmented:
+            basename = build_output_basename(self.config, session_id)
+            self.manifest = SegmentManifest(
+                session_id,
+                os.path.join(self.final_dir, f"{basename}.segments.csv"),
+                os.path.join(self.final_dir, f"{basename}.segments.json"),
+                media_dir=self.output_dir,
+            )
+            self.manifest.add_listener(self._store_segment)
+
+    def apply_two_stage_capture(self):
+        """两段式录制：录制时使用廉价的中间编码，原编码设置留给后台转码"""
+        self.archive_encoding = {
+            'video_codec': self.config.get('video_codec', 'h264'),
+            'record_quality': self.config.get('record_quality', '中'),
+            'encoding_profile': self.config.get('encoding_profile', ''),
+            'encoding_overrides': self.config.get('encoding_overrides') or {},
+        }
+        self.config['encoding_profile'] = self.config.get('intermediate_profile') or 'intermediate'
+        self.config['encoding_overrides'] = {}
+
+    def _store_segment(self, segment):
+        """分段完成：分段在暂存目录时先移动到保存目录，再交给下游处理"""
+        if not self.staging_dir or os.path.abspath(os.path.dirname(segment['path'])) != \
+                os.path.abspath(self.staging_dir):
+            self._on_segment_stored(segment)
+            return
+
+        def moved(path):
+            self.manifest.update_path(segment, path)
+            self._on_segment_stored(segment)
+        staging_mover.enqueue(self.session_id, segment['path'],
+                              os.path.join(self.final_dir, segment['file']), moved)
+
+    def is_staging(self):
+        """当前是否写入暂存目录"""
+        return bool(self.staging_dir) and self.output_dir == self.staging_dir
+
+    def stop_staging(self):
+        """暂存空间不足：立即滚动到新分段，新分段直接写入保存目录"""
+        if not self.is_staging() or self.unstage_requested:
+            return
+        self.unstage_requested = True
+        if self.process and self.process.poll() is None and not self.rollover_event.is_set():
+            self.rollover_event.set()
+            self.request_quit(wait=False)
+
+    def apply_staging_switch(self):
+        """FFmpeg重新启动前切换到保存目录；正在写入的分段已由分段列表登记，仍从暂存目录搬运"""
+        if not self.unstage_requested or not self.is_staging():
+            return
+        self.output_dir = self.final_dir
+        self.output_file = os.path.join(self.final_dir, os.path.basename(self.output_file))
+        self.manifest.media_dir = self.final_dir
+        os.makedirs(self.final_dir, exist_ok=True)
+        self.logger.info(f"会话 {self.session_id} 改为直接写入保存目录 {self.final_dir}")
+
+    def _on_segment_stored(self, segment):
+        if self.two_stage:
+            self.enqueue_transcode(segment['path'])
+
+    def bytes_written(self):
+        """会话已写入的字节数：已完成分段、正在写入的文件以及单独的音频文件"""
+        total = 0
+        current = self.current_segment_path() if self.manifest else self.output_file
+        if self.manifest:
+            total += sum(s['size'] for s in self.manifest.segments)
+        if os.path.exists(current):
+            total += os.path.getsize(current)
+        for audio_file in self.audio_files:
+            if os.path.exists(audio_file):
+                total += os.path.getsize(audio_file)
+        return total
+
+    def get_vfr_input_framerate(self):
+        """VFR模式下返回捕获帧率，用于统计去重丢弃的帧数；否则返回None"""
+        if not self.config.get('vfr_mode', False) or not encodes_video(self.config):
+            return None
+        try:
+            return float(self.config.get('framerate', '25'))
+        except (TypeError, ValueError):
+            return None
+
+    def enqueue_transcode(self, path):
+        self.transcode_jobs[path] = transcode_queue.enqueue(
+            path, self.archive_encoding, self.config.get('keep_intermediate', False)
+        )
+
+    def add_launch_listener(self, callback):
+        """FFmpeg每次启动（包括崩溃重启）后调用 callback(session, pid)"""
+        self.launch_listeners.append(callback)
+
+    def add_finish_listener(self, callback):
+        """注册会话结束回调，参数为会话本身；会话已结束时立即调用"""
+        with self.listener_lock:
+            if not self.finished:
+                self.finish_listeners.append(callback)
+                return
+        callback(self)
+
+    def apply_encoder_capabilities(self):
+        """根据编码能力缓存，把无法实时运行的编码器/质量组合降级"""
+        if not self.config.get('encoder_auto_downgrade', True) or not encodes_video(self.config):
+            return
+        video_codec, quality, overrides, reason = encoder_capabilities.select_encoding(
+            self.config, get_output_pixel_rate(self.config)
+        )
+        if reason:
+            self.logger.warning(f"会话 {self.session_id} {reason}")
+            self.config['video_codec'] = video_codec
+            self.config['record_quality'] = quality
+            self.config['encoding_overrides'] = overrides
+
+    def get_audio_file(self):
+        """
+        单独音频文件的路径；未启用时返回None
+
+        每次启动FFmpeg使用新文件，避免滚动分段或崩溃重启时覆盖已录制的音频。
+        """
+        if not self.config.get('separate_audio', False) or not encodes_video(self.config):
+            return None
+        ext = get_audio_extension(self.config)
+        if self.segmented:
+            # 音频文件贯穿整个FFmpeg进程，不能像分段一样及时移走，因此不写入暂存目录
+            basename = build_output_basename(self.config, self.session_id)
+            return os.path.join(self.final_dir, f"{basename}_audio_{self.manifest.next_index():03d}.{ext}")
+        return f"{os.path.splitext(self.output_file)[0]}.audio.{ext}"
+
+    def get_hls_playlist(self):
+        """HLS预览的播放列表路径，每个会话使用hls_dir下的独立子目录；未启用时返回None"""
+        hls_dir = self.config.get('hls_dir', '')
+        if not hls_dir or not encodes_video(self.config):
+            return None
+        session_dir = os.path.join(hls_dir, build_output_basename(self.config, self.session_id))
+        os.makedirs(session_dir, exist_ok=True)
+        return os.path.join(session_dir, 'index.m3u8')
+
+    def build_cmd(self):
+        audio_file = self.get_audio_file()
+        if audio_file:
+            self.audio_files.append(audio_file)
+        hls_playlist = self.get_hls_playlist()
+        if self.segmented:
+            return generate_ffmpeg_cmd(
+                self.config, self.output_file,
+                segment_list=self.manifest.segment_list_path,
+                segment_start_number=self.manifest.next_index(),
+                audio_file=audio_file,
+                hls_playlist=hls_playlist,
+                preview_file=self.preview_file,
+            )
+        return generate_ffmpeg_cmd(self.config, self.output_file, audio_file=audio_file, hls_playlist=hls_playlist,
+                                   preview_file=self.preview_file)
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.preview_file:
+            os.makedirs(os.path.dirname(self.preview_file), exist_ok=True)
+        self.state = STATE_RECORDING
+        self.started_at = datetime.now()
+        self.thread = Thread(target=self._run, daemon=True)
         self.thread.start()
+        if self.segmented:
+            Thread(target=self._watch_segments, daemon=True).start()
+
+    def _run(self):
+        # 设置输出重定向目标
+        creationflags = 0
+        if sys.platform == "win32":
+            creationflags = subprocess.CREATE_NO_WINDOW
+            # Windows系统，将日志输出重定向到NUL设备
+            devnull = open('NUL', 'w')
+        else:
+            # Linux/Mac系统，将日志输出重定向到/dev/null
+            devnull = open('/dev/null', 'w')
+
+        crash_times = deque()
+        backoff = 0
+        try:
+            while True:
+                cmd = self.build_cmd()
+                self.logger.debug(f"会话 {self.session_id} FFmpeg命令：{' '.join(cmd)}")
+                launched_at = time.time()
+                try:
+                    # stdout为 -progress pipe:1 的进度输出；启用结束检测时读取stderr上的检测滤镜日志，否则丢弃
+                    self.process = subprocess.Popen(
+                        cmd, stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE if self.end_detector else devnull,
+                        stdin=subprocess.PIPE, creationflags=creationflags
+                    )
+                except OSError as e:
+                    self.logger.error(f"会话 {self.session_id} 启动FFmpeg失败: {e}")
+                    self.process = None
+                    self.return_code = None
+                else:
+                    for callback in self.launch_listeners:
+                        try:
+                            callback(self, self.process.pid)
+                        except Exception as e:
+                            self.logger.warning(f"FFmpeg启动回调执行失败: {e}")
+                    if self.end_detector:
+                        Thread(target=self._read_stderr, args=(self.process,), daemon=True).start()
+                    # 逐行读取进度，直到FFmpeg退出关闭stdout
+                    for line in self.process.stdout:
+                        sample = self.stats.feed_line(line)
+                        if sample and self.open_gap:
+                            self.close_gap(sample['time'])
+                    self.process.wait()
+                    self.return_code = self.process.returncode
+                if self.manifest:
+                    self.manifest.poll()
+                # 按大小滚动或调整编码参数时从下一个分段序号重新启动FFmpeg
+                if self.rollover_event.is_set() and not self.stop_event.is_set():
+                    self.rollover_event.clear()
+                    self.apply_staging_switch()
+                    self.apply_pending_reconfigure()
+                    self.reset_telemetry()
+                    continue
+                if self.stop_event.is_set() or self.return_code == 0 or not self.config.get('supervisor_enabled', True):
+                    break
+
+                # 意外退出：在退避时间后重启到新分段，超过崩溃频率上限则放弃
+                now = time.time()
+                crash_times.append(now)
+                while crash_times and now - crash_times[0] > self.config.get('supervisor_crash_window', 600):
+                    crash_times.popleft()
+                self.begin_gap(now)
+                if self.segmented:
+                    # 崩溃时正在写入的分段不在分段列表中，先登记，避免重启后被同序号覆盖
+                    self.manifest.add_incomplete(self.current_segment_path())
+                if len(crash_times) > self.config.get('supervisor_max_crashes', 5):
+                    self.logger.error(f"会话 {self.session_id} FFmpeg频繁崩溃（{len(crash_times)}次），放弃重启")
+                    break
+                if now - launched_at >= STABLE_SECONDS:
+                    backoff = 0
+                delay = min(RESTART_BACKOFF * 2 ** backoff, self.config.get('supervisor_max_backoff', 30))
+                backoff += 1
+                self.logger.warning(f"会话 {self.session_id} FFmpeg意外退出（返回码 {self.return_code}），"
+                                    f"{delay}秒后重启")
+                if self.stop_event.wait(delay):
+                    break
+                self.prepare_restart()
+        except Exception as e:
+            self.logger.error(f"会话 {self.session_id} 录制线程异常: {e}")
+            self.state = STATE_FAILED
+        finally:
+            # 确保关闭devnull文件句柄
+            devnull.close()
+        if self.open_gap:
+            # 空档一直持续到会话结束
+            self.close_gap(time.time())
+
+        self.stopped_at = datetime.now()
+        if self.preview_file and os.path.exists(self.preview_file):
+            try:
+                os.remove(self.preview_file)
+            except OSError:
+                pass
+        if self.state != STATE_FAILED:
+            # 非主动停止而退出的视为失败
+            self.state = STATE_STOPPED if self.stop_event.is_set() or self.return_code == 0 else STATE_FAILED
+        self.stop_event.set()
+
+        # 使用暂存目录时等待所有分段搬运完成再通知下游
+        if self.staging_dir:
+            staging_mover.wait_idle(self.session_id)
+
+        # 单文件的两段式录制在会话结束后整体转码，分段模式已逐段加入队列
+        if self.two_stage and not self.segmented:
+            for part in self.parts:
+                if os.path.exists(part):
+                    self.enqueue_transcode(part)
+        with self.listener_lock:
+            self.finished = True
+            listeners = list(self.finish_listeners)
+        for callback in listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                self.logger.error(f"会话结束回调执行失败: {e}")
+
+    def reset_telemetry(self):
+        """FFmpeg重启后清空统计与检测状态"""
+        self.stats.reset(self.get_vfr_input_framerate())
+        if self.end_detector:
+            self.end_detector.reset()
+
+    def prepare_restart(self):
+        """崩溃后重启：分段录制从下一个分段序号继续（崩溃时已登记），单文件录制写入新的分卷"""
+        self.restart_count += 1
+        self.apply_staging_switch()
+        self.apply_pending_reconfigure()
+        self.reset_telemetry()
+        if not self.segmented:
+            base, ext = os.path.splitext(self.parts[0])
+            self.output_file = f"{base}_part{self.restart_count}{ext}"
+            self.parts.append(self.output_file)
+            self.save_gaps()
+
+    def begin_gap(self, now):
+        """记录空档开始：以最后一次确认有输出的进度时间为起点"""
+        if self.open_gap:
+            return
+        last_sample = self.stats.latest.get('time') if self.stats.latest else None
+        start = last_sample if last_sample and last_sample <= now else now
+        self.open_gap = {
+            'start': format_timestamp(start),
+            'start_ts': round(start, 3),
+            'end': None,
+            'end_ts': None,
+            'duration': None,
+            'return_code': self.return_code,
+            'segment_index': self.manifest.next_index() if self.manifest else None,
+            'part': None if self.manifest else len(self.parts),
+        }
+        self.gaps.append(self.open_gap)
+        self.save_gaps()
+
+    def close_gap(self, end):
+        gap = self.open_gap
+        self.open_gap = None
+        gap['end'] = format_timestamp(end)
+        gap['end_ts'] = round(end, 3)
+        gap['duration'] = round(end - gap['start_ts'], 3)
+        self.logger.info(f"会话 {self.session_id} 录制已恢复，空档 {gap['duration']} 秒")
+        self.save_gaps()
+
+    def save_gaps(self):
+        """空档写入分段清单；单文件录制写入单独的会话清单，同时记录各分卷"""
+        if self.manifest:
+            self.manifest.update_gaps(self.gaps)
+            return
+        basename = build_output_basename(self.config, self.session_id)
+        path = os.path.join(self.final_dir, f"{basename}.gaps.json")
+        try:
+            os.makedirs(self.final_dir, exist_ok=True)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'session_id': self.session_id, 'parts': self.parts, 'gaps': self.gaps},
+                          f, ensure_ascii=False, indent=2)
+            os.replace(path + '.tmp', path)
+        except Exception as e:
+            self.logger.warning(f"保存空档记录失败: {e}")
+
+    def _read_stderr(self, process):
+        for line in process.stderr:
+            self.end_detector.feed_line(line)
+
+    def _watch_segments(self):
+        """轮询分段清单；设置了大小上限时，当前分段超限就触发滚动；有待应用的编码参数时在分段边界前滚动"""
+        while not self.stop_event.wait(RECONFIGURE_POLL_INTERVAL if self.pending_reconfigure
+                                       else SEGMENT_POLL_INTERVAL):
+            self.manifest.poll()
+            if self.rollover_event.is_set():
+                continue
+            if self.segment_size_limit:
+                current = self.current_segment_path()
+                if os.path.exists(current) and os.path.getsize(current) >= self.segment_size_limit:
+                    self.logger.info(f"会话 {self.session_id} 分段达到大小上限，滚动到新分段")
+                    self.rollover_event.set()
+                    self.request_quit()
+                    continue
+            if self.pending_reconfigure and self.reconfigure_due():
+                self.logger.info(f"会话 {self.session_id} 即将到达分段边界，重启FFmpeg以切换编码参数")
+                self.rollover_event.set()
+                self.request_quit()
+
+    def seconds_to_boundary(self):
+        """
+        距当前分段按时长切分的边界还有多少秒；不按时长切分或尚无进度时返回None
+
+        分段复用器按输出时间戳在 segment_time 的整数倍处切分，每次启动FFmpeg时间戳从0开始。
+        """
+        segment_seconds = get_segment_seconds(self.config)
+        out_time = self.stats.latest.get('out_time_seconds') if self.stats.latest else None
+        if segment_seconds <= 0 or out_time is None:
+            return None
+        return segment_seconds - out_time % segment_seconds
+
+    def reconfigure_due(self):
+        """
+        是否到了切换编码参数的时机
+
+        分段复用器已经打开下一个分段后再重启会留下几乎为空的分段，因此在边界前结束FFmpeg，
+        新进程从下一个分段序号继续。只按大小切分时等待大小滚动；两者都未设置时没有自然边界，立即切换。
+        """
+        if not self.process or self.process.poll() is not None:
+            return False
+        remaining = self.seconds_to_boundary()
+        if remaining is not None:
+            return remaining <= RECONFIGURE_LEAD
+        if get_segment_seconds(self.config) > 0:
+            # 等待第一个进度采样
+            return False
+        return not self.segment_size_limit
+
+    def request_reconfigure(self, overrides, framerate, reason=''):
+        """请求在下一个分段边界应用新的编码覆盖字段和帧率"""
+        self.pending_reconfigure = (overrides, framerate, reason)
+
+    def apply_pending_reconfigure(self):
+        """FFmpeg重新启动前应用待切换的编码参数"""
+        pending = self.pending_reconfigure
+        if not pending:
+            return False
+        self.pending_reconfigure = None
+        overrides, framerate, reason = pending
+        self.config['encoding_overrides'] = overrides
+        if framerate:
+            self.config['framerate'] = str(framerate)
+        self.logger.info(f"会话 {self.session_id} 在分段边界切换编码参数（{reason}）")
+        return True
+
+    def update_capture_rect(self, rect):
+        """
+        播放器区域变化时切换捕获区域
+
+        分段模式下立即滚动到新分段并以新区域继续录制；单文件录制无法中途改变画面尺寸，
+        保持原区域不变。
+        """
+        if not self.segmented or not self.is_recording() or not encodes_video(self.config):
+            return False
+        if self.config.get('capture_rect') == tuple(rect):
+            return False
+        self.config['capture_rect'] = tuple(rect)
+        self.logger.info(f"会话 {self.session_id} 播放器区域变化，切换捕获区域为 {rect}")
+        if self.process and self.process.poll() is None and not self.rollover_event.is_set():
+            self.rollover_event.set()
+            self.request_quit()
+        return True
+
+    def current_segment_path(self):
+        """正在写入的分段文件路径"""
+        return self.output_file % self.manifest.next_index()
+
+    def request_quit(self, timeout=5, wait=True):
+        """向FFmpeg发送 'q' 让其优雅退出，超时则强制结束；wait为False时在后台等待"""
+        process = self.process
+        if not process:
+            return
+        try:
+            if process.stdin:
+                process.stdin.write(b'q')
+                process.stdin.flush()
+        except Exception:
+            process.terminate()
+            return
+        if wait:
+            self._wait_or_terminate(process, timeout)
+        else:
+            Thread(target=self._wait_or_terminate, args=(process, timeout), daemon=True).start()
+
+    def _wait_or_terminate(self, process, timeout):
+        try:
+            process.wait(timeout=timeout)
+        except Exception:
+            self.logger.warning(f"会话 {self.session_id} FFmpeg未在 {timeout} 秒内退出，强制结束")
+            process.terminate()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """
+        停止录制，立即返回
+
+        防崩溃封装下结束时无需回写索引，FFmpeg收到 'q' 后很快退出；
+        等待和超时强制结束在后台进行，最终状态由录制线程在进程退出后设置。
+        """
+        if self.state != STATE_RECORDING:
+            return False
+        self.state = STATE_STOPPING
+        self.stop_event.set()
+        # 优先尝试向 ffmpeg 发送 'q' 让其优雅退出（崩溃重启的等待期间没有运行中的进程）
+        if self.process and self.process.poll() is None:
+            self.request_quit(timeout, wait=False)
         return True
 
-    def stop_recording(self):
-        if self.process and self.recording:
+    def is_recording(self):
+        return self.state in (STATE_RECORDING, STATE_STOPPING)
+
+    def info(self):
+        """返回会话的状态摘要，供界面和其他模块读取"""
+        return {
+            'session_id': self.session_id,
+            'state': self.state,
+            'output_file': self.output_file,
+            'started_at': self.started_at,
+            'stopped_at': self.stopped_at,
+            'return_code': self.return_code,
+            'segments': list(self.manifest.segments) if self.manifest else [],
+            'parts': list(self.parts),
+            'audio_files': list(self.audio_files),
+            'gaps': list(self.gaps),
+            'restarts': self.restart_count,
+            'stats': self.stats.latest,
+        }
+
+
+class RecordingSessionManager:
+    """管理多个并发录制会话，每个会话对应一个独立的FFmpeg进程"""
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = Lock()
+        self.logger = logging.getLogger(__name__)
+        self.speed_controller = SpeedController(self)
+        self.storage_watchdog = StorageWatchdog(self, estimate=size_predictor.estimate_bytes_per_second)
+        self.resource_sampler = ResourceSampler(self)
+        # 后处理进程绑定到录制会话没有占用的核心
+        postprocess_pool.add_process_hook(cpu_allocator.pin_background)
+        # 两段式录制的输出大小在后台转码完成后才能确定
+        postprocess_pool.add_job_listener(size_predictor.on_job_finished)
+
+    def new_session_id(self):
+        return f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+    def start_recording(self, config, session_id=None):
+        """启动一个新的录制会话，返回会话ID；会话ID已在录制中或磁盘空间不足时返回None"""
+        # 磁盘空间准入检查：空间不足时降级或拒绝
+        config = self.storage_watchdog.admit(config)
+        if config is None:
+            return None
+        with self.lock:
+            session_id = session_id or self.new_session_id()
+            existing = self.sessions.get(session_id)
+            if existing and existing.is_recording():
+                return None
+            # 按CPU分配策略为会话划分核心，编码线程数与之匹配
+            allocation = cpu_allocator.allocate(session_id, config)
             try:
-                # 优先尝试向 ffmpeg 发送 'q' 让其优雅退出
-                if self.process.stdin:
-                    self.process.stdin.write(b'q')
-                    self.process.stdin.flush()
-                self.process.wait(timeout=5)
+                if allocation:
+                    config = dict(config, encoder_threads=allocation.threads)
+                session = RecordingSession(session_id, config)
+                if allocation:
+                    session.add_launch_listener(lambda s, pid: cpu_allocator.apply(s.session_id, [pid]))
+                    session.add_finish_listener(lambda s: cpu_allocator.release(s.session_id))
             except Exception:
-                self.process.terminate()
-            self.process = None
-            self.recording = False
-            return True
-        return False
+                # 会话没能创建，释放已预留的核心，否则后续会话一直被挤占
+                cpu_allocator.release(session_id)
+                raise
+            # 会话结束后自动生成拼接、重新封装等后处理任务
+            session.add_finish_listener(postprocess_pool.on_session_finished)
+            session.add_finish_listener(self.resource_sampler.finish_session)
+            session.add_finish_listener(size_predictor.on_session_finished)
+            self.sessions[session_id] = session
+        session.start()
+        self.logger.info(f"录制会话已启动: {session_id} -> {session.output_file}")
+        self.storage_watchdog.ensure_running()
+        if session.config.get('resource_sampling', True):
+            self.resource_sampler.ensure_running()
+        if session.segmented and session.config.get('adaptive_speed', True) and encodes_video(session.config):
+            self.speed_controller.ensure_running()
+        return session_id
+
+    def stop_recording(self, session_id):
+        session = self.get_session(session_id)
+        if not session:
+            return False
+        stopped = session.stop()
+        if stopped:
+            self.logger.info(f"录制会话正在停止: {session_id}")
+        return stopped
+
+    def update_capture_rect(self, session_id, rect):
+        session = self.get_session(session_id)
+        return session.update_capture_rect(rect) if session else False
+
+    def attach_process_ids(self, session_id, pids):
+        """把浏览器等进程计入会话的资源统计"""
+        session = self.get_session(session_id)
+        if session:
+            session.extra_pids = [pid for pid in pids if pid]
+            # 浏览器与会话的FFmpeg使用同一组核心，优先级保持默认
+            cpu_allocator.apply(session_id, session.extra_pids, priority=False)
+
+    def stop_all(self):
+        for session_id in list(self.sessions.keys()):
+            self.stop_recording(session_id)
+
+    def get_session(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def is_recording(self, session_id=None):
+        """指定会话ID时返回该会话状态，否则返回是否有任意会话在录制"""
+        if session_id is not None:
+            session = self.get_session(session_id)
+            return bool(session and session.is_recording())
+        return bool(self.active_sessions())
+
+    def active_sessions(self):
+        with self.lock:
+            return [s for s in self.sessions.values() if s.is_recording()]
+
+    def get_end_signals(self, session_id):
+        """获取会话的直播结束检测信号，未启用检测时返回None"""
+        session = self.get_session(session_id)
+        if not session or not session.end_detector:
+            return None
+        return session.end_detector.signals()
+
+    def get_preview_path(self, session_id):
+        """会话最新预览缩略图的路径，尚未生成或未启用时返回None"""
+        session = self.get_session(session_id)
+        if not session or not session.preview_file or not session.is_recording():
+            return None
+        return session.preview_file if os.path.exists(session.preview_file) else None
+
+    def get_stats(self, session_id):
+        """获取会话的实时编码统计（最新采样与滚动历史）"""
+        session = self.get_session(session_id)
+        return session.stats.snapshot() if session else None
+
+    def remove_finished(self):
+        """清理已经结束的会话记录"""
+        with self.lock:
+            for session_id in [k for k, s in self.sessions.items() if not s.is_recording()]:
+                del self.sessions[session_id]
 
-    def is_recording(self):
-        return self.recording
 
-recorder_instance = Recorder() 
\ No newline at end of file
+session_manager = RecordingSessionManager()
@@ -0,0 +1,218 @@
+import os
+import csv
+import json
+import time
+import logging
+import psutil
+from threading import Thread, Event, Lock
+
+SAMPLE_INTERVAL = 5         # 采样间隔（秒）
+
+# 时间序列CSV的列：时间戳、进程数、线程数、CPU%、RSS/USS(MB)、累计读写(KB)，以及FFmpeg/浏览器各自的CPU%和RSS
+SERIES_FIELDS = [
+    'time', 'procs', 'threads', 'cpu', 'rss_mb', 'uss_mb', 'read_kb', 'write_kb',
+    'ffmpeg_cpu', 'ffmpeg_rss_mb', 'browser_cpu', 'browser_rss_mb',
+]
+
+
+def get_resources_dir():
+    """资源统计保存在用户本地目录，便于汇总所有会话做容量规划"""
+    appdata_dir = os.environ.get('APPDATA', '') or os.path.expanduser('~')
+    return os.path.join(appdata_dir, 'WebVideoRecorder', 'resources')
+
+
+class SessionResources:
+    """单个会话的进程树采样状态与累计值"""
+
+    def __init__(self, session_id, series_path):
+        self.session_id = session_id
+        self.series_path = series_path
+        self.processes = {}
+        self.last_io = {}
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.samples = 0
+        self.cpu_seconds = {'ffmpeg': 0.0, 'browser': 0.0}
+        self.peak = {'cpu': 0.0, 'rss': 0, 'uss': 0, 'threads': 0, 'procs': 0}
+        self.cpu_total = 0.0
+        self.started_at = time.time()
+
+    def get_process(self, pid):
+        """缓存psutil进程对象，cpu_percent依赖上一次调用的基准"""
+        process = self.processes.get(pid)
+        if process is None:
+            process = psutil.Process(pid)
+            process.cpu_percent(interval=None)
+            self.processes[pid] = process
+        return process
+
+
+def collect_tree(root_pids):
+    """展开根进程及其所有子进程的PID"""
+    pids = []
+    for pid in root_pids:
+        try:
+            root = psutil.Process(pid)
+            pids.append(pid)
+            pids += [child.pid for child in root.children(recursive=True)]
+        except psutil.Error:
+            continue
+    return list(dict.fromkeys(pids))
+
+
+class ResourceSampler:
+    """
+    会话资源采样器
+
+    按固定间隔统计每个会话完整进程树（FFmpeg，以及chromedriver/Chrome及其渲染进程）
+    的CPU、RSS/USS、I/O字节和线程数，追加到会话的CSV时间序列；
+    会话结束时写入汇总，供评估单机容量使用。
+    """
+
+    def __init__(self, session_manager, interval=SAMPLE_INTERVAL, output_dir=None):
+        self.session_manager = session_manager
+        self.interval = interval
+        self.output_dir = output_dir or get_resources_dir()
+        self.states = {}
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+        self.logger = logging.getLogger(__name__)
+
+    def ensure_running(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            for session in self.session_manager.active_sessions():
+                if not session.config.get('resource_sampling', True):
+                    continue
+                try:
+                    self.sample_session(session)
+                except Exception as e:
+                    self.logger.error(f"采样会话 {session.session_id} 资源失败: {e}")
+
+    def get_state(self, session):
+        with self.lock:
+            state = self.states.get(session.session_id)
+            if state is None:
+                os.makedirs(self.output_dir, exist_ok=True)
+                state = SessionResources(session.session_id,
+                                         os.path.join(self.output_dir, f"{session.session_id}.csv"))
+                self.states[session.session_id] = state
+            return state
+
+    def sample_session(self, session):
+        state = self.get_state(session)
+        process = session.process
+        ffmpeg_pids = collect_tree([process.pid]) if process and process.poll() is None else []
+        browser_pids = [pid for pid in collect_tree(session.extra_pids) if pid not in ffmpeg_pids]
+
+        totals = {'cpu': 0.0, 'rss': 0, 'uss': 0, 'threads': 0}
+        groups = {'ffmpeg': {'cpu': 0.0, 'rss': 0}, 'browser': {'cpu': 0.0, 'rss': 0}}
+        alive = set()
+        for group, pids in (('ffmpeg', ffmpeg_pids), ('browser', browser_pids)):
+            for pid in pids:
+                try:
+                    proc = state.get_process(pid)
+                    with proc.oneshot():
+                        cpu = proc.cpu_percent(interval=None)
+                        memory = proc.memory_info()
+                        threads = proc.num_threads()
+                        try:
+                            uss = proc.memory_full_info().uss
+                        except (psutil.Error, AttributeError):
+                            uss = 0
+                        try:
+                            io = proc.io_counters()
+                        except (psutil.Error, AttributeError):
+                            io = None
+                except psutil.Error:
+                    continue
+                alive.add(pid)
+                totals['cpu'] += cpu
+                totals['rss'] += memory.rss
+                totals['uss'] += uss
+                totals['threads'] += threads
+                groups[group]['cpu'] += cpu
+                groups[group]['rss'] += memory.rss
+                state.cpu_seconds[group] += cpu / 100 * self.interval
+                if io is not None:
+                    # 按进程累计读写增量，进程退出或重启不会丢失已计入的字节
+                    last = state.last_io.get(pid, (0, 0))
+                    state.read_bytes += max(io.read_bytes - last[0], 0)
+                    state.write_bytes += max(io.write_bytes - last[1], 0)
+                    state.last_io[pid] = (io.read_bytes, io.write_bytes)
+        for pid in list(state.processes.keys()):
+            if pid not in alive:
+                del state.processes[pid]
+                state.last_io.pop(pid, None)
+
+        state.samples += 1
+        state.cpu_total += totals['cpu']
+        state.peak['cpu'] = max(state.peak['cpu'], totals['cpu'])
+        state.peak['rss'] = max(state.peak['rss'], totals['rss'])
+        state.peak['uss'] = max(state.peak['uss'], totals['uss'])
+        state.peak['threads'] = max(state.peak['threads'], totals['threads'])
+        state.peak['procs'] = max(state.peak['procs'], len(alive))
+
+        row = [
+            int(time.time()), len(alive), totals['threads'], round(totals['cpu'], 1),
+            round(totals['rss'] / 1048576, 1), round(totals['uss'] / 1048576, 1),
+            state.read_bytes // 1024, state.write_bytes // 1024,
+            round(groups['ffmpeg']['cpu'], 1), round(groups['ffmpeg']['rss'] / 1048576, 1),
+            round(groups['browser']['cpu'], 1), round(groups['browser']['rss'] / 1048576, 1),
+        ]
+        write_header = not os.path.exists(state.series_path)
+        with open(state.series_path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            if write_header:
+                writer.writerow(SERIES_FIELDS)
+            writer.writerow(row)
+
+    def finish_session(self, session):
+        """会话结束：写入资源汇总并清理采样状态"""
+        with self.lock:
+            state = self.states.pop(session.session_id, None)
+        if not state or not state.samples:
+            return None
+        summary = {
+            'session_id': session.session_id,
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(state.started_at)),
+            'duration_seconds': int(time.time() - state.started_at),
+            'samples': state.samples,
+            'interval': self.interval,
+            'video_codec': session.config.get('video_codec'),
+            'record_quality': session.config.get('record_quality'),
+            'resolution': session.config.get('resolution'),
+            'framerate': session.config.get('framerate'),
+            'capture_mode': session.config.get('capture_mode', 'screen'),
+            'cpu_policy': session.config.get('cpu_policy', 'off'),
+            'encoder_threads': session.config.get('encoder_threads'),
+            'avg_cpu_percent': round(state.cpu_total / state.samples, 1),
+            'peak_cpu_percent': round(state.peak['cpu'], 1),
+            'cpu_seconds': {k: round(v, 1) for k, v in state.cpu_seconds.items()},
+            'peak_rss_mb': round(state.peak['rss'] / 1048576, 1),
+            'peak_uss_mb': round(state.peak['uss'] / 1048576, 1),
+            'peak_threads': state.peak['threads'],
+            'peak_processes': state.peak['procs'],
+            'read_bytes': state.read_bytes,
+            'write_bytes': state.write_bytes,
+            'series': state.series_path,
+        }
+        session.resource_summary = summary
+        try:
+            with open(os.path.join(self.output_dir, 'summaries.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+        except Exception as e:
+            self.logger.warning(f"保存资源汇总失败: {e}")
+        self.logger.info(f"会话 {session.session_id} 资源汇总: 平均CPU {summary['avg_cpu_percent']}%，"
+                         f"峰值内存 {summary['peak_rss_mb']}MB")
+        return summary
@@ -0,0 +1,153 @@
+import os
+import csv
+import json
+import logging
+from threading import Lock
+from datetime import datetime
+
+
+def get_segment_seconds(config):
+    """分段时长（秒），0表示不按时长切分"""
+    try:
+        return max(0, int(float(config.get('segment_minutes', 0)) * 60))
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_segment_size_bytes(config):
+    """分段大小上限（字节），0表示不按大小切分"""
+    try:
+        return max(0, int(float(config.get('segment_size_mb', 0)) * 1024 * 1024))
+    except (TypeError, ValueError):
+        return 0
+
+
+class SegmentManifest:
+    """
+    会话分段清单
+
+    FFmpeg的segment复用器每关闭一个分段就向csv列表追加一行，
+    这里增量读取该列表，把已完成的分段记录到json清单中，并通知监听者，
+    下游任务可以在分段关闭后立即处理，而不必等整个会话结束。
+    """
+
+    def __init__(self, session_id, segment_list_path, manifest_path, media_dir=None):
+        self.session_id = session_id
+        self.segment_list_path = segment_list_path
+        self.manifest_path = manifest_path
+        # 分段文件所在目录，默认与分段列表相同（使用暂存目录时两者不同）
+        self.media_dir = media_dir or os.path.dirname(segment_list_path)
+        self.segments = []
+        # FFmpeg异常退出到重新开始录制之间的空档
+        self.gaps = []
+        self.listeners = []
+        self.lock = Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def add_listener(self, callback):
+        """注册分段完成回调，参数为分段信息字典"""
+        self.listeners.append(callback)
+
+    def next_index(self):
+        with self.lock:
+            if not self.segments:
+                return 0
+            return self.segments[-1]['index'] + 1
+
+    def poll(self):
+        """读取FFmpeg分段列表中新完成的分段，返回新分段列表"""
+        if not os.path.exists(self.segment_list_path):
+            return []
+        try:
+            with open(self.segment_list_path, 'r', encoding='utf-8', newline='') as f:
+                rows = [row for row in csv.reader(f) if len(row) >= 3]
+        except Exception as e:
+            self.logger.warning(f"读取分段列表失败: {e}")
+            return []
+
+        new_segments = []
+        with self.lock:
+            known = {s['file'] for s in self.segments}
+            for row in rows:
+                name = row[0]
+                if name in known:
+                    continue
+                try:
+                    start, end = float(row[1]), float(row[2])
+                except ValueError:
+                    # FFmpeg正在写入的行可能不完整，下次读取时再处理
+                    continue
+                path = os.path.join(self.media_dir, name)
+                segment = {
+                    'index': len(self.segments),
+                    'file': name,
+                    'path': path,
+                    'start': start,
+                    'end': end,
+                    'size': os.path.getsize(path) if os.path.exists(path) else 0,
+                    'closed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                }
+                self.segments.append(segment)
+                new_segments.append(segment)
+                known.add(name)
+            if new_segments:
+                self.save()
+
+        self.notify(new_segments)
+        return new_segments
+
+    def add_incomplete(self, path):
+        """
+        登记FFmpeg异常退出时正在写入的分段
+
+        该分段没有写入分段列表，不登记的话重启后会以相同序号覆盖它。
+        """
+        if not os.path.exists(path):
+            return None
+        with self.lock:
+            segment = {
+                'index': len(self.segments),
+                'file': os.path.basename(path),
+                'path': path,
+                'start': None,
+                'end': None,
+                'size': os.path.getsize(path),
+                'closed_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'incomplete': True,
+            }
+            self.segments.append(segment)
+            self.save()
+        self.notify([segment])
+        return segment
+
+    def notify(self, segments):
+        for segment in segments:
+            self.logger.info(f"会话 {self.session_id} 分段完成: {segment['file']}")
+            for callback in self.listeners:
+                try:
+                    callback(segment)
+                except Exception as e:
+                    self.logger.error(f"分段回调执行失败: {e}")
+
+    def update_path(self, segment, path):
+        """分段文件被移动后更新清单中的路径"""
+        with self.lock:
+            segment['path'] = path
+            self.save()
+
+    def update_gaps(self, gaps):
+        """更新空档记录并保存清单"""
+        with self.lock:
+            self.gaps = gaps
+            self.save()
+
+    def save(self):
+        data = {
+            'session_id': self.session_id,
+            'segments': self.segments,
+            'gaps': self.gaps,
+        }
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,252 @@
+import os
+import json
+import logging
+from threading import Lock
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from recorder.ffmpeg_helper import is_stream_copy, is_audio_only
+from recorder.storage import estimate_bytes_per_second, get_free_bytes, get_reserve_bytes
+from recorder.postprocess import postprocess_pool, JOB_DONE, JOB_FAILED
+
+MIN_LEARN_SECONDS = 60      # 短于该时长的录制不参与学习，启动开销占比过大
+HISTORY_SIZE = 20           # 每个组合保留的最近录制数
+SCHEDULE_WINDOW_DAYS = 7    # 默认的排期预测窗口（天）
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+logger = logging.getLogger(__name__)
+
+
+def get_history_path():
+    """学习数据保存在用户本地目录，跨版本升级保留"""
+    appdata_dir = os.environ.get('APPDATA', '') or os.path.expanduser('~')
+    return os.path.join(appdata_dir, 'WebVideoRecorder', 'size_history.json')
+
+
+def get_channel(config):
+    """直播间标识：网页地址的域名和路径；纯录屏时为 'screen'"""
+    url = config.get('douyin_url', '')
+    if config.get('silent_mode', False) or not url:
+        return 'screen'
+    parsed = urlparse(url if '://' in url else 'https://' + url)
+    return f"{parsed.netloc}{parsed.path}".rstrip('/') or 'screen'
+
+
+def get_profile_key(config):
+    """
+    决定输出大小的参数组合：编码、质量、分辨率、帧率
+
+    直录的大小只取决于平台推流，仅录音频只取决于音频编码和码率。
+    """
+    if is_stream_copy(config):
+        return 'copy'
+    if is_audio_only(config):
+        return f"audio/{config.get('audio_codec', 'aac')}/{config.get('audio_bitrate', '128k')}"
+    parts = [
+        config.get('video_codec', 'h264'), config.get('record_quality', '中'),
+        config.get('resolution', 'window'), str(config.get('framerate', '15')),
+    ]
+    if config.get('vfr_mode', False):
+        parts.append('vfr')
+    if config.get('separate_audio', False):
+        parts.append('separate_audio')
+    return '/'.join(parts)
+
+
+def get_session_bytes(session):
+    """会话最终写入的字节数：分段清单中的各分段或各分卷，加上单独的音频文件"""
+    if session.manifest:
+        total = sum(s.get('size', 0) for s in session.manifest.segments)
+    else:
+        total = sum(os.path.getsize(p) for p in session.parts if os.path.exists(p))
+    total += sum(os.path.getsize(p) for p in session.audio_files if os.path.exists(p))
+    return total
+
+
+def get_session_seconds(session):
+    """会话实际录制的秒数，扣除FFmpeg崩溃重启的空档"""
+    if not session.started_at or not session.stopped_at:
+        return 0
+    seconds = (session.stopped_at - session.started_at).total_seconds()
+    seconds -= sum(gap.get('duration') or 0 for gap in session.gaps)
+    return max(seconds, 0)
+
+
+def get_schedule_occurrences(config, window_days=SCHEDULE_WINDOW_DAYS, now=None):
+    """
+    排期窗口内的所有录制开始时间
+
+    与 TaskScheduler 的规则一致：单次任务只有配置的开始时间，
+    循环任务按每天或勾选的星期在同一时刻重复。
+    """
+    now = now or datetime.now()
+    end = now + timedelta(days=window_days)
+    try:
+        start_time = datetime.strptime(config.get('start_time', ''), '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return []
+    duration = timedelta(minutes=config.get('duration_minutes', 60))
+    occurrences = []
+    if start_time + duration > now and start_time < end:
+        occurrences.append(start_time)
+    if not config.get('enable_recurring', False):
+        return occurrences
+
+    recurring_days = config.get('recurring_days', {})
+    everyday = recurring_days.get('everyday', False)
+    enabled = {WEEKDAYS.index(day) for day in WEEKDAYS if recurring_days.get(day, False)}
+    day = max(start_time, now).replace(hour=start_time.hour, minute=start_time.minute,
+                                       second=start_time.second, microsecond=0)
+    while day < end:
+        if day > start_time and day + duration > now and (everyday or day.weekday() in enabled):
+            occurrences.append(day)
+        day += timedelta(days=1)
+    return occurrences
+
+
+class SizePredictor:
+    """
+    输出大小预测器
+
+    会话结束时按 (参数组合, 直播间) 记录最终归档文件的字节数和录制秒数，
+    预测时依次使用：同一直播间同一参数的历史、其他直播间同一参数的历史、按码率估算。
+    参数组合取自会话启动时请求的配置（会话运行中两段式录制、降速等会改写配置）；
+    两段式录制等后台转码全部结束后，按转码输出的大小记录。
+    """
+
+    def __init__(self, history_path=None):
+        self.history_path = history_path or get_history_path()
+        self.history = {}
+        # 等待后台转码的会话：转码任务ID -> 待记录项
+        self.pending = {}
+        self.lock = Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.history_path, 'r', encoding='utf-8') as f:
+                self.history = json.load(f)
+        except FileNotFoundError:
+            self.history = {}
+        except Exception as e:
+            logger.warning(f"读取录制大小历史失败: {e}")
+            self.history = {}
+
+    def save_locked(self):
+        os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+        tmp_path = self.history_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.history, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.history_path)
+
+    def record(self, config, total_bytes, seconds):
+        """记录一次完成的录制"""
+        if seconds < MIN_LEARN_SECONDS or total_bytes <= 0:
+            return
+        profile = get_profile_key(config)
+        channel = get_channel(config)
+        with self.lock:
+            samples = self.history.setdefault(profile, {}).setdefault(channel, [])
+            samples.append({
+                'bytes': int(total_bytes),
+                'seconds': round(seconds, 1),
+                'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            del samples[:-HISTORY_SIZE]
+            try:
+                self.save_locked()
+            except Exception as e:
+                logger.warning(f"保存录制大小历史失败: {e}")
+
+    def on_session_finished(self, session):
+        """会话结束监听器：失败的会话同样计入，它们也占用了磁盘"""
+        config = session.requested_config
+        seconds = get_session_seconds(session)
+        job_ids = set(session.transcode_jobs.values()) if session.two_stage else set()
+        if not job_ids:
+            self.record(config, get_session_bytes(session), seconds)
+            return
+        # 中间文件的大小与归档编码无关，等转码完成后按输出大小记录；单独的音频文件不参与转码
+        audio_bytes = sum(os.path.getsize(p) for p in session.audio_files if os.path.exists(p))
+        entry = {'config': config, 'seconds': seconds, 'bytes': audio_bytes, 'jobs': job_ids, 'failed': False}
+        with self.lock:
+            for job_id in job_ids:
+                self.pending[job_id] = entry
+        # 分段录制的转码任务可能在会话结束前就已完成；已从任务队列中清理的视为结果未知
+        for job_id in job_ids:
+            job = postprocess_pool.get_job(job_id) or {'id': job_id}
+            if job.get('status', JOB_FAILED) in (JOB_DONE, JOB_FAILED):
+                self.on_job_finished(job)
+
+    def on_job_finished(self, job):
+        """后处理任务监听器：会话的转码任务全部结束后记录；有任务失败时不记录"""
+        with self.lock:
+            entry = self.pending.pop(job['id'], None)
+            if entry is None:
+                return
+            entry['jobs'].discard(job['id'])
+            if job.get('output_size') is None:
+                entry['failed'] = True
+            else:
+                entry['bytes'] += job['output_size']
+            if entry['jobs']:
+                return
+        if not entry['failed']:
+            self.record(entry['config'], entry['bytes'], entry['seconds'])
+
+    def bytes_per_second(self, config):
+        """预测写入速率（字节/秒），返回 (速率, 来源, 样本数)；来源为 channel、profile 或 estimate"""
+        profile = get_profile_key(config)
+        channel = get_channel(config)
+        with self.lock:
+            channels = self.history.get(profile, {})
+            samples = channels.get(channel)
+            source = 'channel'
+            if not samples:
+                samples = [s for items in channels.values() for s in items]
+                source = 'profile'
+            total_bytes = sum(s['bytes'] for s in samples)
+            total_seconds = sum(s['seconds'] for s in samples)
+        if total_seconds > 0:
+            return total_bytes / total_seconds, source, len(samples)
+        return estimate_bytes_per_second(config), 'estimate', 0
+
+    def estimate_bytes_per_second(self, config):
+        """供磁盘看门狗使用，与 storage.estimate_bytes_per_second 签名一致"""
+        return self.bytes_per_second(config)[0]
+
+    def predict(self, config, seconds=None):
+        """预测单次录制的输出大小"""
+        if seconds is None:
+            seconds = float(config.get('duration_minutes', 60)) * 60
+        rate, source, samples = self.bytes_per_second(config)
+        return {
+            'bytes': int(rate * seconds),
+            'bytes_per_minute': int(rate * 60),
+            'seconds': seconds,
+            'source': source,
+            'samples': samples,
+        }
+
+    def predict_schedule(self, config, window_days=SCHEDULE_WINDOW_DAYS, now=None):
+        """预测排期窗口内所有录制的磁盘需求，并与保存目录的可用空间比较"""
+        occurrences = get_schedule_occurrences(config, window_days, now)
+        single = self.predict(config)
+        total = single['bytes'] * len(occurrences)
+        path = config.get('save_path', './videos')
+        try:
+            available = get_free_bytes(path) - get_reserve_bytes(config)
+        except OSError:
+            available = None
+        return {
+            'window_days': window_days,
+            'recordings': len(occurrences),
+            'occurrences': [t.strftime('%Y-%m-%d %H:%M:%S') for t in occurrences],
+            'per_recording': single,
+            'total_bytes': total,
+            'available_bytes': available,
+            'fits': available is None or total <= available,
+        }
+
+
+size_predictor = SizePredictor()
@@ -0,0 +1,161 @@
+import logging
+import psutil
+from threading import Thread, Event
+from recorder.profiles import profile_registry, get_profile_name, PRESET_LADDER
+from recorder.ffmpeg_helper import encodes_video
+
+# VP9/AV1以数值控制编码速度，数值越大越快
+NUMERIC_SPEED_FIELDS = {
+    'libvpx-vp9': ('speed', 8),
+    'libaom-av1': ('cpu_used', 8),
+}
+
+# 预设用尽后按该比例降低帧率，且不低于最低帧率
+FRAMERATE_STEP = 0.75
+MIN_FRAMERATE = 10
+
+# 控制器参数
+CHECK_INTERVAL = 5           # 检查间隔（秒）
+SLOW_SPEED = 0.95            # 平均速度低于该值视为跟不上实时；实时捕获的速度在1.0x附近抖动，留出容差
+SPEED_SAMPLES = 10           # 参与平均的最近采样数（约5秒）
+WARMUP_SAMPLES = 20          # FFmpeg每次启动（滚动、重启）后忽略的采样数，启动阶段速度偏低
+HIGH_CPU_PERCENT = 90        # 主机CPU高于该值且出现丢帧/重复帧时视为过载
+LOW_CPU_PERCENT = 70         # 主机CPU低于该值且没有丢帧/重复帧才允许回升
+SLOW_CHECKS = 2              # 连续多少次检查偏慢才降档
+FAST_CHECKS = 6              # 连续多少次检查有余量才升档
+
+
+def build_speed_steps(profile, base_framerate):
+    """
+    根据编码配置生成从原始参数到最快参数的档位列表
+
+    每个档位为 (编码覆盖字段, 帧率)，第0档即原始配置。
+    先逐级提高编码预设速度，预设用尽后再逐级降低帧率。
+    """
+    encoder = profile.get('encoder')
+    steps = [({}, base_framerate)]
+    if encoder in ('libx264', 'libx265'):
+        # 降档即沿预设阶梯向右移动
+        preset = profile.get('preset', 'medium')
+        start = PRESET_LADDER.index(preset) if preset in PRESET_LADDER else PRESET_LADDER.index('medium')
+        steps += [({'preset': p}, base_framerate) for p in PRESET_LADDER[start + 1:]]
+    elif encoder in NUMERIC_SPEED_FIELDS:
+        field, fastest = NUMERIC_SPEED_FIELDS[encoder]
+        current = int(profile.get(field, 0))
+        steps += [({field: v}, base_framerate) for v in range(current + 1, fastest + 1)]
+
+    last_overrides = steps[-1][0]
+    framerate = base_framerate
+    while framerate * FRAMERATE_STEP >= MIN_FRAMERATE:
+        framerate = int(framerate * FRAMERATE_STEP)
+        steps.append((last_overrides, framerate))
+    return steps
+
+
+class SpeedController:
+    """
+    自适应编码速度控制器
+
+    定期检查各录制会话的平均编码速度和主机CPU负载：持续低于实时则降一档，
+    CPU持续有余量且没有丢帧/重复帧则升一档。实时捕获的编码速度被输入限制在1.0x左右，
+    不能用速度高于实时来判断余量。新参数在会话的下一个分段边界生效，因此只作用于分段录制。
+    """
+
+    def __init__(self, session_manager):
+        self.session_manager = session_manager
+        self.stop_event = Event()
+        self.thread = None
+        self.session_states = {}
+        self.logger = logging.getLogger(__name__)
+
+    def ensure_running(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        # 第一次调用cpu_percent只建立基准
+        psutil.cpu_percent(interval=None)
+        while not self.stop_event.wait(CHECK_INTERVAL):
+            self.check_all(psutil.cpu_percent(interval=None))
+
+    def check_all(self, cpu_percent):
+        """检查所有可调整的会话；新参数只能在分段边界生效，非分段会话不参与"""
+        # 直播流直录不编码，调整编码参数没有意义
+        sessions = [s for s in self.session_manager.active_sessions()
+                    if s.segmented and s.config.get('adaptive_speed', True) and encodes_video(s.config)]
+        for session in sessions:
+            try:
+                self.check_session(session, cpu_percent)
+            except Exception as e:
+                self.logger.error(f"检查会话 {session.session_id} 编码速度失败: {e}")
+        # 清理已结束会话的状态
+        active_ids = {s.session_id for s in sessions}
+        for session_id in list(self.session_states.keys()):
+            if session_id not in active_ids:
+                del self.session_states[session_id]
+
+    def get_state(self, session):
+        state = self.session_states.get(session.session_id)
+        if state is None:
+            profile_name = session.config.get('encoding_profile') or get_profile_name(
+                session.config.get('video_codec', 'h264'), session.config.get('record_quality', '中'))
+            profile = profile_registry.get(profile_name)
+            base_overrides = dict(session.config.get('encoding_overrides') or {})
+            profile.update(base_overrides)
+            try:
+                base_framerate = int(float(session.config.get('framerate', '25')))
+            except (TypeError, ValueError):
+                base_framerate = 25
+            state = {
+                'level': 0,
+                'slow_checks': 0,
+                'fast_checks': 0,
+                'base_overrides': base_overrides,
+                'steps': build_speed_steps(profile, base_framerate),
+            }
+            self.session_states[session.session_id] = state
+        return state
+
+    def check_session(self, session, cpu_percent):
+        if session.pending_reconfigure:
+            return
+        # 采样不足（刚启动或刚滚动）时不判断
+        speed = session.stats.average_speed(SPEED_SAMPLES, WARMUP_SAMPLES)
+        frame_loss = session.stats.frame_loss(SPEED_SAMPLES, WARMUP_SAMPLES)
+        if speed is None or frame_loss is None:
+            return
+        state = self.get_state(session)
+        if speed < SLOW_SPEED or (cpu_percent >= HIGH_CPU_PERCENT and frame_loss > 0):
+            state['slow_checks'] += 1
+            state['fast_checks'] = 0
+        elif cpu_percent < LOW_CPU_PERCENT and frame_loss == 0:
+            state['fast_checks'] += 1
+            state['slow_checks'] = 0
+        else:
+            state['slow_checks'] = 0
+            state['fast_checks'] = 0
+
+        if state['slow_checks'] >= SLOW_CHECKS and state['level'] < len(state['steps']) - 1:
+            self.change_level(session, state, state['level'] + 1,
+                              f"速度 {speed:.2f}x，CPU {cpu_percent:.0f}%，降档")
+        elif state['fast_checks'] >= FAST_CHECKS and state['level'] > 0:
+            self.change_level(session, state, state['level'] - 1,
+                              f"速度 {speed:.2f}x，CPU {cpu_percent:.0f}%，升档")
+
+    def change_level(self, session, state, level, reason):
+        step_overrides, framerate = state['steps'][level]
+        overrides = dict(state['base_overrides'])
+        overrides.update(step_overrides)
+        state['level'] = level
+        state['slow_checks'] = 0
+        state['fast_checks'] = 0
+        self.logger.info(
+            f"会话 {session.session_id} {reason}：档位 {level}，编码参数 {overrides}，帧率 {framerate}"
+        )
+        session.request_reconfigure(overrides, framerate, reason)
@@ -0,0 +1,344 @@
+import os
+import time
+import queue
+import shutil
+import logging
+from collections import deque
+from threading import Thread, Event, Condition
+from recorder.ffmpeg_helper import get_output_pixel_rate, is_stream_copy, is_audio_only, encodes_video
+from recorder.segments import get_segment_seconds, get_segment_size_bytes
+
+CHECK_INTERVAL = 10         # 检查间隔（秒）
+RATE_WINDOW = 60            # 计算写入速率的时间窗口（秒）
+WARN_SECONDS = 15 * 60      # 预计剩余空间不足该时长时发出警告
+STAGING_SEGMENTS = 2        # 每个会话在暂存目录中同时占用的分段数（正在写入的一个加等待搬运的一个）
+
+# 首次录制前估算写入速率用的每像素比特数（按录制质量）
+BITS_PER_PIXEL = {'高': 0.10, '中': 0.05, '低': 0.02}
+STREAM_COPY_BYTES_PER_SECOND = 4 * 1024 * 1024 // 8   # 直录按4Mbps估算
+
+# 空间不足时依次尝试的降级质量
+QUALITY_LADDER = ['高', '中', '低']
+MIN_FRAMERATE = 10
+
+logger = logging.getLogger(__name__)
+
+
+def parse_bitrate(value):
+    """解析 '128k' / '2M' / '96000' 形式的码率，返回bit/s"""
+    value = str(value).strip().lower()
+    units = {'k': 1000, 'm': 1000000}
+    try:
+        if value and value[-1] in units:
+            return int(float(value[:-1]) * units[value[-1]])
+        return int(float(value))
+    except ValueError:
+        return 128000
+
+
+def get_free_bytes(path):
+    """路径所在卷的可用空间；目录尚未创建时向上查找已存在的父目录"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return shutil.disk_usage(path).free
+
+
+def get_reserve_bytes(config):
+    """为系统和其他程序保留的空间，低于该值时停止录制"""
+    return int(config.get('storage_reserve_mb', 1024)) * 1024 * 1024
+
+
+def get_staging_reserve_bytes(config):
+    """暂存目录所在卷（通常是内存盘）保留的空间"""
+    return int(config.get('staging_reserve_mb', 256)) * 1024 * 1024
+
+
+def get_staging_dir(config):
+    """
+    暂存目录（如 /dev/shm 下的内存盘目录），未设置或不可写时返回None
+
+    只有分段录制使用暂存目录：分段关闭后即可移走，暂存占用不超过几个分段；
+    单文件录制要到会话结束才能移动，长时间录制会占满内存盘。
+    """
+    staging_dir = config.get('staging_dir', '')
+    if not staging_dir or not config.get('segment_enabled', False):
+        return None
+    try:
+        os.makedirs(staging_dir, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"暂存目录不可用，直接写入保存目录: {e}")
+        return None
+    return staging_dir if os.access(staging_dir, os.W_OK) else None
+
+
+def estimate_bytes_per_second(config):
+    """在没有实测数据时估算新会话的写入速率"""
+    if is_stream_copy(config):
+        return STREAM_COPY_BYTES_PER_SECOND
+    if is_audio_only(config):
+        return parse_bitrate(config.get('audio_bitrate', '128k')) // 8
+    bits_per_pixel = BITS_PER_PIXEL.get(config.get('record_quality', '中'), BITS_PER_PIXEL['中'])
+    rate = get_output_pixel_rate(config) * bits_per_pixel / 8
+    if config.get('audio_device', '无音频') != '无音频' or config.get('pulse_source'):
+        audio_rate = parse_bitrate(config.get('audio_bitrate', '128k')) // 8
+        # 单独的音频文件再写一份音频
+        rate += audio_rate * (2 if config.get('separate_audio', False) else 1)
+    return int(rate)
+
+
+def get_staging_bytes(config, rate):
+    """按写入速率估算一个分段会话在暂存目录中同时占用的字节数"""
+    segment_bytes = get_segment_size_bytes(config)
+    segment_seconds = get_segment_seconds(config)
+    if segment_seconds > 0:
+        by_time = rate * segment_seconds
+        segment_bytes = min(segment_bytes, by_time) if segment_bytes else by_time
+    if not segment_bytes:
+        # 不按时长也不按大小切分时整个会话就是一个分段
+        segment_bytes = rate * get_remaining_seconds(config)
+    return segment_bytes * STAGING_SEGMENTS
+
+
+def get_remaining_seconds(config, started_at=None):
+    """按录制时长估算会话剩余的录制秒数"""
+    duration = float(config.get('duration_minutes', 60)) * 60
+    if started_at:
+        duration -= time.time() - started_at.timestamp()
+    return max(duration, 0)
+
+
+def get_degrade_steps(config):
+    """空间不足时的降级配置序列：先降低质量，再降低帧率"""
+    steps = []
+    quality = config.get('record_quality', '中')
+    if quality in QUALITY_LADDER:
+        for lower in QUALITY_LADDER[QUALITY_LADDER.index(quality) + 1:]:
+            steps.append({'record_quality': lower})
+    try:
+        framerate = float(config.get('framerate', '25'))
+    except (TypeError, ValueError):
+        framerate = 25
+    lowest = steps[-1] if steps else {}
+    while framerate / 2 >= MIN_FRAMERATE:
+        framerate /= 2
+        steps.append(dict(lowest, framerate=str(int(framerate))))
+    return steps
+
+
+class StagingMover:
+    """
+    暂存文件搬运线程
+
+    录制输出先写入内存盘，分段完成后在后台移动到保存目录，
+    慢速磁盘的写入延迟不会阻塞FFmpeg的复用器。
+    """
+
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.pending = {}
+        self.condition = Condition()
+        self.thread = None
+
+    def ensure_running(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def enqueue(self, session_id, source, target, callback=None):
+        """加入搬运任务，完成后以最终路径调用callback"""
+        with self.condition:
+            self.pending[session_id] = self.pending.get(session_id, 0) + 1
+        self.jobs.put((session_id, source, target, callback))
+        self.ensure_running()
+
+    def wait_idle(self, session_id, timeout=None):
+        """等待会话的所有搬运任务完成"""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending.get(session_id), timeout)
+
+    def _worker(self):
+        while True:
+            session_id, source, target, callback = self.jobs.get()
+            path = source
+            try:
+                os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+                shutil.move(source, target)
+                path = target
+            except Exception as e:
+                logger.error(f"移动暂存文件失败 {source} -> {target}: {e}")
+            try:
+                if callback:
+                    callback(path)
+            except Exception as e:
+                logger.error(f"暂存文件移动回调执行失败: {e}")
+            finally:
+                with self.condition:
+                    self.pending[session_id] -= 1
+                    if not self.pending[session_id]:
+                        del self.pending[session_id]
+                    self.condition.notify_all()
+
+
+staging_mover = StagingMover()
+
+
+class StorageWatchdog:
+    """
+    磁盘空间看门狗
+
+    根据各会话输出文件的实际增长计算写入速率，预测保存目录所在卷何时写满；
+    新会话启动前按预测结果拒绝或降级，空间低于保留值时优雅停止写入最快的会话，
+    避免磁盘写满后FFmpeg中途退出留下截断的文件。
+    暂存目录所在卷单独检查：放不下各会话的在写分段时，新会话不使用暂存，
+    进行中的会话从下一个分段起直接写入保存目录。
+    """
+
+    def __init__(self, session_manager, estimate=None):
+        self.session_manager = session_manager
+        # 写入速率的预测函数，默认按配置估算；可替换为基于历史录制学习的预测器
+        self.estimate = estimate or estimate_bytes_per_second
+        self.stop_event = Event()
+        self.thread = None
+        self.samples = {}
+        self.forecast = {}
+        self.logger = logging.getLogger(__name__)
+
+    def ensure_running(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(CHECK_INTERVAL):
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"检查磁盘空间失败: {e}")
+
+    def session_rate(self, session):
+        """会话最近一段时间的实测写入速率（字节/秒），数据不足时返回估算值"""
+        history = self.samples.get(session.session_id)
+        if not history or len(history) < 2 or history[-1][0] - history[0][0] < CHECK_INTERVAL:
+            return self.estimate(session.config)
+        (t0, b0), (t1, b1) = history[0], history[-1]
+        return max((b1 - b0) / (t1 - t0), 0)
+
+    def check(self):
+        now = time.time()
+        sessions = self.session_manager.active_sessions()
+        active_ids = {s.session_id for s in sessions}
+        for session_id in list(self.samples.keys()):
+            if session_id not in active_ids:
+                del self.samples[session_id]
+
+        volumes = {}
+        for session in sessions:
+            history = self.samples.setdefault(session.session_id, deque())
+            history.append((now, session.bytes_written()))
+            while len(history) > 2 and now - history[0][0] > RATE_WINDOW:
+                history.popleft()
+            volumes.setdefault(session.final_dir, []).append(session)
+
+        forecast = {}
+        for path, volume_sessions in volumes.items():
+            free = get_free_bytes(path)
+            reserve = get_reserve_bytes(volume_sessions[0].config)
+            rates = {s.session_id: self.session_rate(s) for s in volume_sessions}
+            total_rate = sum(rates.values())
+            seconds_to_full = (free - reserve) / total_rate if total_rate > 0 else None
+            forecast[path] = {
+                'free_bytes': free,
+                'bytes_per_second': total_rate,
+                'seconds_to_full': seconds_to_full,
+                'sessions': rates,
+            }
+            if free < reserve:
+                # 空间低于保留值：优雅停止写入最快的会话，保证文件完整
+                fastest = max(volume_sessions, key=lambda s: rates[s.session_id])
+                self.logger.error(f"{path} 可用空间不足 {free // 1024 // 1024}MB，停止会话 {fastest.session_id}")
+                self.session_manager.stop_recording(fastest.session_id)
+            elif seconds_to_full is not None and seconds_to_full < WARN_SECONDS:
+                self.logger.warning(f"{path} 预计 {seconds_to_full / 60:.1f} 分钟后写满")
+
+        staging_volumes = {}
+        for session in sessions:
+            if session.is_staging():
+                staging_volumes.setdefault(session.staging_dir, []).append(session)
+        for path, volume_sessions in staging_volumes.items():
+            free = get_free_bytes(path)
+            reserve = get_staging_reserve_bytes(volume_sessions[0].config)
+            needed = sum(get_staging_bytes(s.config, self.session_rate(s)) for s in volume_sessions)
+            forecast[path] = {
+                'staging': True,
+                'free_bytes': free,
+                'needed_bytes': needed,
+                'sessions': [s.session_id for s in volume_sessions],
+            }
+            if free - reserve < needed:
+                # 暂存空间不足：从下一个分段起改为直接写入保存目录，已暂存的分段照常搬运
+                self.logger.warning(f"暂存目录 {path} 可用空间不足 {free // 1024 // 1024}MB，改为直接写入保存目录")
+                for session in volume_sessions:
+                    session.stop_staging()
+        self.forecast = forecast
+
+    def get_forecast(self):
+        return dict(self.forecast)
+
+    def projected_bytes(self, path):
+        """同一卷上所有进行中会话在剩余录制时长内预计还要写入的字节数"""
+        total = 0
+        for session in self.session_manager.active_sessions():
+            if os.path.abspath(session.final_dir) == os.path.abspath(path):
+                total += self.session_rate(session) * get_remaining_seconds(session.config, session.started_at)
+        return total
+
+    def staging_available(self, config):
+        """新会话的暂存目录是否还能容纳它的在写分段（扣除进行中会话的占用）"""
+        staging_dir = get_staging_dir(config)
+        if not staging_dir:
+            return True
+        available = get_free_bytes(staging_dir) - get_staging_reserve_bytes(config)
+        for session in self.session_manager.active_sessions():
+            if session.is_staging() and os.path.abspath(session.staging_dir) == os.path.abspath(staging_dir):
+                available -= get_staging_bytes(session.config, self.session_rate(session))
+        return get_staging_bytes(config, self.estimate(config)) <= available
+
+    def admit(self, config):
+        """
+        新会话准入检查，返回可以启动的配置；空间不足且无法降级时返回None
+
+        storage_policy 为 'refuse' 时直接拒绝，'degrade' 时依次降低质量和帧率，'off' 不检查。
+        """
+        policy = config.get('storage_policy', 'degrade')
+        if policy == 'off':
+            return config
+        if not self.staging_available(config):
+            self.logger.warning(f"暂存目录 {config.get('staging_dir')} 空间不足，本次录制直接写入保存目录")
+            config = dict(config, staging_dir='')
+        path = config.get('save_path', './videos')
+        available = get_free_bytes(path) - get_reserve_bytes(config) - self.projected_bytes(path)
+        duration = get_remaining_seconds(config)
+
+        def fits(candidate):
+            return self.estimate(candidate) * duration <= available
+
+        if fits(config):
+            return config
+        if policy == 'degrade' and encodes_video(config):
+            for step in get_degrade_steps(config):
+                candidate = dict(config, **step)
+                if fits(candidate):
+                    self.logger.warning(f"磁盘空间不足以按原设置录制，降级为 {step}")
+                    return candidate
+        self.logger.error(f"磁盘空间不足：{path} 可用 {max(available, 0) // 1024 // 1024}MB，拒绝启动录制")
+        return None
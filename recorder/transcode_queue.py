@@ -0,0 +1,68 @@
+import os
+import logging
+from recorder.ffmpeg_helper import get_ffmpeg_path, get_video_codec_args
+from recorder.postprocess import postprocess_pool, register_job_type, JOB_PENDING
+
+# 中间文件名中的标记，转码后去掉该标记得到最终文件名
+INTERMEDIATE_TAG = '.intermediate'
+
+
+def get_archive_path(intermediate_path):
+    """由中间文件路径得到最终归档文件路径"""
+    base, ext = os.path.splitext(intermediate_path)
+    if base.endswith(INTERMEDIATE_TAG):
+        base = base[:-len(INTERMEDIATE_TAG)]
+    return base + ext
+
+
+def build_transcode_cmd(source, target, archive):
+    """把中间文件重新编码为归档编码，音频直接复制"""
+    return [
+        get_ffmpeg_path(),
+        '-y',
+        '-nostats',
+        '-i', source,
+        '-map', '0',
+        '-c:a', 'copy',
+    ] + get_video_codec_args(
+        archive.get('video_codec', 'h264'),
+        archive.get('record_quality', '中'),
+        overrides=archive.get('encoding_overrides'),
+        profile_name=archive.get('encoding_profile') or None,
+    ) + [target]
+
+
+def build_transcode_job_cmd(job, tmp_output):
+    """后处理工作池中 transcode 任务的命令生成函数"""
+    return build_transcode_cmd(job['inputs'][0], tmp_output, job['params'].get('archive', {}))
+
+
+register_job_type('transcode', build_transcode_job_cmd)
+
+
+class TranscodeQueue:
+    """
+    后台转码队列
+
+    两段式录制先用廉价的中间编码跟上实时，录制完成的文件或分段交给
+    后处理工作池，以最低的CPU/IO优先级重新编码为归档编码，把编码峰值移出录制时段。
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool or postprocess_pool
+        self.logger = logging.getLogger(__name__)
+
+    def enqueue(self, source, archive, keep_intermediate=False):
+        """加入转码任务，返回任务ID；archive为归档编码设置（video_codec/record_quality等）"""
+        job_id = self.pool.submit(
+            'transcode', [source], get_archive_path(source),
+            delete_inputs=not keep_intermediate, params={'archive': dict(archive)},
+        )
+        self.logger.info(f"已加入后台转码队列: {source}")
+        return job_id
+
+    def pending(self):
+        return len([j for j in self.pool.list_jobs(JOB_PENDING) if j['type'] == 'transcode'])
+
+
+transcode_queue = TranscodeQueue()
@@ -1,9 +1,9 @@
 import logging
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timedelta
-from recorder.recorder import recorder_instance
 from browser.browser_controller import browser_controller_instance
 from browser.clicker import Clicker
+from browser.browser_pool import browser_pool, WARMUP_SECONDS
 
 class TaskScheduler:
     def __init__(self, config):
@@ -14,6 +14,7 @@ class TaskScheduler:
         self.logger = logging.getLogger(__name__)
         self.current_job_id = 'start_record'
         self.current_stop_job_id = 'stop_record'
+        self.current_warm_job_id = 'warm_browser'
 
     def start(self):
         self.scheduler.start()
@@ -25,15 +26,29 @@ class TaskScheduler:
 
     def schedule_recording(self):
         # 移除可能存在的旧任务
-        for job_id in [self.current_job_id, self.current_stop_job_id]:
+        for job_id in [self.current_job_id, self.current_stop_job_id, self.current_warm_job_id]:
             try:
                 self.scheduler.remove_job(job_id)
             except Exception:
                 pass
+        # 改期后之前预热的浏览器不再需要
+        browser_pool.cancel()
         
         start_time = datetime.strptime(self.config['start_time'], '%Y-%m-%d %H:%M:%S')
         end_time = start_time + timedelta(minutes=self.config['duration_minutes'])
         
+        # 提前启动浏览器，开播时直接使用；距开播不足预热时长时立即预热
+        warmup_seconds = self.config.get('browser_warmup_seconds', WARMUP_SECONDS)
+        now = datetime.now()
+        if warmup_seconds > 0 and start_time > now:
+            warm_time = max(start_time - timedelta(seconds=warmup_seconds), now + timedelta(seconds=1))
+            self.scheduler.add_job(
+                self.warm_browser,
+                'date',
+                run_date=warm_time,
+                id=self.current_warm_job_id
+            )
+        
         self.scheduler.add_job(
             self.start_all, 
             'date', 
@@ -148,6 +163,7 @@ class TaskScheduler:
             current_time = datetime.now().strftime('%Y%m%d%H%M%S')
             self.current_job_id = f'start_record_{current_time}'
             self.current_stop_job_id = f'stop_record_{current_time}'
+            self.current_warm_job_id = f'warm_browser_{current_time}'
             self.logger.info(f"生成新的任务ID: {self.current_job_id}")
             
             # 重新调度任务
@@ -170,6 +186,17 @@ class TaskScheduler:
                 self.main_window.start_countdown()
                 self.logger.info("已启动新的倒计时")
 
+    def warm_browser(self):
+        """开播前预热浏览器；纯录屏、地址无效或使用虚拟显示器时不需要"""
+        if self.config.get('silent_mode', False) or not self.config.get('url_is_valid', True):
+            return
+        if self.config.get('virtual_display', False):
+            return
+        if self.main_window and getattr(self.main_window, 'is_recording', False):
+            return
+        self.logger.info("开播前预热浏览器")
+        browser_pool.warm_up(self.config['douyin_url'], monitor_index=self.config.get('monitor_index', 0))
+
     def start_all(self):
         # 只发信号，由主线程执行实际操作
         if hasattr(self, 'main_window') and self.main_window:
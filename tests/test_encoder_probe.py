@@ -0,0 +1,112 @@
+import os
+import unittest
+from recorder.encoder_probe import EncoderCapabilities, get_downgrade_steps, get_speed_key
+
+PROBE_PIXEL_RATE = 1280 * 720 * 30
+
+
+class FakeCapabilities(EncoderCapabilities):
+    """使用给定探测结果的能力缓存，不读写磁盘"""
+
+    def __init__(self, caps):
+        super().__init__(cache_path=os.devnull)
+        self.caps = caps
+
+    def get(self, ffmpeg_path=None):
+        return self.caps
+
+
+def make_caps(speeds, encoders=('libx264', 'libx265', 'libvpx-vp9', 'libaom-av1')):
+    return {'encoders': list(encoders), 'probe_pixel_rate': PROBE_PIXEL_RATE, 'speeds': speeds}
+
+
+class DowngradeStepsTest(unittest.TestCase):
+
+    def test_same_preset_steps_to_faster_preset(self):
+        self.assertEqual(get_downgrade_steps('h264'), [('高', {}), ('中', {}), ('低', {'preset': 'superfast'})])
+        self.assertEqual(get_downgrade_steps('h265')[2], ('低', {'preset': 'superfast'}))
+
+    def test_numeric_speed_codecs_unchanged(self):
+        self.assertEqual(get_downgrade_steps('vp9'), [('高', {}), ('中', {}), ('低', {})])
+        self.assertEqual(get_downgrade_steps('av1'), [('高', {}), ('中', {}), ('低', {})])
+
+    def test_speed_key(self):
+        self.assertEqual(get_speed_key('h264', '中'), 'h264|中')
+        self.assertEqual(get_speed_key('h264', '低', {'preset': 'superfast'}), 'h264|低|preset=superfast')
+
+
+class EstimateSpeedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.capabilities = FakeCapabilities(None)
+        self.caps = make_caps({'h264|中': 2.0})
+
+    def test_scales_by_pixel_rate(self):
+        self.assertAlmostEqual(self.capabilities.estimate_speed(self.caps, 'h264', '中', PROBE_PIXEL_RATE * 2), 1.0)
+        self.assertAlmostEqual(self.capabilities.estimate_speed(self.caps, 'h264', '中', PROBE_PIXEL_RATE / 2), 4.0)
+
+    def test_unknown_pixel_rate(self):
+        self.assertEqual(self.capabilities.estimate_speed(self.caps, 'h264', '中', 0), 2.0)
+
+    def test_missing_speed(self):
+        self.assertIsNone(self.capabilities.estimate_speed(self.caps, 'h264', '高', PROBE_PIXEL_RATE))
+        self.assertIsNone(self.capabilities.estimate_speed(
+            self.caps, 'h264', '低', PROBE_PIXEL_RATE, {'preset': 'superfast'}))
+
+
+class SelectEncodingTest(unittest.TestCase):
+
+    def select(self, speeds, config, encoders=None):
+        caps = make_caps(speeds) if encoders is None else make_caps(speeds, encoders)
+        return FakeCapabilities(caps).select_encoding(config, PROBE_PIXEL_RATE)
+
+    def test_no_cache_keeps_config(self):
+        result = FakeCapabilities(None).select_encoding({'video_codec': 'h265', 'record_quality': '高'}, PROBE_PIXEL_RATE)
+        self.assertEqual(result, ('h265', '高', {}, None))
+
+    def test_realtime_keeps_config(self):
+        result = self.select({'h264|中': 1.5}, {'video_codec': 'h264', 'record_quality': '中'})
+        self.assertEqual(result, ('h264', '中', {}, None))
+
+    def test_steps_preset_within_codec(self):
+        speeds = {'h264|中': 0.8, 'h264|低': 0.85, 'h264|低|preset=superfast': 1.4}
+        codec, quality, overrides, reason = self.select(speeds, {'video_codec': 'h264', 'record_quality': '中'})
+        self.assertEqual((codec, quality, overrides), ('h264', '低', {'preset': 'superfast'}))
+        self.assertIn('superfast', reason)
+
+    def test_falls_back_to_h264(self):
+        speeds = {'h265|高': 0.3, 'h265|中': 0.5, 'h265|低|preset=superfast': 0.7, 'h264|高': 1.2}
+        result = self.select(speeds, {'video_codec': 'h265', 'record_quality': '高'})
+        self.assertEqual(result[:3], ('h264', '高', {}))
+
+    def test_skips_missing_encoder(self):
+        speeds = {'av1|中': 5.0, 'h264|中': 2.0}
+        result = self.select(speeds, {'video_codec': 'av1', 'record_quality': '中'}, encoders=['libx264'])
+        self.assertEqual(result[:3], ('h264', '中', {}))
+
+    def test_no_realtime_uses_fastest_available(self):
+        # libx264 不可用时不能退到h264，改用测得最快的h265档位
+        speeds = {'h265|中': 0.4, 'h265|低|preset=superfast': 0.9, 'h264|中': 5.0}
+        codec, quality, overrides, reason = self.select(
+            speeds, {'video_codec': 'h265', 'record_quality': '中'}, encoders=['libx265'])
+        self.assertEqual((codec, quality, overrides), ('h265', '低', {'preset': 'superfast'}))
+        self.assertIn('0.90x', reason)
+
+    def test_no_realtime_keeps_fastest_original(self):
+        speeds = {'h264|低': 0.9, 'h264|低|preset=superfast': None}
+        result = self.select(speeds, {'video_codec': 'h264', 'record_quality': '低'})
+        self.assertEqual(result, ('h264', '低', {}, None))
+
+    def test_no_measurements_keeps_config(self):
+        result = self.select({}, {'video_codec': 'vp9', 'record_quality': '中'})
+        self.assertEqual(result, ('vp9', '中', {}, None))
+
+    def test_explicit_overrides_unchanged(self):
+        config = {'video_codec': 'h264', 'record_quality': '中', 'encoding_overrides': {'crf': 20}}
+        with self.assertLogs('recorder.encoder_probe', 'WARNING'):
+            result = self.select({'h264|中': 0.5}, config)
+        self.assertEqual(result, ('h264', '中', {}, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
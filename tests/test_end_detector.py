@@ -0,0 +1,134 @@
+import unittest
+from unittest import mock
+from recorder.end_detector import (
+    EndDetector, decide_end_action, get_stalled_seconds, ACTION_STOP, ACTION_EXTEND,
+    FREEZE_WINDOW, SILENCE_WINDOW, BLACK_GAP,
+)
+
+# FFmpeg检测滤镜在stderr上的实际输出
+FREEZE_START = b'[freezedetect @ 0x55d5c7e0a540] lavfi.freezedetect.freeze_start: 12.48\n'
+FREEZE_DURATION = b'[freezedetect @ 0x55d5c7e0a540] lavfi.freezedetect.freeze_duration: 18.02\n'
+FREEZE_END = b'[freezedetect @ 0x55d5c7e0a540] lavfi.freezedetect.freeze_end: 30.5\n'
+BLACK_FRAME = b'[Parsed_blackframe_1 @ 0x5605f0b6c0c0] frame:120 pblack:99 pts:120000 t:4.800000 type:P last_keyframe:0\n'
+SILENCE_START = b'[silencedetect @ 0x7f9b3c0047c0] silence_start: -0.0213\n'
+SILENCE_END = b'[silencedetect @ 0x7f9b3c0047c0] silence_end: 15.3 | silence_duration: 15.32\n'
+PROGRESS_LINE = b'frame=  300 fps= 25 q=28.0 size=    1024kB time=00:00:12.00 bitrate= 699.1kbits/s speed=1.00x\n'
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class EndDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('recorder.end_detector.time.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.detector = EndDetector('s1', has_audio=True)
+
+    def test_freeze(self):
+        self.detector.feed_line(FREEZE_START)
+        # 滤镜在静止持续 FREEZE_WINDOW 秒后才报告开始
+        self.assertEqual(self.detector.signals()['frozen'], FREEZE_WINDOW)
+        self.clock.now += 5
+        self.detector.feed_line(FREEZE_DURATION)
+        self.assertEqual(self.detector.signals()['frozen'], FREEZE_WINDOW + 5)
+        self.detector.feed_line(FREEZE_END)
+        self.assertEqual(self.detector.signals()['frozen'], 0)
+
+    def test_silence(self):
+        self.detector.feed_line(SILENCE_START.decode())
+        self.clock.now += 20
+        self.assertEqual(self.detector.signals()['silent'], SILENCE_WINDOW + 20)
+        self.detector.feed_line(SILENCE_END)
+        self.assertEqual(self.detector.signals()['silent'], 0)
+
+    def test_black_frames(self):
+        for _ in range(5):
+            self.detector.feed_line(BLACK_FRAME)
+            self.clock.now += 1
+        self.assertEqual(self.detector.signals()['black'], 5)
+        # 黑帧报告中断超过 BLACK_GAP 秒视为黑屏结束
+        self.clock.now += BLACK_GAP
+        self.assertEqual(self.detector.signals()['black'], 0)
+        self.detector.feed_line(BLACK_FRAME)
+        self.assertEqual(self.detector.signals()['black'], 0)
+        self.clock.now += 1
+        self.assertEqual(self.detector.signals()['black'], 1)
+
+    def test_ignores_other_lines(self):
+        self.detector.feed_line(PROGRESS_LINE)
+        self.detector.feed_line(b'')
+        signals = self.detector.signals()
+        self.assertEqual((signals['frozen'], signals['black'], signals['silent']), (0, 0, 0))
+        self.assertTrue(signals['has_audio'])
+
+    def test_reset(self):
+        for line in (FREEZE_START, BLACK_FRAME, SILENCE_START):
+            self.detector.feed_line(line)
+        self.detector.reset()
+        signals = self.detector.signals()
+        self.assertEqual((signals['frozen'], signals['black'], signals['silent']), (0, 0, 0))
+
+
+def make_signals(frozen=0, black=0, silent=0, has_audio=True, has_video=True):
+    return {'frozen': frozen, 'black': black, 'silent': silent, 'has_audio': has_audio, 'has_video': has_video}
+
+
+class StalledSecondsTest(unittest.TestCase):
+
+    def test_needs_video_and_audio(self):
+        self.assertEqual(get_stalled_seconds(make_signals(frozen=100, silent=40)), 40)
+        self.assertEqual(get_stalled_seconds(make_signals(frozen=100, black=150, silent=200)), 150)
+        self.assertEqual(get_stalled_seconds(make_signals(frozen=100)), 0)
+
+    def test_without_audio(self):
+        self.assertEqual(get_stalled_seconds(make_signals(frozen=100, has_audio=False)), 100)
+
+    def test_audio_only(self):
+        self.assertEqual(get_stalled_seconds(make_signals(frozen=100, silent=30, has_video=False)), 30)
+
+
+class DecideEndActionTest(unittest.TestCase):
+
+    def decide(self, signals, page_ended=False, remaining=600, extended=0, **config):
+        return decide_end_action(config, signals, page_ended, remaining, extended)
+
+    def test_stops_after_threshold(self):
+        self.assertIsNone(self.decide(make_signals(frozen=119, silent=119)))
+        self.assertEqual(self.decide(make_signals(frozen=120, silent=120)), ACTION_STOP)
+        self.assertEqual(self.decide(make_signals(black=60, has_audio=False), end_detection_seconds=60), ACTION_STOP)
+
+    def test_page_ended_stops_sooner(self):
+        self.assertEqual(self.decide(make_signals(frozen=30, silent=30), page_ended=True), ACTION_STOP)
+        self.assertIsNone(self.decide(make_signals(frozen=29, silent=29), page_ended=True))
+        self.assertEqual(self.decide(make_signals(frozen=10, silent=10), page_ended=True,
+                                     end_detection_seconds=10), ACTION_STOP)
+
+    def test_auto_stop_disabled(self):
+        self.assertIsNone(self.decide(make_signals(frozen=999, silent=999), page_ended=True, auto_stop_on_end=False))
+
+    def test_extends_near_end_while_live(self):
+        self.assertEqual(self.decide(make_signals(), remaining=60, auto_extend=True), ACTION_EXTEND)
+        self.assertIsNone(self.decide(make_signals(), remaining=61, auto_extend=True))
+        self.assertIsNone(self.decide(make_signals(), remaining=30))
+
+    def test_no_extend_when_stalled_or_ended(self):
+        self.assertIsNone(self.decide(make_signals(frozen=5, silent=5), remaining=30, auto_extend=True))
+        self.assertIsNone(self.decide(make_signals(), page_ended=True, remaining=30, auto_extend=True))
+
+    def test_extend_limit(self):
+        self.assertEqual(self.decide(make_signals(), remaining=30, extended=1199, auto_extend=True,
+                                     auto_extend_max_minutes=20), ACTION_EXTEND)
+        self.assertIsNone(self.decide(make_signals(), remaining=30, extended=1200, auto_extend=True,
+                                      auto_extend_max_minutes=20))
+
+
+if __name__ == '__main__':
+    unittest.main()
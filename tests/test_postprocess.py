@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from threading import Event
+from unittest import mock
+from recorder.postprocess import (
+    PostProcessPool, default_session_hook, get_crashed_files, get_temp_output,
+    JOB_PENDING, JOB_DONE, JOB_FAILED, FINISHED_RETENTION,
+)
+
+
+class FakeManifest:
+    def __init__(self, manifest_path, segments):
+        self.manifest_path = manifest_path
+        self.segments = segments
+
+
+class FakeSession:
+    def __init__(self, final_dir, manifest=None, parts=(), gaps=(), two_stage=False, **config):
+        self.final_dir = final_dir
+        self.manifest = manifest
+        self.parts = list(parts)
+        self.gaps = list(gaps)
+        self.two_stage = two_stage
+        self.transcode_jobs = {}
+        self.config = dict({'video_codec': 'h264', 'output_format': 'mkv'}, **config)
+
+
+class IdlePool(PostProcessPool):
+    """不启动工作线程的任务池，只检查提交的任务"""
+
+    def __init__(self, jobs_path):
+        super().__init__(workers=0, jobs_path=jobs_path)
+
+    def summary(self):
+        """(类型, 输入文件名, 输出文件名, 依赖任务的类型)"""
+        by_id = {j['id']: j for j in self.jobs}
+        return [
+            (j['type'], [os.path.basename(p) for p in j['inputs']], os.path.basename(j['output']),
+             [by_id[d]['type'] for d in j['depends_on']])
+            for j in self.jobs
+        ]
+
+
+class TempDirTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        self.jobs_path = os.path.join(self.tmp_dir, 'jobs', 'postprocess_jobs.json')
+
+    def touch(self, name):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(b'x')
+        return path
+
+
+class SessionHookTest(TempDirTest):
+
+    def setUp(self):
+        super().setUp()
+        self.pool = IdlePool(self.jobs_path)
+
+    def segmented_session(self, **config):
+        segments = [
+            {'path': self.touch('rec_000.mkv')},
+            {'path': self.touch('rec_001.mkv'), 'incomplete': True},
+            {'path': self.touch('rec_002.mkv')},
+        ]
+        manifest = FakeManifest(os.path.join(self.tmp_dir, 'rec.segments.json'), segments)
+        return FakeSession(self.tmp_dir, manifest=manifest, **config)
+
+    def test_segmented_fix_concat_remux(self):
+        session = self.segmented_session(postprocess_concat=True, postprocess_remux_mp4=True)
+        default_session_hook(session, self.pool)
+        self.assertEqual(self.pool.summary(), [
+            ('fix_timestamps', ['rec_001.mkv'], 'rec_001.mkv', []),
+            ('concat', ['rec_000.mkv', 'rec_001.mkv', 'rec_002.mkv'], 'rec.mkv', ['fix_timestamps']),
+            ('remux_mp4', ['rec.mkv'], 'rec.mp4', ['concat']),
+        ])
+
+    def test_segmented_without_concat_only_fixes(self):
+        default_session_hook(self.segmented_session(), self.pool)
+        self.assertEqual([j[0] for j in self.pool.summary()], ['fix_timestamps'])
+
+    def test_fix_disabled(self):
+        session = self.segmented_session(postprocess_concat=True, postprocess_fix_timestamps=False)
+        default_session_hook(session, self.pool)
+        self.assertEqual(self.pool.summary(), [
+            ('concat', ['rec_000.mkv', 'rec_001.mkv', 'rec_002.mkv'], 'rec.mkv', []),
+        ])
+
+    def test_two_stage_waits_for_transcode(self):
+        session = self.segmented_session(postprocess_concat=True, two_stage=True)
+        session.manifest.segments = [{'path': self.touch('rec_000.intermediate.mkv')}]
+        transcode_id = self.pool.submit('remux_mp4', ['x'], 'y')
+        session.transcode_jobs = {session.manifest.segments[0]['path']: transcode_id}
+        default_session_hook(session, self.pool)
+        self.assertEqual(self.pool.summary()[1:], [('concat', ['rec_000.mkv'], 'rec.mkv', ['remux_mp4'])])
+
+    def test_single_file_parts_after_crash(self):
+        parts = [self.touch('rec.mkv'), self.touch('rec_part1.mkv')]
+        session = FakeSession(self.tmp_dir, parts=parts, gaps=[{'part': 1}],
+                              postprocess_concat=True, postprocess_remux_mp4=True)
+        self.assertEqual(get_crashed_files(session), [parts[0]])
+        default_session_hook(session, self.pool)
+        self.assertEqual(self.pool.summary(), [
+            ('fix_timestamps', ['rec.mkv'], 'rec.mkv', []),
+            ('concat', ['rec.mkv', 'rec_part1.mkv'], 'rec_full.mkv', ['fix_timestamps']),
+            ('remux_mp4', ['rec_full.mkv'], 'rec_full.mp4', ['concat']),
+        ])
+
+    def test_single_file_remux_only(self):
+        session = FakeSession(self.tmp_dir, parts=[self.touch('rec.mkv')], postprocess_remux_mp4=True)
+        default_session_hook(session, self.pool)
+        self.assertEqual(self.pool.summary(), [('remux_mp4', ['rec.mkv'], 'rec.mp4', [])])
+
+    def test_audio_only_not_remuxed(self):
+        session = FakeSession(self.tmp_dir, parts=[self.touch('rec.m4a')], capture_mode='audio_only',
+                              postprocess_remux_mp4=True)
+        default_session_hook(session, self.pool)
+        self.assertEqual(self.pool.summary(), [])
+
+    def test_hook_errors_are_logged(self):
+        def broken(session, pool):
+            raise RuntimeError('boom')
+        self.pool.add_hook(broken)
+        with self.assertLogs('recorder.postprocess', 'ERROR'):
+            self.pool.on_session_finished(FakeSession(self.tmp_dir))
+
+
+class QueuePersistenceTest(TempDirTest):
+
+    def write_jobs(self, jobs):
+        os.makedirs(os.path.dirname(self.jobs_path), exist_ok=True)
+        with open(self.jobs_path, 'w', encoding='utf-8') as f:
+            json.dump(jobs, f)
+
+    def make_job(self, job_id, status, depends_on=(), finished_at=None):
+        job = {'id': job_id, 'type': 'remux_mp4', 'inputs': ['a.mkv'], 'output': 'a.mp4', 'params': {},
+               'depends_on': list(depends_on), 'delete_inputs': False, 'status': status, 'attempts': 0,
+               'max_attempts': 3, 'timeout': 60, 'max_memory_mb': 0, 'not_before': 0, 'error': ''}
+        if finished_at is not None:
+            job['finished_at'] = finished_at
+        return job
+
+    def test_submit_persists(self):
+        pool = IdlePool(self.jobs_path)
+        job_id = pool.submit('concat', ['a.mkv', 'b.mkv'], 'out.mkv', delete_inputs=True)
+        reloaded = IdlePool(self.jobs_path)
+        jobs = reloaded.list_jobs()
+        self.assertEqual([(j['id'], j['status'], j['inputs'], j['delete_inputs']) for j in jobs],
+                         [(job_id, JOB_PENDING, ['a.mkv', 'b.mkv'], True)])
+        self.assertFalse(os.path.exists(self.jobs_path + '.tmp'))
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            IdlePool(self.jobs_path).submit('upload', ['a'], 'b')
+
+    def test_reload_requeues_running_and_prunes(self):
+        old = time.time() - FINISHED_RETENTION - 10
+        self.write_jobs([
+            self.make_job('running', 'running'),
+            self.make_job('old_done', JOB_DONE, finished_at=old),
+            self.make_job('old_needed', JOB_DONE, finished_at=old),
+            self.make_job('waiting', JOB_PENDING, depends_on=['old_needed']),
+            self.make_job('recent', JOB_FAILED, finished_at=time.time()),
+        ])
+        pool = IdlePool(self.jobs_path)
+        jobs = {j['id']: j['status'] for j in pool.list_jobs()}
+        self.assertEqual(jobs, {'running': JOB_PENDING, 'old_needed': JOB_DONE,
+                                'waiting': JOB_PENDING, 'recent': JOB_FAILED})
+        with open(self.jobs_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(len(json.load(f)), 4)
+
+        pool.clear_finished()
+        self.assertEqual({j['id'] for j in pool.list_jobs()}, {'running', 'old_needed', 'waiting'})
+
+    def test_corrupt_file(self):
+        os.makedirs(os.path.dirname(self.jobs_path), exist_ok=True)
+        with open(self.jobs_path, 'w', encoding='utf-8') as f:
+            f.write('{not json')
+        self.assertEqual(IdlePool(self.jobs_path).list_jobs(), [])
+
+
+class ScriptedPool(PostProcessPool):
+    """按预设结果执行任务，不启动FFmpeg"""
+
+    def __init__(self, jobs_path, failures):
+        super().__init__(workers=1, jobs_path=jobs_path)
+        self.failures = dict(failures)
+        self.runs = []
+
+    def run_job(self, job):
+        self.runs.append(job['output'])
+        if self.failures.get(job['output'], 0) > 0:
+            self.failures[job['output']] -= 1
+            raise RuntimeError('ffmpeg failed')
+        job['output_size'] = 1
+
+
+@mock.patch('recorder.postprocess.RETRY_DELAY', 0)
+class RetryTest(TempDirTest):
+
+    def run_pool(self, failures, submit, expected_finished):
+        pool = ScriptedPool(self.jobs_path, failures)
+        finished = []
+        all_finished = Event()
+
+        def listener(job):
+            finished.append(job)
+            if len(finished) == expected_finished:
+                all_finished.set()
+        pool.add_job_listener(listener)
+        with self.assertLogs('recorder.postprocess', 'INFO'):
+            submit(pool)
+            self.assertTrue(all_finished.wait(5))
+        return pool, finished
+
+    def test_retries_then_succeeds(self):
+        pool, finished = self.run_pool(
+            {'a.mp4': 2}, lambda pool: pool.submit('remux_mp4', ['a.mkv'], 'a.mp4'), 1)
+        self.assertEqual(pool.runs, ['a.mp4'] * 3)
+        self.assertEqual((finished[0]['status'], finished[0]['attempts'], finished[0]['output_size']),
+                         (JOB_DONE, 3, 1))
+
+    def test_gives_up_and_fails_dependents(self):
+        def submit(pool):
+            first = pool.submit('concat', ['a.mkv', 'b.mkv'], 'full.mkv', max_attempts=2)
+            pool.submit('remux_mp4', ['full.mkv'], 'full.mp4', depends_on=[first])
+        pool, finished = self.run_pool({'full.mkv': 5}, submit, 2)
+        self.assertEqual(pool.runs, ['full.mkv', 'full.mkv'])
+        self.assertEqual([(j['output'], j['status']) for j in finished],
+                         [('full.mkv', JOB_FAILED), ('full.mp4', JOB_FAILED)])
+        self.assertEqual(finished[1]['error'], '依赖的任务失败')
+
+    def test_runs_dependencies_in_order(self):
+        def submit(pool):
+            first = pool.submit('concat', ['a.mkv', 'b.mkv'], 'full.mkv')
+            pool.submit('remux_mp4', ['full.mkv'], 'full.mp4', depends_on=[first])
+        pool, finished = self.run_pool({}, submit, 2)
+        self.assertEqual(pool.runs, ['full.mkv', 'full.mp4'])
+
+
+class TempOutputTest(unittest.TestCase):
+
+    def test_temp_output(self):
+        self.assertEqual(get_temp_output('/v/rec.mkv'), '/v/rec.part.mkv')
+
+
+if __name__ == '__main__':
+    unittest.main()
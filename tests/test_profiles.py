@@ -0,0 +1,43 @@
+import unittest
+from recorder.ffmpeg_helper import get_video_codec_args
+
+# 改为查表之前 get_video_codec_args 的if分支输出，内置配置必须逐项一致
+BASELINE_ARGS = {
+    ('h264', '高'): ['-c:v', 'libx264', '-crf', '18', '-preset', 'medium', '-pix_fmt', 'yuv420p'],
+    ('h264', '中'): ['-c:v', 'libx264', '-crf', '25', '-preset', 'veryfast', '-pix_fmt', 'yuv420p'],
+    ('h264', '低'): ['-c:v', 'libx264', '-crf', '32', '-preset', 'veryfast', '-pix_fmt', 'yuv420p'],
+    ('h265', '高'): ['-c:v', 'libx265', '-crf', '20', '-preset', 'medium', '-pix_fmt', 'yuv420p', '-tag:v', 'hvc1'],
+    ('h265', '中'): ['-c:v', 'libx265', '-crf', '28', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-tag:v', 'hvc1'],
+    ('h265', '低'): ['-c:v', 'libx265', '-crf', '36', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-tag:v', 'hvc1'],
+    ('vp9', '高'): ['-c:v', 'libvpx-vp9', '-crf', '19', '-b:v', '0', '-speed', '1', '-row-mt', '1', '-pix_fmt', 'yuv420p'],
+    ('vp9', '中'): ['-c:v', 'libvpx-vp9', '-crf', '28', '-b:v', '0', '-speed', '2', '-row-mt', '1', '-pix_fmt', 'yuv420p'],
+    ('vp9', '低'): ['-c:v', 'libvpx-vp9', '-crf', '37', '-b:v', '0', '-speed', '4', '-row-mt', '1', '-pix_fmt', 'yuv420p'],
+    ('av1', '高'): ['-c:v', 'libaom-av1', '-crf', '20', '-b:v', '0', '-cpu-used', '3', '-pix_fmt', 'yuv420p'],
+    ('av1', '中'): ['-c:v', 'libaom-av1', '-crf', '29', '-b:v', '0', '-cpu-used', '5', '-pix_fmt', 'yuv420p'],
+    ('av1', '低'): ['-c:v', 'libaom-av1', '-crf', '38', '-b:v', '0', '-cpu-used', '8', '-pix_fmt', 'yuv420p'],
+}
+
+
+class BuiltinProfileTest(unittest.TestCase):
+
+    def test_matches_baseline(self):
+        for (video_codec, quality), expected in BASELINE_ARGS.items():
+            with self.subTest(video_codec=video_codec, quality=quality):
+                self.assertEqual(get_video_codec_args(video_codec, quality), expected)
+
+    def test_unknown_quality_keeps_codec(self):
+        for video_codec in ('h264', 'h265', 'vp9', 'av1'):
+            with self.subTest(video_codec=video_codec):
+                self.assertEqual(get_video_codec_args(video_codec, '超高'), BASELINE_ARGS[(video_codec, '中')])
+
+    def test_unknown_codec_falls_back_to_h264(self):
+        self.assertEqual(get_video_codec_args('mpeg2', '高'), BASELINE_ARGS[('h264', '中')])
+
+    def test_overrides(self):
+        args = get_video_codec_args('h264', '中', overrides={'preset': 'ultrafast', 'threads': 2})
+        self.assertEqual(args, ['-c:v', 'libx264', '-crf', '25', '-preset', 'ultrafast', '-threads', '2',
+                                '-pix_fmt', 'yuv420p'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import unittest
+from recorder.progress import ProgressStats
+
+
+def feed_block(stats, **fields):
+    """按 -progress 的格式逐行输入一个采样块，返回该采样"""
+    sample = None
+    for key, value in fields.items():
+        sample = stats.feed_line(f"{key}={value}\n".encode())
+    return sample
+
+
+# ffmpeg -progress pipe:1 输出的一个完整采样块
+PROGRESS_BLOCK = b"""frame=150
+fps=30.00
+stream_0_0_q=28.0
+bitrate=1234.5kbits/s
+total_size=771328
+out_time_us=5000000
+out_time_ms=5000000
+out_time=00:00:05.000000
+dup_frames=2
+drop_frames=1
+speed=1.01x
+progress=continue
+"""
+
+# 刚启动时的采样块，多个字段为N/A
+STARTUP_BLOCK = b"""frame=0
+fps=0.00
+stream_0_0_q=0.0
+bitrate=N/A
+total_size=N/A
+out_time_us=N/A
+out_time_ms=N/A
+out_time=N/A
+dup_frames=0
+drop_frames=0
+speed=N/A
+progress=continue
+"""
+
+
+def feed_text(stats, text):
+    """逐行输入，返回所有完成的采样"""
+    samples = []
+    for line in text.splitlines(keepends=True):
+        sample = stats.feed_line(line)
+        if sample is not None:
+            samples.append(sample)
+    return samples
+
+
+class ProgressParseTest(unittest.TestCase):
+
+    def test_parses_block(self):
+        stats = ProgressStats('s1')
+        samples = feed_text(stats, PROGRESS_BLOCK)
+        self.assertEqual(len(samples), 1)
+        sample = samples[0]
+        self.assertEqual(sample['frame'], 150)
+        self.assertEqual(sample['fps'], 30.0)
+        self.assertEqual(sample['bitrate_kbps'], 1234.5)
+        self.assertEqual(sample['total_size'], 771328)
+        self.assertEqual(sample['out_time_seconds'], 5.0)
+        self.assertEqual((sample['dup_frames'], sample['drop_frames']), (2, 1))
+        self.assertEqual(sample['speed'], 1.01)
+        self.assertEqual(sample['progress'], 'continue')
+        self.assertIs(stats.latest, sample)
+        self.assertEqual(stats.sample_count, 1)
+
+    def test_partial_block_is_pending(self):
+        stats = ProgressStats('s1')
+        self.assertEqual(feed_text(stats, b"frame=10\nfps=25.0\n"), [])
+        self.assertEqual(stats.latest, {})
+        self.assertEqual(stats.pending, {'frame': '10', 'fps': '25.0'})
+
+    def test_out_time_ms_fallback(self):
+        # 部分FFmpeg版本只输出 out_time_ms（单位实际也是微秒）
+        sample = feed_block(ProgressStats('s1'), out_time_ms=2500000, progress='continue')
+        self.assertEqual(sample['out_time_seconds'], 2.5)
+
+    def test_out_time_us_preferred(self):
+        sample = feed_block(ProgressStats('s1'), out_time_us=3000000, out_time_ms=9, progress='continue')
+        self.assertEqual(sample['out_time_seconds'], 3.0)
+
+    def test_not_available_values(self):
+        sample = feed_text(ProgressStats('s1'), STARTUP_BLOCK)[0]
+        self.assertEqual(sample['frame'], 0)
+        for key in ('bitrate_kbps', 'total_size', 'out_time_seconds', 'speed'):
+            self.assertIsNone(sample[key], key)
+
+    def test_end_block(self):
+        stats = ProgressStats('s1')
+        samples = feed_text(stats, PROGRESS_BLOCK + PROGRESS_BLOCK.replace(b'progress=continue', b'progress=end'))
+        self.assertEqual([s['progress'] for s in samples], ['continue', 'end'])
+        self.assertEqual(stats.latest['progress'], 'end')
+        self.assertEqual(len(stats.snapshot()['history']), 2)
+
+    def test_ignores_noise(self):
+        stats = ProgressStats('s1')
+        self.assertIsNone(stats.feed_line(b''))
+        self.assertIsNone(stats.feed_line('no separator'))
+        self.assertIsNone(stats.started_at)
+
+    def test_history_size_and_reset(self):
+        stats = ProgressStats('s1', history_size=3)
+        for _ in range(5):
+            feed_text(stats, PROGRESS_BLOCK)
+        self.assertEqual(len(stats.history), 3)
+        self.assertEqual(stats.sample_count, 5)
+        stats.reset(input_framerate=30)
+        self.assertEqual((len(stats.history), stats.sample_count, stats.input_framerate), (0, 0, 30))
+        self.assertIsNone(stats.started_at)
+
+
+class BelowRealtimeTest(unittest.TestCase):
+
+    def test_warns_once_and_recovers(self):
+        stats = ProgressStats('s1')
+        with self.assertLogs('recorder.progress', 'INFO') as logs:
+            feed_block(stats, speed='0.8x', progress='continue')
+            self.assertTrue(stats.below_realtime)
+            feed_block(stats, speed='0.7x', progress='continue')
+            feed_block(stats, speed='1.0x', progress='continue')
+            self.assertFalse(stats.below_realtime)
+        self.assertEqual([r.levelname for r in logs.records], ['WARNING', 'INFO'])
+        self.assertTrue(stats.snapshot()['below_realtime'] is False)
+
+    def test_threshold(self):
+        stats = ProgressStats('s1')
+        feed_block(stats, speed='0.999x', progress='continue')
+        self.assertTrue(stats.below_realtime)
+        # 没有速度的采样不改变状态
+        feed_block(stats, speed='N/A', progress='continue')
+        self.assertTrue(stats.below_realtime)
+
+    def test_realtime_does_not_warn(self):
+        stats = ProgressStats('s1')
+        feed_block(stats, speed='1.00x', progress='continue')
+        self.assertFalse(stats.below_realtime)
+
+
+class DedupFramesTest(unittest.TestCase):
+
+    def test_estimated_from_output_time(self):
+        stats = ProgressStats('s1', input_framerate=25)
+        sample = feed_block(stats, frame=51, out_time_us=10000000, progress='continue')
+        # 10秒捕获约251帧，输出51帧
+        self.assertEqual(sample['dedup_frames'], 200)
+
+    def test_ignores_startup_latency(self):
+        stats = ProgressStats('s1', input_framerate=25)
+        stats.started_at = 0  # 启动耗时很长也不影响估算
+        sample = feed_block(stats, frame=26, out_time_us=1000000, progress='continue')
+        self.assertEqual(sample['dedup_frames'], 0)
+
+    def test_not_estimated_without_output(self):
+        stats = ProgressStats('s1', input_framerate=25)
+        self.assertIsNone(feed_block(stats, frame=0, out_time_us=0, progress='continue')['dedup_frames'])
+        self.assertIsNone(feed_block(ProgressStats('s2'), frame=10, out_time_us=1000000,
+                                     progress='continue')['dedup_frames'])
+
+
+if __name__ == '__main__':
+    unittest.main()
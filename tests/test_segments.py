@@ -0,0 +1,122 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from recorder.segments import SegmentManifest, get_segment_seconds, get_segment_size_bytes
+
+
+class SegmentConfigTest(unittest.TestCase):
+
+    def test_segment_seconds(self):
+        self.assertEqual(get_segment_seconds({'segment_minutes': 1.5}), 90)
+        self.assertEqual(get_segment_seconds({}), 0)
+        self.assertEqual(get_segment_seconds({'segment_minutes': 'abc'}), 0)
+        self.assertEqual(get_segment_seconds({'segment_minutes': -5}), 0)
+
+    def test_segment_size(self):
+        self.assertEqual(get_segment_size_bytes({'segment_size_mb': 2}), 2 * 1024 * 1024)
+        self.assertEqual(get_segment_size_bytes({'segment_size_mb': None}), 0)
+
+
+class SegmentManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.list_path = os.path.join(self.tmp_dir, 'rec.segments.csv')
+        self.manifest_path = os.path.join(self.tmp_dir, 'rec.segments.json')
+        self.manifest = SegmentManifest('s1', self.list_path, self.manifest_path)
+        self.closed = []
+        self.manifest.add_listener(self.closed.append)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def write_media(self, name, size):
+        with open(os.path.join(self.tmp_dir, name), 'wb') as f:
+            f.write(b'\0' * size)
+
+    def write_list(self, text):
+        with open(self.list_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+
+    def load_json(self):
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_missing_list(self):
+        self.assertEqual(self.manifest.poll(), [])
+        self.assertFalse(os.path.exists(self.manifest_path))
+
+    def test_poll_reads_new_rows_once(self):
+        self.write_media('seg_000.mkv', 10)
+        self.write_list('seg_000.mkv,0.000000,60.000000\n')
+        new = self.manifest.poll()
+        self.assertEqual([s['file'] for s in new], ['seg_000.mkv'])
+        self.assertEqual((new[0]['index'], new[0]['start'], new[0]['end'], new[0]['size']), (0, 0.0, 60.0, 10))
+        self.assertEqual(new[0]['path'], os.path.join(self.tmp_dir, 'seg_000.mkv'))
+
+        self.write_list('seg_000.mkv,0.000000,60.000000\nseg_001.mkv,60.000000,120.000000\n')
+        self.assertEqual([s['file'] for s in self.manifest.poll()], ['seg_001.mkv'])
+        self.assertEqual(self.manifest.poll(), [])
+        self.assertEqual([s['file'] for s in self.closed], ['seg_000.mkv', 'seg_001.mkv'])
+        self.assertEqual(self.manifest.next_index(), 2)
+
+    def test_skips_row_being_written(self):
+        self.write_list('seg_000.mkv,0.000000,60.000000\nseg_001.mkv,60.0,\nseg_002\n')
+        self.assertEqual([s['file'] for s in self.manifest.poll()], ['seg_000.mkv'])
+        # 行写完整后在下一次读取时登记
+        self.write_list('seg_000.mkv,0.000000,60.000000\nseg_001.mkv,60.0,120.0\n')
+        self.assertEqual([s['file'] for s in self.manifest.poll()], ['seg_001.mkv'])
+
+    def test_media_dir(self):
+        media_dir = os.path.join(self.tmp_dir, 'staging')
+        manifest = SegmentManifest('s2', self.list_path, self.manifest_path, media_dir=media_dir)
+        self.write_list('seg_000.mkv,0,60\n')
+        segment = manifest.poll()[0]
+        self.assertEqual(segment['path'], os.path.join(media_dir, 'seg_000.mkv'))
+        self.assertEqual(segment['size'], 0)
+
+    def test_add_incomplete(self):
+        self.assertIsNone(self.manifest.add_incomplete(os.path.join(self.tmp_dir, 'missing.mkv')))
+        self.write_media('seg_000.mkv', 5)
+        self.write_list('seg_000.mkv,0,60\n')
+        self.manifest.poll()
+        self.write_media('seg_001.mkv', 7)
+        segment = self.manifest.add_incomplete(os.path.join(self.tmp_dir, 'seg_001.mkv'))
+        self.assertEqual((segment['index'], segment['size'], segment['incomplete']), (1, 7, True))
+        self.assertIsNone(segment['start'])
+        self.assertEqual(self.closed[-1], segment)
+        self.assertEqual(self.manifest.next_index(), 2)
+
+    def test_manifest_json(self):
+        self.write_media('seg_000.mkv', 3)
+        self.write_list('seg_000.mkv,0,60\n')
+        segment = self.manifest.poll()[0]
+        self.manifest.update_gaps([{'start': '2024-01-01 10:00:00', 'end': '2024-01-01 10:00:05'}])
+        moved = os.path.join(self.tmp_dir, 'final', 'seg_000.mkv')
+        self.manifest.update_path(segment, moved)
+
+        data = self.load_json()
+        self.assertEqual(data['session_id'], 's1')
+        self.assertEqual(len(data['segments']), 1)
+        self.assertEqual(data['segments'][0]['path'], moved)
+        self.assertEqual(data['segments'][0]['end'], 60.0)
+        self.assertEqual(data['gaps'][0]['end'], '2024-01-01 10:00:05')
+        self.assertFalse(os.path.exists(self.manifest_path + '.tmp'))
+
+    def test_listener_error_does_not_stop_others(self):
+        def broken(segment):
+            raise RuntimeError('boom')
+        manifest = SegmentManifest('s3', self.list_path, self.manifest_path)
+        received = []
+        manifest.add_listener(broken)
+        manifest.add_listener(received.append)
+        self.write_list('seg_000.mkv,0,60\n')
+        with self.assertLogs('recorder.segments', 'ERROR'):
+            manifest.poll()
+        self.assertEqual(len(received), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
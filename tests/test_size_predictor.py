@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+from recorder.size_predictor import (
+    SizePredictor, get_schedule_occurrences, get_channel, get_profile_key, HISTORY_SIZE,
+)
+
+# 2024-01-01 是星期一
+NOW = datetime(2024, 1, 1, 12, 0, 0)
+
+VIDEO_CONFIG = {
+    'video_codec': 'h264', 'record_quality': '中', 'resolution': '1280x720', 'framerate': '25',
+    'douyin_url': 'https://live.example.com/123', 'duration_minutes': 60,
+}
+AUDIO_CONFIG = {'capture_mode': 'audio_only', 'audio_codec': 'aac', 'audio_bitrate': '128k', 'duration_minutes': 60}
+
+
+def occurrences(start_time, now=NOW, **config):
+    config = dict({'start_time': start_time, 'duration_minutes': 60}, **config)
+    return [t.strftime('%m-%d %H:%M') for t in get_schedule_occurrences(config, now=now)]
+
+
+class ScheduleOccurrencesTest(unittest.TestCase):
+
+    def test_single_future(self):
+        self.assertEqual(occurrences('2024-01-02 10:00:00'), ['01-02 10:00'])
+
+    def test_single_in_progress(self):
+        self.assertEqual(occurrences('2024-01-01 11:30:00'), ['01-01 11:30'])
+
+    def test_single_finished_or_outside_window(self):
+        self.assertEqual(occurrences('2024-01-01 10:00:00'), [])
+        self.assertEqual(occurrences('2024-01-09 10:00:00'), [])
+
+    def test_invalid_start_time(self):
+        self.assertEqual(occurrences(''), [])
+        self.assertEqual(occurrences('tomorrow'), [])
+
+    def test_everyday(self):
+        result = occurrences('2024-01-01 10:00:00', enable_recurring=True, recurring_days={'everyday': True})
+        self.assertEqual(result, [f'01-0{d} 10:00' for d in range(2, 9)])
+
+    def test_weekdays(self):
+        days = {'monday': True, 'wednesday': True}
+        result = occurrences('2024-01-01 14:00:00', enable_recurring=True, recurring_days=days)
+        # 下周一14:00已超出7天窗口
+        self.assertEqual(result, ['01-01 14:00', '01-03 14:00'])
+
+    def test_recurring_start_in_the_past(self):
+        days = {'friday': True}
+        result = occurrences('2023-12-01 20:00:00', enable_recurring=True, recurring_days=days)
+        self.assertEqual(result, ['01-05 20:00'])
+
+    def test_recurring_without_days(self):
+        self.assertEqual(occurrences('2024-01-02 10:00:00', enable_recurring=True, recurring_days={}),
+                         ['01-02 10:00'])
+
+    def test_disabled_recurring_ignores_days(self):
+        self.assertEqual(occurrences('2024-01-02 10:00:00', recurring_days={'everyday': True}), ['01-02 10:00'])
+
+    def test_window(self):
+        config = {'start_time': '2024-01-01 13:00:00', 'duration_minutes': 60,
+                  'enable_recurring': True, 'recurring_days': {'everyday': True}}
+        self.assertEqual(len(get_schedule_occurrences(config, window_days=2, now=NOW)), 2)
+
+
+class ProfileKeyTest(unittest.TestCase):
+
+    def test_keys(self):
+        self.assertEqual(get_profile_key(VIDEO_CONFIG), 'h264/中/1280x720/25')
+        self.assertEqual(get_profile_key(dict(VIDEO_CONFIG, vfr_mode=True, separate_audio=True)),
+                         'h264/中/1280x720/25/vfr/separate_audio')
+        self.assertEqual(get_profile_key(AUDIO_CONFIG), 'audio/aac/128k')
+        self.assertEqual(get_profile_key({'capture_mode': 'stream_copy', 'stream_source': {'url': 'x'}}), 'copy')
+
+    def test_channel(self):
+        self.assertEqual(get_channel(VIDEO_CONFIG), 'live.example.com/123')
+        self.assertEqual(get_channel({'douyin_url': 'live.example.com/123/'}), 'live.example.com/123')
+        self.assertEqual(get_channel(dict(VIDEO_CONFIG, silent_mode=True)), 'screen')
+        self.assertEqual(get_channel({}), 'screen')
+
+
+class BytesPerSecondTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        self.history_path = os.path.join(self.tmp_dir, 'size_history.json')
+        self.predictor = SizePredictor(self.history_path)
+
+    def test_estimate_without_history(self):
+        self.assertEqual(self.predictor.bytes_per_second(AUDIO_CONFIG), (16000, 'estimate', 0))
+
+    def test_channel_history(self):
+        self.predictor.record(VIDEO_CONFIG, 2000000, 1000)
+        self.predictor.record(VIDEO_CONFIG, 4000000, 1000)
+        self.assertEqual(self.predictor.bytes_per_second(VIDEO_CONFIG), (3000, 'channel', 2))
+
+    def test_falls_back_to_profile(self):
+        self.predictor.record(dict(VIDEO_CONFIG, douyin_url='https://live.example.com/a'), 1000000, 1000)
+        self.predictor.record(dict(VIDEO_CONFIG, douyin_url='https://live.example.com/b'), 3000000, 1000)
+        other_channel = dict(VIDEO_CONFIG, douyin_url='https://live.example.com/c')
+        self.assertEqual(self.predictor.bytes_per_second(other_channel), (2000, 'profile', 2))
+
+    def test_other_profile_uses_estimate(self):
+        self.predictor.record(dict(AUDIO_CONFIG, audio_bitrate='320k'), 5000000, 1000)
+        self.assertEqual(self.predictor.bytes_per_second(AUDIO_CONFIG)[1:], ('estimate', 0))
+
+    def test_ignores_short_or_empty_recordings(self):
+        self.predictor.record(VIDEO_CONFIG, 1000000, 30)
+        self.predictor.record(VIDEO_CONFIG, 0, 1000)
+        self.assertEqual(self.predictor.history, {})
+
+    def test_history_is_capped_and_persisted(self):
+        for i in range(HISTORY_SIZE + 5):
+            self.predictor.record(VIDEO_CONFIG, (i + 1) * 1000, 100)
+        reloaded = SizePredictor(self.history_path)
+        samples = reloaded.history[get_profile_key(VIDEO_CONFIG)][get_channel(VIDEO_CONFIG)]
+        self.assertEqual(len(samples), HISTORY_SIZE)
+        self.assertEqual(samples[-1]['bytes'], (HISTORY_SIZE + 5) * 1000)
+
+    def test_predict(self):
+        self.predictor.record(VIDEO_CONFIG, 3000000, 1000)
+        prediction = self.predictor.predict(VIDEO_CONFIG)
+        self.assertEqual((prediction['bytes'], prediction['bytes_per_minute'], prediction['source']),
+                         (3000 * 3600, 3000 * 60, 'channel'))
+
+    def test_predict_schedule(self):
+        self.predictor.record(VIDEO_CONFIG, 1000000, 1000)
+        config = dict(VIDEO_CONFIG, start_time='2024-01-01 10:00:00', enable_recurring=True,
+                      recurring_days={'everyday': True}, storage_reserve_mb=0)
+        with mock.patch('recorder.size_predictor.get_free_bytes', return_value=20 * 1000 * 3600):
+            result = self.predictor.predict_schedule(config, now=NOW)
+        self.assertEqual(result['recordings'], 7)
+        self.assertEqual(result['total_bytes'], 7 * 1000 * 3600)
+        self.assertTrue(result['fits'])
+        with mock.patch('recorder.size_predictor.get_free_bytes', return_value=5 * 1000 * 3600):
+            self.assertFalse(self.predictor.predict_schedule(config, now=NOW)['fits'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+import unittest
+from recorder.progress import ProgressStats
+from recorder.profiles import profile_registry
+from recorder.speed_controller import (
+    SpeedController, build_speed_steps, MIN_FRAMERATE, SLOW_CHECKS, FAST_CHECKS, SPEED_SAMPLES, WARMUP_SAMPLES,
+)
+
+
+class FakeSession:
+    def __init__(self, session_id='s1', segmented=True, **config):
+        self.session_id = session_id
+        self.segmented = segmented
+        self.config = dict({'video_codec': 'h264', 'record_quality': '中', 'framerate': '25'}, **config)
+        self.stats = ProgressStats(session_id)
+        self.pending_reconfigure = None
+        self.requests = []
+        self.frames_lost = 0
+
+    def request_reconfigure(self, overrides, framerate, reason):
+        self.requests.append((overrides, framerate))
+
+    def feed(self, speed, frame_loss=0, count=WARMUP_SAMPLES + SPEED_SAMPLES):
+        """输入一批采样，frame_loss 为这批采样期间新增的丢帧数"""
+        for i in range(count):
+            if i == count - 1:
+                self.frames_lost += frame_loss
+            for line in (f"drop_frames={self.frames_lost}", f"speed={speed}x", "progress=continue"):
+                self.stats.feed_line(line)
+
+
+class FakeManager:
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    def active_sessions(self):
+        return list(self.sessions)
+
+
+def run_checks(controller, session, cpu_percent, times, speed=1.0, frame_loss=0):
+    for _ in range(times):
+        session.feed(speed, frame_loss)
+        controller.check_all(cpu_percent)
+
+
+class BuildSpeedStepsTest(unittest.TestCase):
+
+    def test_preset_then_framerate(self):
+        steps = build_speed_steps(profile_registry.get('h264/中'), 25)
+        self.assertEqual(steps[:3], [({}, 25), ({'preset': 'superfast'}, 25), ({'preset': 'ultrafast'}, 25)])
+        self.assertEqual([f for _, f in steps[3:]], [18, 13])
+        self.assertTrue(all(o == {'preset': 'ultrafast'} for o, _ in steps[3:]))
+
+    def test_framerate_floor(self):
+        for base in (10, 12, 25, 60):
+            with self.subTest(base=base):
+                steps = build_speed_steps(profile_registry.get('h264/低'), base)
+                self.assertGreaterEqual(min(f for _, f in steps), min(base, MIN_FRAMERATE))
+                self.assertLess(steps[-1][1] * 0.75, MIN_FRAMERATE)
+        self.assertEqual(len(build_speed_steps(profile_registry.get('h264/低'), 10)), 3)
+
+    def test_numeric_speed(self):
+        steps = build_speed_steps(profile_registry.get('vp9/中'), 10)
+        self.assertEqual([o for o, _ in steps], [{}] + [{'speed': v} for v in range(3, 9)])
+
+
+class SpeedControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = FakeSession()
+        self.controller = SpeedController(FakeManager([self.session]))
+
+    def test_steps_down_when_slow(self):
+        run_checks(self.controller, self.session, 50, SLOW_CHECKS - 1, speed=0.8)
+        self.assertEqual(self.session.requests, [])
+        run_checks(self.controller, self.session, 50, 1, speed=0.8)
+        self.assertEqual(self.session.requests, [({'preset': 'superfast'}, 25)])
+
+    def test_steps_down_on_high_cpu_with_frame_loss(self):
+        run_checks(self.controller, self.session, 95, SLOW_CHECKS, frame_loss=3)
+        self.assertEqual(len(self.session.requests), 1)
+
+    def test_high_cpu_without_frame_loss_holds(self):
+        run_checks(self.controller, self.session, 95, SLOW_CHECKS + FAST_CHECKS)
+        self.assertEqual(self.session.requests, [])
+
+    def test_steps_up_with_headroom(self):
+        run_checks(self.controller, self.session, 50, SLOW_CHECKS, speed=0.8)
+        run_checks(self.controller, self.session, 50, FAST_CHECKS - 1)
+        self.assertEqual(len(self.session.requests), 1)
+        run_checks(self.controller, self.session, 50, 1)
+        self.assertEqual(self.session.requests[-1], ({}, 25))
+
+    def test_no_step_up_with_frame_loss(self):
+        run_checks(self.controller, self.session, 50, SLOW_CHECKS, speed=0.8)
+        run_checks(self.controller, self.session, 50, FAST_CHECKS, frame_loss=1)
+        self.assertEqual(len(self.session.requests), 1)
+
+    def test_keeps_base_overrides(self):
+        session = FakeSession(encoding_overrides={'crf': 30})
+        controller = SpeedController(FakeManager([session]))
+        run_checks(controller, session, 50, SLOW_CHECKS, speed=0.8)
+        self.assertEqual(session.requests, [({'crf': 30, 'preset': 'superfast'}, 25)])
+
+    def test_stops_at_last_step(self):
+        steps = build_speed_steps(profile_registry.get('h264/中'), 25)
+        run_checks(self.controller, self.session, 50, SLOW_CHECKS * (len(steps) + 2), speed=0.5)
+        self.assertEqual(len(self.session.requests), len(steps) - 1)
+        self.assertEqual(self.session.requests[-1][1], 13)
+        self.assertGreaterEqual(min(f for _, f in self.session.requests), MIN_FRAMERATE)
+
+    def test_waits_for_pending_reconfigure(self):
+        self.session.pending_reconfigure = ({'preset': 'superfast'}, 25, '')
+        run_checks(self.controller, self.session, 50, SLOW_CHECKS, speed=0.5)
+        self.assertEqual(self.session.requests, [])
+
+    def test_ignores_warmup_samples(self):
+        for _ in range(SLOW_CHECKS):
+            self.session.feed(0.5, count=WARMUP_SAMPLES)
+            self.controller.check_all(50)
+        self.assertEqual(self.session.requests, [])
+
+    def test_ignores_non_segmented_sessions(self):
+        session = FakeSession('s2', segmented=False)
+        controller = SpeedController(FakeManager([session]))
+        run_checks(controller, session, 99, SLOW_CHECKS * 3, speed=0.5, frame_loss=5)
+        self.assertEqual(session.requests, [])
+        self.assertEqual(controller.session_states, {})
+
+    def test_ignores_stream_copy_and_disabled(self):
+        sessions = [
+            FakeSession('s3', capture_mode='stream_copy', stream_source={'url': 'x'}),
+            FakeSession('s4', adaptive_speed=False),
+        ]
+        controller = SpeedController(FakeManager(sessions))
+        for _ in range(SLOW_CHECKS * 2):
+            for session in sessions:
+                session.feed(0.5)
+            controller.check_all(50)
+        self.assertEqual([s.requests for s in sessions], [[], []])
+
+    def test_forgets_finished_sessions(self):
+        run_checks(self.controller, self.session, 50, 1, speed=0.8)
+        self.assertIn('s1', self.controller.session_states)
+        self.controller.session_manager.sessions = []
+        self.controller.check_all(50)
+        self.assertEqual(self.controller.session_states, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import deque
+from unittest import mock
+from recorder.storage import StorageWatchdog, get_degrade_steps
+
+MB = 1024 * 1024
+
+# 每秒写入字节数：按质量取基准值，再按帧率缩放
+QUALITY_RATES = {'高': 3 * MB, '中': 2 * MB, '低': 1 * MB}
+
+
+def fake_estimate(config):
+    if 'rate' in config:
+        return config['rate']
+    return QUALITY_RATES[config.get('record_quality', '中')] * float(config.get('framerate', '25')) / 25
+
+
+class FakeSession:
+    def __init__(self, session_id, final_dir, **config):
+        self.session_id = session_id
+        self.final_dir = final_dir
+        self.config = dict({'duration_minutes': 10}, **config)
+        self.started_at = None
+        self.staging_dir = None
+        self.written = 0
+        self.staging_stopped = False
+
+    def bytes_written(self):
+        return self.written
+
+    def is_staging(self):
+        return bool(self.staging_dir)
+
+    def stop_staging(self):
+        self.staging_stopped = True
+
+
+class FakeManager:
+    def __init__(self, sessions=()):
+        self.sessions = list(sessions)
+        self.stopped = []
+
+    def active_sessions(self):
+        return list(self.sessions)
+
+    def stop_recording(self, session_id):
+        self.stopped.append(session_id)
+        return True
+
+
+def base_config(**fields):
+    # 10分钟、1GB保留空间
+    return dict({'save_path': '/videos', 'duration_minutes': 10, 'storage_reserve_mb': 1024,
+                 'record_quality': '高', 'framerate': '30'}, **fields)
+
+
+class AdmitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.manager = FakeManager()
+        self.watchdog = StorageWatchdog(self.manager, estimate=fake_estimate)
+
+    def admit(self, config, free_bytes):
+        with mock.patch('recorder.storage.get_free_bytes', return_value=free_bytes):
+            return self.watchdog.admit(config)
+
+    def test_fits(self):
+        config = base_config()
+        self.assertEqual(self.admit(config, 1024 * MB + 600 * 3.6 * MB), config)
+
+    def test_off_skips_check(self):
+        config = base_config(storage_policy='off')
+        self.assertIs(self.admit(config, 0), config)
+
+    def test_refuse(self):
+        with self.assertLogs('recorder.storage', 'ERROR'):
+            self.assertIsNone(self.admit(base_config(storage_policy='refuse'), 1024 * MB + 100 * MB))
+
+    def test_degrade_lowers_quality_first(self):
+        # 600秒 × 2.4MB/s（中，30fps）= 1440MB
+        with self.assertLogs('recorder.storage', 'WARNING'):
+            config = self.admit(base_config(), 1024 * MB + 1500 * MB)
+        self.assertEqual((config['record_quality'], config['framerate']), ('中', '30'))
+
+    def test_degrade_then_framerate(self):
+        # 低质量30fps需要720MB，15fps需要360MB
+        config = self.admit(base_config(), 1024 * MB + 400 * MB)
+        self.assertEqual((config['record_quality'], config['framerate']), ('低', '15'))
+
+    def test_degrade_exhausted(self):
+        with self.assertLogs('recorder.storage', 'ERROR'):
+            self.assertIsNone(self.admit(base_config(), 1024 * MB + 10 * MB))
+
+    def test_stream_copy_is_not_degraded(self):
+        config = base_config(capture_mode='stream_copy', stream_source={'url': 'x'}, rate=2 * MB)
+        with self.assertLogs('recorder.storage', 'ERROR'):
+            self.assertIsNone(self.admit(config, 1024 * MB + 1000 * MB))
+
+    def test_counts_running_sessions_on_same_volume(self):
+        config = base_config(record_quality='低', framerate='25')   # 需要600MB
+        self.assertIsNotNone(self.admit(config, 1024 * MB + 1000 * MB))
+        # 同一卷上进行中的会话还要写入 600秒 × 1MB/s
+        self.manager.sessions = [FakeSession('s1', '/videos', rate=1 * MB)]
+        with self.assertLogs('recorder.storage', 'ERROR'):
+            self.assertIsNone(self.admit(dict(config, storage_policy='refuse'), 1024 * MB + 1000 * MB))
+        # 其他卷上的会话不影响
+        self.manager.sessions = [FakeSession('s1', '/other', rate=1 * MB)]
+        self.assertIsNotNone(self.admit(config, 1024 * MB + 1000 * MB))
+
+    def test_staging_full_writes_to_save_path(self):
+        staging_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging_dir, ignore_errors=True)
+        config = base_config(staging_dir=staging_dir, segment_enabled=True, segment_minutes=1,
+                             staging_reserve_mb=256)
+        # 两个1分钟分段（高质量30fps）需要432MB，内存盘只剩300MB
+        free = {staging_dir: 300 * MB, '/videos': 100 * 1024 * MB}
+        with mock.patch('recorder.storage.get_free_bytes', side_effect=lambda path: free[path]):
+            with self.assertLogs('recorder.storage', 'WARNING'):
+                admitted = self.watchdog.admit(config)
+            self.assertEqual(admitted['staging_dir'], '')
+            free[staging_dir] = 1024 * MB
+            self.assertEqual(self.watchdog.admit(config)['staging_dir'], staging_dir)
+
+    def test_degrade_steps(self):
+        self.assertEqual(get_degrade_steps({'record_quality': '中', 'framerate': '40'}),
+                         [{'record_quality': '低'}, {'record_quality': '低', 'framerate': '20'},
+                          {'record_quality': '低', 'framerate': '10'}])
+        self.assertEqual(get_degrade_steps({'record_quality': '低', 'framerate': '15'}), [])
+
+
+class CheckTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sessions = [
+            FakeSession('slow', '/videos', rate=1 * MB),
+            FakeSession('fast', '/videos', rate=5 * MB),
+            FakeSession('other', '/other', rate=9 * MB),
+        ]
+        self.manager = FakeManager(self.sessions)
+        self.watchdog = StorageWatchdog(self.manager, estimate=fake_estimate)
+
+    def check(self, free_by_path):
+        with mock.patch('recorder.storage.get_free_bytes', side_effect=lambda path: free_by_path[path]):
+            self.watchdog.check()
+
+    def test_stops_fastest_session_on_full_volume(self):
+        with self.assertLogs('recorder.storage', 'ERROR'):
+            self.check({'/videos': 100 * MB, '/other': 100 * 1024 * MB})
+        self.assertEqual(self.manager.stopped, ['fast'])
+
+    def test_uses_measured_rate(self):
+        # 实测写入速率高于估算值时按实测值选择
+        self.watchdog.samples['slow'] = deque([(0, 0), (20, 200 * MB)])
+        self.sessions[0].written = 200 * MB
+        with mock.patch('recorder.storage.time.time', return_value=20):
+            with self.assertLogs('recorder.storage', 'ERROR'):
+                self.check({'/videos': 100 * MB, '/other': 100 * 1024 * MB})
+        self.assertEqual(self.manager.stopped, ['slow'])
+
+    def test_forecast_and_warning(self):
+        # (1024 + 60×6)MB 可用，合计6MB/s，约1分钟写满
+        with self.assertLogs('recorder.storage', 'WARNING'):
+            self.check({'/videos': (1024 + 360) * MB, '/other': 100 * 1024 * MB})
+        self.assertEqual(self.manager.stopped, [])
+        forecast = self.watchdog.get_forecast()['/videos']
+        self.assertEqual(forecast['bytes_per_second'], 6 * MB)
+        self.assertAlmostEqual(forecast['seconds_to_full'], 60)
+
+    def test_staging_volume_full(self):
+        staging = FakeSession('staged', '/videos', rate=1 * MB, segment_enabled=True, segment_minutes=1)
+        staging.staging_dir = '/dev/shm/rec'
+        self.manager.sessions = [staging]
+        # 两个1分钟分段需要120MB，再加256MB保留
+        self.check({'/videos': 100 * 1024 * MB, '/dev/shm/rec': 300 * MB})
+        self.assertTrue(staging.staging_stopped)
+        self.assertEqual(self.watchdog.get_forecast()['/dev/shm/rec']['needed_bytes'], 120 * MB)
+
+
+if __name__ == '__main__':
+    unittest.main()
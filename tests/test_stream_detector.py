@@ -0,0 +1,89 @@
+import json
+import unittest
+from browser.stream_detector import classify_media_url, extract_media_urls, wait_for_media_url
+
+HLS_URL = 'https://pull-hls-l1.example.com/stage/stream-123_or4.m3u8?expire=1700000000&sign=abc'
+FLV_URL = 'https://pull-flv-l1.example.com/stage/stream-123_or4.flv?expire=1700000000&sign=abc'
+
+
+def make_entry(method, params):
+    """构造 driver.get_log('performance') 返回的日志条目"""
+    return {'level': 'INFO', 'timestamp': 0, 'message': json.dumps({'message': {'method': method, 'params': params}})}
+
+
+def request_entry(url, headers=None):
+    return make_entry('Network.requestWillBeSent', {'request': {'url': url, 'headers': headers or {}}})
+
+
+def response_entry(url, mime_type, headers=None):
+    return make_entry('Network.responseReceived', {
+        'response': {'url': url, 'mimeType': mime_type, 'requestHeaders': headers or {}},
+    })
+
+
+class FakeDriver:
+    """按调用顺序返回预设的性能日志"""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def get_log(self, log_type):
+        return self.batches.pop(0) if self.batches else []
+
+
+class ClassifyMediaUrlTest(unittest.TestCase):
+
+    def test_by_extension(self):
+        self.assertEqual(classify_media_url(HLS_URL), 'hls')
+        self.assertEqual(classify_media_url(FLV_URL), 'flv')
+        self.assertEqual(classify_media_url('https://example.com/live/INDEX.M3U8'), 'hls')
+
+    def test_by_mime_type(self):
+        url = 'https://example.com/live/playlist?id=1'
+        self.assertEqual(classify_media_url(url, 'application/vnd.apple.mpegurl'), 'hls')
+        self.assertEqual(classify_media_url(url, 'video/x-flv; charset=binary'), 'flv')
+
+    def test_ignores_other_requests(self):
+        self.assertIsNone(classify_media_url('https://example.com/app.js'))
+        self.assertIsNone(classify_media_url('https://example.com/flv.js'))
+        self.assertIsNone(classify_media_url('https://example.com/segment.ts'))
+        self.assertIsNone(classify_media_url('blob:https://example.com/1234.flv'))
+        self.assertIsNone(classify_media_url(''))
+
+
+class ExtractMediaUrlsTest(unittest.TestCase):
+
+    def test_extracts_in_order_without_duplicates(self):
+        logs = [
+            request_entry('https://example.com/index.html'),
+            request_entry(HLS_URL, {'Referer': 'https://live.example.com/123'}),
+            response_entry(HLS_URL, 'application/vnd.apple.mpegurl'),
+            response_entry(FLV_URL, 'video/x-flv', {'User-Agent': 'test'}),
+        ]
+        urls = extract_media_urls(logs)
+        self.assertEqual([u['url'] for u in urls], [HLS_URL, FLV_URL])
+        self.assertEqual([u['kind'] for u in urls], ['hls', 'flv'])
+        self.assertEqual(urls[0]['headers'], {'Referer': 'https://live.example.com/123'})
+        self.assertEqual(urls[1]['headers'], {'User-Agent': 'test'})
+
+    def test_skips_malformed_entries(self):
+        logs = [{'message': 'not json'}, {}, None, request_entry(FLV_URL)]
+        self.assertEqual([u['url'] for u in extract_media_urls(logs)], [FLV_URL])
+
+
+class WaitForMediaUrlTest(unittest.TestCase):
+
+    def test_prefers_flv(self):
+        driver = FakeDriver([[request_entry(HLS_URL), request_entry(FLV_URL)]])
+        self.assertEqual(wait_for_media_url(driver, timeout=1, interval=0)['url'], FLV_URL)
+
+    def test_polls_until_found(self):
+        driver = FakeDriver([[], [request_entry('https://example.com/app.js')], [request_entry(HLS_URL)]])
+        self.assertEqual(wait_for_media_url(driver, timeout=5, interval=0)['kind'], 'hls')
+
+    def test_timeout(self):
+        self.assertIsNone(wait_for_media_url(FakeDriver([]), timeout=0.05, interval=0.01))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+from recorder.ffmpeg_helper import build_tee_slave, escape_tee
+
+WHITESPACES = ' \n\t\r'
+
+
+def get_token(buf, term):
+    """按FFmpeg av_get_token 的规则读取一个记号，返回 (记号, 剩余字符串)"""
+    i = 0
+    while i < len(buf) and buf[i] in WHITESPACES:
+        i += 1
+    out = []
+    end = 0
+    while i < len(buf) and buf[i] not in term:
+        c = buf[i]
+        i += 1
+        if c == '\\' and i < len(buf):
+            out.append(buf[i])
+            i += 1
+            end = len(out)
+        elif c == "'":
+            while i < len(buf) and buf[i] != "'":
+                out.append(buf[i])
+                i += 1
+            if i < len(buf):
+                i += 1
+                end = len(out)
+        else:
+            out.append(c)
+    while len(out) > end and out[-1] in WHITESPACES:
+        out.pop()
+    return ''.join(out), buf[i:]
+
+
+def parse_tee(spec):
+    """按tee复用器的规则解析输出列表，返回 [(选项字典, 地址)]"""
+    slaves = []
+    while spec:
+        slave, spec = get_token(spec, '|')
+        spec = spec[1:]
+        options = {}
+        if slave.startswith('['):
+            rest = slave[1:]
+            while True:
+                key, rest = rest.split('=', 1)
+                value, rest = get_token(rest, ':]')
+                options[key] = value
+                closing, rest = rest[0], rest[1:]
+                if closing == ']':
+                    break
+            slave = rest
+        slaves.append((options, slave))
+    return slaves
+
+
+class TeeEscapeTest(unittest.TestCase):
+
+    def round_trip(self, fmt, target, options=None, onfail='abort'):
+        slave = build_tee_slave(fmt, target, options, onfail)
+        parsed = parse_tee(slave)
+        self.assertEqual(len(parsed), 1, slave)
+        return parsed[0]
+
+    def test_plain(self):
+        self.assertEqual(build_tee_slave('matroska', '/videos/rec.mkv'), '[f=matroska:onfail=abort]/videos/rec.mkv')
+        self.assertEqual(self.round_trip('matroska', '/videos/rec.mkv'),
+                         ({'f': 'matroska', 'onfail': 'abort'}, '/videos/rec.mkv'))
+
+    def test_special_characters_in_path(self):
+        paths = [
+            'C:\\Users\\me\\Videos\\rec.mkv',
+            '/videos/[live] a|b:c.mkv',
+            "/videos/it's [1].mkv",
+            '\\\\server\\share\\rec]|[.mkv',
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                self.assertEqual(self.round_trip('matroska', path)[1], path)
+
+    def test_special_characters_in_options(self):
+        options = {
+            'segment_list': 'C:\\videos\\rec [1].segments.csv',
+            'hls_segment_filename': 'D:\\hls\\a:b]|c\\seg_%05d.ts',
+            'movflags': '+frag_keyframe+empty_moov',
+            'quoted': "it's",
+        }
+        parsed_options, target = self.round_trip('segment', 'C:\\videos\\rec_%03d.mkv', options, 'ignore')
+        self.assertEqual(parsed_options, dict({'f': 'segment'}, **options, onfail='ignore'))
+        self.assertEqual(target, 'C:\\videos\\rec_%03d.mkv')
+
+    def test_multiple_slaves(self):
+        slaves = [
+            build_tee_slave('matroska', 'C:\\v\\a|b.mkv', {'reserve_index_space': 1024}),
+            build_tee_slave('mpegts', 'udp://127.0.0.1:1234?pkt_size=1316', onfail='ignore'),
+            build_tee_slave('hls', 'D:\\hls:[x]\\index.m3u8', {'hls_time': 4}, 'ignore'),
+        ]
+        parsed = parse_tee('|'.join(slaves))
+        self.assertEqual([target for _, target in parsed],
+                         ['C:\\v\\a|b.mkv', 'udp://127.0.0.1:1234?pkt_size=1316', 'D:\\hls:[x]\\index.m3u8'])
+        self.assertEqual(parsed[0][0]['reserve_index_space'], '1024')
+        self.assertEqual(parsed[2][0], {'f': 'hls', 'hls_time': '4', 'onfail': 'ignore'})
+
+    def test_escape_tee(self):
+        self.assertEqual(escape_tee('a:b|c', ':'), 'a\\:b|c')
+        self.assertEqual(escape_tee("a\\b'c", ''), "a\\\\b\\'c")
+        self.assertEqual(escape_tee(5, ':'), '5')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,6 +30,29 @@ def get_ffmpeg_path():
         return os.path.abspath(os.path.join(base_dir, '..', 'ffmpeg', 'bin', 'ffmpeg.exe')) 
 
 
+def set_low_priority(pid, io_idle=True):
+    """
+    降低进程的CPU和磁盘IO优先级，避免后台任务与实时录制争抢资源
+
+    Windows使用IDLE优先级，Linux使用nice 19和ionice idle。
+    """
+    import sys
+    import psutil
+    try:
+        process = psutil.Process(pid)
+        if sys.platform == "win32":
+            process.nice(psutil.IDLE_PRIORITY_CLASS)
+            if io_idle and hasattr(psutil, 'IOPRIO_VERYLOW'):
+                process.ionice(psutil.IOPRIO_VERYLOW)
+        else:
+            process.nice(19)
+            if io_idle and hasattr(psutil, 'IOPRIO_CLASS_IDLE'):
+                process.ionice(psutil.IOPRIO_CLASS_IDLE)
+        return True
+    except Exception:
+        return False
+
+
 def validate_live_url(url: str, silent_mode: bool = False) -> tuple:
     """
     验证直播URL的有效性并自动补充http://前缀